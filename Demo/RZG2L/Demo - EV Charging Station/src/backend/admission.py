@@ -0,0 +1,80 @@
+"""
+Admission control for reconnect storms.
+
+After a restart every charge point reconnects at once. Two limits spread
+them out:
+
+* at most ``max_handshakes`` websocket opening handshakes run at the same
+  time; further connections get HTTP 503 with a randomized Retry-After;
+* at most ``boot_rate`` BootNotifications per second (bursts of
+  ``boot_burst``) are accepted; the others are answered with ``overflow``
+  ("Pending" or "Rejected") and a randomized retry interval, after which
+  the charge point sends its BootNotification again.
+
+Retry intervals are drawn between ``retry_min`` and the time needed to
+admit every deferred station at ``boot_rate`` (at most ``retry_max``), so
+the fleet comes back at roughly the admission rate instead of in waves.
+"""
+import os
+import random
+from typing import Set
+
+from inbound_limits import TokenBucket
+
+OVERFLOW_STATUSES = ("Pending", "Rejected")
+
+
+class AdmissionControl:
+    def __init__(self, max_handshakes: int = 100, boot_rate: float = 20.0, boot_burst: int = 50,
+                 overflow: str = "Pending", retry_min: int = 5, retry_max: int = 300):
+        if overflow not in OVERFLOW_STATUSES:
+            raise ValueError(f"Invalid boot overflow status {overflow!r}; "
+                             f"use one of {', '.join(OVERFLOW_STATUSES)}")
+        self.max_handshakes = max_handshakes
+        self.boot_rate = boot_rate
+        self.overflow = overflow
+        self.retry_min = retry_min
+        self.retry_max = max(retry_min, retry_max)
+        self.handshakes = 0
+        self.refused_handshakes = 0
+        self.deferred_boots = 0
+        # Stations told to come back later that have not been accepted yet
+        self.deferred: Set[str] = set()
+        self._boots = TokenBucket(boot_rate, boot_burst)
+
+    @classmethod
+    def from_env(cls) -> "AdmissionControl":
+        # OCPP_MAX_HANDSHAKES=0 and OCPP_BOOT_RATE=0 turn the limits off
+        return cls(max_handshakes=int(os.getenv("OCPP_MAX_HANDSHAKES", "100")),
+                   boot_rate=float(os.getenv("OCPP_BOOT_RATE", "20")),
+                   boot_burst=int(os.getenv("OCPP_BOOT_BURST", "50")),
+                   overflow=os.getenv("OCPP_BOOT_OVERFLOW", "Pending").capitalize(),
+                   retry_min=int(os.getenv("OCPP_BOOT_RETRY_MIN_S", "5")),
+                   retry_max=int(os.getenv("OCPP_BOOT_RETRY_MAX_S", "300")))
+
+    def begin_handshake(self) -> bool:
+        if self.max_handshakes and self.handshakes >= self.max_handshakes:
+            self.refused_handshakes += 1
+            return False
+        self.handshakes += 1
+        return True
+
+    def end_handshake(self):
+        self.handshakes -= 1
+
+    def admit_boot(self, cp_id: str) -> bool:
+        if self._boots.take():
+            self.deferred.discard(cp_id)
+            return True
+        self.deferred.add(cp_id)
+        self.deferred_boots += 1
+        return False
+
+    def forget(self, cp_id: str):
+        """The station disconnected; it no longer waits for admission."""
+        self.deferred.discard(cp_id)
+
+    def retry_interval(self) -> int:
+        backlog = len(self.deferred) / self.boot_rate if self.boot_rate else 0
+        upper = min(self.retry_max, max(2 * self.retry_min, int(backlog)))
+        return random.randint(self.retry_min, upper)
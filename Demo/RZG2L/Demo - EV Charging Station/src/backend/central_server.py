@@ -1,23 +1,71 @@
 import asyncio
+import csv
+import io
+import itertools
 import logging
+import math
+import multiprocessing
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
 from datetime import datetime, timezone
-from typing import Dict
-from websockets.server import serve
+from http import HTTPStatus
+from typing import Dict, List, NamedTuple, Optional
+from websockets.server import WebSocketServerProtocol, serve
+from ocpp.exceptions import GenericError, OCPPError
+from ocpp import messages
 from ocpp.routing import on
 from ocpp.v201 import ChargePoint as cp
 from ocpp.v201 import call_result, call
 from ocpp.v201.enums import Action, ChargingProfileKindType, ChargingProfilePurposeType, ChargingRateUnitType
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from meter_store import MeterStore, decode_cursor, encode_cursor, format_timestamp, parse_timestamp, sample_dict
+from meter_db import MeterDatabase
+from meter_rollups import RESOLUTIONS, MeterRollups
+from event_hub import TOPICS, EventHub
+from workers import ShardRouter
+from metrics import Registry, render
+from inbound_limits import InboundLimits, is_call
+from admission import AdmissionControl
+from liveness import TimerWheel
+from sessions import SessionTracker
+from smart_charging import SiteAllocator
+from command_queue import CommandQueue
+from station_registry import StationRegistry
+from frame_journal import CONNECTED, DISCONNECTED, INBOUND, OUTBOUND, FrameJournal
+from log_setup import RateLimitFilter, dropped_records, first_arg_key, setup_logging
+import fast_json
+import ocpp_validation
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging: handlers write from a background thread. Per-message logs
+# (this module's message_logger and the ocpp library's send/receive lines)
+# are rate limited per station: LOG_RATE records/s after a burst of
+# LOG_BURST, and only every LOG_SAMPLE-th record is considered.
+setup_logging(level=logging.INFO, fmt=logging.BASIC_FORMAT, stream=sys.stderr)
 logger = logging.getLogger(__name__)
+ocpp_logger = logging.getLogger("ocpp")
+message_logger = logging.getLogger("central_server.messages")
+for per_message_logger in (message_logger, ocpp_logger):
+    per_message_logger.addFilter(RateLimitFilter(
+        rate=float(os.getenv("LOG_RATE", "0.2")),
+        burst=int(os.getenv("LOG_BURST", "5")),
+        sample=int(os.getenv("LOG_SAMPLE", "1")),
+        key=first_arg_key))
 
-app = FastAPI()
+# orjson for OCPP frames and REST responses when installed (FAST_JSON=off disables)
+fast_json.install_ocpp_codec()
+# Per-action schema validation: OCPP_VALIDATION="MeterValues=sampled,..."
+validation = ocpp_validation.install()
+app = FastAPI(default_response_class=ORJSONResponse if fast_json.ENABLED else JSONResponse)
 
 class AvailabilityRequest(BaseModel):
     status: str
@@ -28,95 +76,501 @@ class ChargingProfileRequest(BaseModel):
     evse_id: int
     meter_rate_kw: float
 
+class SiteLimitRequest(BaseModel):
+    # 0 turns the site allocator off
+    limit_kw: float = Field(ge=0)
+
+class SiteStationRequest(BaseModel):
+    max_kw: Optional[float] = Field(None, gt=0)
+    priority: Optional[float] = Field(None, gt=0)
+
+# Fan-out limits for the /fleet endpoints
+FLEET_CONCURRENCY = int(os.getenv("FLEET_CONCURRENCY", "50"))
+FLEET_TIMEOUT_S = float(os.getenv("FLEET_TIMEOUT_S", "10"))
+# Default deadline of a command to one station, queueing included
+COMMAND_DEADLINE_S = float(os.getenv("COMMAND_DEADLINE_S", "30"))
+# Duration of the TxProfile sent by change_profile/set_limit
+PROFILE_DURATION_S = 3600
+
+class FleetTarget(BaseModel):
+    # Either an explicit list of stations or a selector over the connected
+    # ones: "all", or a station status such as "Operative"
+    stations: Optional[List[str]] = None
+    selector: Optional[str] = None
+    concurrency: int = Field(FLEET_CONCURRENCY, ge=1, le=1000)
+    timeout: float = Field(FLEET_TIMEOUT_S, gt=0, le=300)
+
+class FleetAvailabilityRequest(AvailabilityRequest, FleetTarget):
+    pass
+
+class FleetChargingProfileRequest(ChargingProfileRequest, FleetTarget):
+    pass
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Listing metadata read by the dashboard
+    expose_headers=["ETag", "X-Total-Count"],
 )
 connected_stations: Dict[str, "ChargePoint"] = {}
-registered_stations: Dict[str, "ChargePoint"] = {}
+# Registrations and connection state, indexed for the admin listings
+registry = StationRegistry()
+
+
+def create_meter_store(id_stride=1, id_offset=0):
+    # Meter history is bounded per station by sample count and by age
+    return MeterStore(
+        max_samples=int(os.getenv("METER_HISTORY_MAX_SAMPLES", "17280")),
+        max_age=float(os.getenv("METER_HISTORY_MAX_AGE_S", "86400")),
+        id_stride=id_stride,
+        id_offset=id_offset,
+    )
+
 
-meter_readings: Dict[str, list] = {}
+meter_store = create_meter_store()
+# Durable meter history; set METER_DB_PATH="" to keep history in memory only
+METER_DB_PATH = os.getenv("METER_DB_PATH", "meter_values.db")
+meter_db = MeterDatabase(
+    METER_DB_PATH,
+    batch_size=int(os.getenv("METER_DB_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("METER_DB_FLUSH_INTERVAL_S", "1.0")),
+    retention=float(os.getenv("METER_DB_RETENTION_S", str(30 * 86400))),
+) if METER_DB_PATH else None
+rollups = MeterRollups()
+# Capture of every OCPP frame for journal_replay.py; empty disables. With
+# several workers each writes "<path>.<worker index>".
+OCPP_JOURNAL_PATH = os.getenv("OCPP_JOURNAL_PATH", "")
+journal: Optional[FrameJournal] = None
+sessions = SessionTracker(history=int(os.getenv("SESSION_HISTORY", "1000")))
+remote_start_ids = itertools.count(1)
+
+# Site smart charging: SITE_LIMIT_KW is shared between charging EVSEs every
+# SITE_REBALANCE_INTERVAL_S (see smart_charging.py); 0 disables it.
+SITE_REBALANCE_INTERVAL_S = float(os.getenv("SITE_REBALANCE_INTERVAL_S", "15"))
+allocator = SiteAllocator(
+    station_max_kw=float(os.getenv("STATION_MAX_KW", "22")),
+    deadband_kw=float(os.getenv("PROFILE_DEADBAND_KW", "0.5")),
+)
+site = {"limit_kw": float(os.getenv("SITE_LIMIT_KW", "0")), "stations": {}, "last_rebalance": None}
+# Per-station inbound call limits: OCPP_INBOUND_RATE/_BURST/_QUEUE/_OVERFLOW
+inbound_limits = InboundLimits.from_env()
+# Reconnect storms: OCPP_MAX_HANDSHAKES, OCPP_BOOT_RATE/_BURST/_OVERFLOW
+admission = AdmissionControl.from_env()
+
+# Heartbeat interval handed out at boot: long enough that the whole fleet
+# sends about HEARTBEAT_TARGET_RATE heartbeats per second, within
+# [HEARTBEAT_MIN_S, HEARTBEAT_MAX_S].
+HEARTBEAT_TARGET_RATE = float(os.getenv("HEARTBEAT_TARGET_RATE", "50"))
+HEARTBEAT_MIN_S = int(os.getenv("HEARTBEAT_MIN_S", "10"))
+HEARTBEAT_MAX_S = int(os.getenv("HEARTBEAT_MAX_S", "3600"))
+# Liveness comes from any frame and from websocket pongs (pings every
+# WS_PING_INTERVAL_S, 0 disables). A station silent for LIVENESS_FACTOR
+# times its expected gap is disconnected.
+WS_PING_INTERVAL_S = float(os.getenv("WS_PING_INTERVAL_S", "20"))
+LIVENESS_FACTOR = float(os.getenv("LIVENESS_FACTOR", "3"))
+liveness = TimerWheel(tick=1.0)
+last_seen: Dict[str, float] = {}
+events = EventHub(max_queue=int(os.getenv("EVENT_SUBSCRIBER_QUEUE", "256")))
 latest_charging_rates = 50
 
+# Number of processes sharing the OCPP and REST ports. Each worker owns the
+# charge points whose websocket the kernel handed to it; see workers.py.
+OCPP_WORKERS = int(os.getenv("OCPP_WORKERS", "1"))
+shard: Optional[ShardRouter] = None
+
+# OCPP_LOOP=thread runs the websocket server (and the meter pipeline it
+# feeds) on a dedicated thread with its own event loop, so slow REST
+# requests can never delay a charge point's heartbeat or call result.
+# OCPP_UVLOOP=1 uses uvloop for that loop when it is installed.
+OCPP_LOOP = os.getenv("OCPP_LOOP", "shared").lower()
+OCPP_UVLOOP = os.getenv("OCPP_UVLOOP", "0").lower() in ("1", "true", "on")
+# Set in OCPP_LOOP=thread mode: the loop owning the websockets and meter
+# state, and the one serving REST (and the event streams).
+ocpp_loop: Optional[asyncio.AbstractEventLoop] = None
+rest_loop: Optional[asyncio.AbstractEventLoop] = None
+
+metrics = Registry()
+inbound_messages = metrics.counter(
+    "ocpp_inbound_messages_total", "OCPP calls received from charge points", ["action"])
+handler_seconds = metrics.histogram(
+    "ocpp_handler_seconds",
+    "Time to handle an OCPP call from a charge point, including validation and the reply",
+    ["action"])
+outbound_call_seconds = metrics.histogram(
+    "ocpp_outbound_call_seconds",
+    "Round trip of calls to charge points, including waiting for the previous call",
+    ["action"])
+outbound_call_failures = metrics.counter(
+    "ocpp_outbound_call_failures_total", "Calls to charge points that raised (timeouts etc.)",
+    ["action"])
+command_wait_seconds = metrics.histogram(
+    "ocpp_command_queue_wait_seconds",
+    "Time commands to charge points waited behind earlier commands to the same station",
+    ["action"])
+skipped_profiles = metrics.counter(
+    "ocpp_skipped_profiles_total",
+    "SetChargingProfile calls not sent because the EVSE already has that limit")
+dead_stations = metrics.counter(
+    "ocpp_dead_stations_total", "Connections closed because the station stopped answering")
+throttled_calls = metrics.counter(
+    "ocpp_throttled_calls_total",
+    "Calls from charge points refused because of the rate limit or a full queue",
+    ["station", "reason"])
+event_loop_lag = metrics.histogram(
+    "event_loop_lag_seconds", "How late a periodic event-loop timer fired", ["loop"])
+
+
+def parse_sampled_value(sv):
+    unit_of_measure = sv.get('unit_of_measure') or {}
+    try:
+        value = float(sv.get('value'))
+    except (TypeError, ValueError):
+        value = float("nan")
+    return (
+        value,
+        sv.get('measurand', 'Unknown'),
+        unit_of_measure.get('unit', 'Unknown'),
+        int(unit_of_measure.get('multiplier', 0)),
+    )
+
+
+async def charge_rate():
+    if shard:
+        return await shard.setting("charge_rate", latest_charging_rates)
+    return latest_charging_rates
+
+
+async def set_charge_rate(value):
+    global latest_charging_rates
+    latest_charging_rates = value
+    if shard:
+        await shard.update_setting("charge_rate", value)
+
+
+async def site_settings():
+    if shard:
+        return await shard.setting("site", site)
+    return site
+
+
+async def update_site_settings(**changes):
+    # Replaced as a whole: nested changes would not reach the other workers
+    global site
+    site = {**await site_settings(), **changes}
+    if shard:
+        await shard.update_setting("site", site)
+
+
+async def on_ocpp_loop(fn, *args):
+    """
+    Call ``fn(*args)`` (a function or coroutine function) where the charge
+    points and meter state live, and return its result. With a dedicated
+    OCPP loop the call is handed over with ``run_coroutine_threadsafe``;
+    otherwise it simply runs here.
+    """
+    async def run():
+        result = fn(*args)
+        return await result if asyncio.iscoroutine(result) else result
+
+    if ocpp_loop is None:
+        return await run()
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(run(), ocpp_loop))
+
+
+def publish_event(topic, cp_id, data):
+    # Subscriber queues belong to the REST loop
+    if rest_loop is not None:
+        rest_loop.call_soon_threadsafe(events.publish, topic, cp_id, data)
+    else:
+        events.publish(topic, cp_id, data)
+
+
+def publish_status(cp_id):
+    if events:
+        publish_event("status", cp_id, {
+            "station": cp_id,
+            "status": registry.status(cp_id),
+            "connected": cp_id in connected_stations
+        })
+
+
+def heartbeat_interval():
+    interval = math.ceil(len(connected_stations) / HEARTBEAT_TARGET_RATE) if HEARTBEAT_TARGET_RATE else 0
+    return min(HEARTBEAT_MAX_S, max(HEARTBEAT_MIN_S, interval))
+
+
+def touch_station(cp_id):
+    """Record a sign of life and push back the station's deadline."""
+    charge_point = connected_stations.get(cp_id)
+    if charge_point is not None:
+        expected_gap = charge_point.heartbeat_interval
+        if WS_PING_INTERVAL_S:
+            expected_gap = min(expected_gap, WS_PING_INTERVAL_S)
+        liveness.touch(cp_id, LIVENESS_FACTOR * expected_gap)
+        last_seen[cp_id] = time.time()
+
+
+def send_buffer_sizes():
+    # Bytes queued in each websocket transport, i.e. written but not yet
+    # accepted by the kernel: grows when a charge point or the network is slow.
+    for charge_point in list(connected_stations.values()):
+        transport = getattr(charge_point._connection, "transport", None)
+        if transport is not None:
+            yield transport.get_write_buffer_size()
+
+
+metrics.gauge("ocpp_connected_stations", "Charge points with an open websocket",
+              function=lambda: len(connected_stations))
+metrics.gauge("ocpp_registered_stations", "Charge points that sent a BootNotification",
+              function=lambda: len(registry))
+metrics.gauge("ocpp_ws_send_buffer_bytes", "Bytes waiting in websocket send buffers",
+              function=lambda: sum(send_buffer_sizes()))
+metrics.gauge("ocpp_ws_send_buffer_max_bytes", "Largest websocket send buffer",
+              function=lambda: max(send_buffer_sizes(), default=0))
+metrics.gauge("event_subscribers", "Open server-sent-event streams",
+              function=lambda: len(events))
+metrics.counter("ocpp_validated_payloads_total", "Payloads checked against the OCPP schema",
+                ["action"], function=lambda: {(a,): n for a, n in list(validation.validated.items())})
+metrics.counter("ocpp_validation_skipped_total", "Payloads not validated because of the policy",
+                ["action"], function=lambda: {(a,): n for a, n in list(validation.skipped.items())})
+metrics.gauge("ocpp_heartbeat_interval_seconds", "Heartbeat interval given to booting stations",
+              function=lambda: heartbeat_interval())
+metrics.gauge("ocpp_handshakes_in_progress", "Websocket opening handshakes in progress",
+              function=lambda: admission.handshakes)
+metrics.counter("ocpp_refused_handshakes_total", "Connections refused with 503 by admission control",
+                function=lambda: admission.refused_handshakes)
+metrics.counter("ocpp_deferred_boots_total", "BootNotifications answered Pending or Rejected",
+                function=lambda: admission.deferred_boots)
+metrics.gauge("ocpp_deferred_stations", "Stations told to retry their BootNotification",
+              function=lambda: len(admission.deferred))
+metrics.gauge("ocpp_queued_commands", "Commands waiting for an earlier command to the same station",
+              function=lambda: sum(len(c.commands) for c in list(connected_stations.values())))
+metrics.counter("ocpp_journal_frames_total", "Frames written to the OCPP frame journal",
+                function=lambda: journal.recorded if journal else 0)
+metrics.counter("ocpp_journal_dropped_frames_total", "Frames not journaled because the file is full",
+                function=lambda: journal.dropped if journal else 0)
+metrics.counter("meter_db_dropped_samples_total", "Samples dropped because the database queue was full",
+                function=lambda: meter_db.dropped if meter_db else 0)
+metrics.gauge("meter_rollup_series", "Station/EVSE/measurand series with rolling aggregates",
+              function=lambda: len(rollups))
+metrics.counter("log_dropped_records_total", "Log records dropped because the log queue was full",
+                function=dropped_records)
+
+
+def command_coalesce_key(action, body):
+    # A newer profile or availability change for the same EVSE makes a
+    # queued one pointless; start and stop must all run, in order.
+    if action in ("change_profile", "set_limit"):
+        return action, body["evse_id"]
+    if action == "availability":
+        return action, body["evse_id"], body["connector_id"]
+    return None
+
+
+class AcceptedProfile(NamedTuple):
+    limit_kw: float
+    # The TxProfile only applies to this transaction, until it expires
+    transaction_id: str
+    expires: float
+
 
 class ChargePoint(cp):
+    heartbeat_interval = HEARTBEAT_MIN_S
+
+    def __init__(self, id, connection, response_timeout=30):
+        super().__init__(id, connection, response_timeout)
+        # Commands from the REST API, one at a time (see command_queue.py)
+        self.commands = CommandQueue(
+            self.run_command, coalesce_key=command_coalesce_key,
+            observe_wait=lambda action, wait: command_wait_seconds.observe(wait, action))
+        # Profile last accepted by each EVSE, to skip identical ones
+        self.profiles: Dict[int, AcceptedProfile] = {}
+
+    async def run_command(self, action, body):
+        try:
+            return await STATION_COMMANDS[action](self, body)
+        except Exception as e:
+            logger.error(f"Error running {action} for {self.id}: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def start(self):
+        # Calls wait in a bounded queue for their handler while responses to
+        # our own calls are routed straight away; a station over its rate or
+        # queue limit only delays itself.
+        self._inbound = asyncio.Queue(inbound_limits.queue_size)
+        self._inbound_bucket = inbound_limits.bucket()
+        processor = asyncio.create_task(self._process_calls())
+        try:
+            while True:
+                frame = await self._connection.recv()
+                ocpp_logger.info("%s: receive message %s", self.id, frame)
+                if journal:
+                    journal.record(self.id, INBOUND, frame)
+                touch_station(self.id)
+                if not is_call(frame):
+                    await self.route_message(frame)
+                elif not self._inbound_bucket.take():
+                    await self._throttle(frame, "rate")
+                else:
+                    try:
+                        self._inbound.put_nowait(frame)
+                    except asyncio.QueueFull:
+                        await self._throttle(frame, "queue")
+        finally:
+            processor.cancel()
+
+    async def _process_calls(self):
+        while True:
+            frame = await self._inbound.get()
+            try:
+                await self.route_message(frame)
+            except Exception as e:
+                # As before the queue: a failing handler ends the connection
+                logger.error(f"Error handling call from {self.id}: {e}")
+                await self._connection.close()
+                return
+
+    async def _throttle(self, frame, reason):
+        throttled_calls.inc(self.id, reason)
+        message_logger.info("Throttled call from %s (%s limit)", self.id, reason)
+        if inbound_limits.overflow == "drop":
+            return
+        try:
+            msg = messages.unpack(frame)
+        except OCPPError:
+            return
+        if isinstance(msg, messages.Call):
+            await self._send(msg.create_call_error(
+                GenericError(f"Too many calls from {self.id} ({reason} limit)")).to_json())
+
+    async def _send(self, message):
+        if journal:
+            journal.record(self.id, OUTBOUND, message)
+        await super()._send(message)
+
+    async def _handle_call(self, msg):
+        inbound_messages.inc(msg.action)
+        started = time.perf_counter()
+        try:
+            await super()._handle_call(msg)
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, msg.action)
+
+    async def call(self, payload, suppress=True):
+        action = payload.__class__.__name__[:-7]
+        started = time.perf_counter()
+        try:
+            return await super().call(payload, suppress)
+        except Exception:
+            outbound_call_failures.inc(action)
+            raise
+        finally:
+            outbound_call_seconds.observe(time.perf_counter() - started, action)
+
     @on(Action.BootNotification)
     def on_boot_notification(self, charging_station, reason, **kwargs):
+        if not admission.admit_boot(self.id):
+            interval = admission.retry_interval()
+            message_logger.info("BootNotification from %s deferred: %s, retry in %ds",
+                                self.id, admission.overflow, interval)
+            return call_result.BootNotificationPayload(
+                current_time=datetime.now(timezone.utc).isoformat(),
+                interval=interval,
+                status=admission.overflow
+            )
         logger.info(f"BootNotification received from {self.id}")
         logger.info(f"Charging Station: {charging_station}")
         logger.info(f"Reason: {reason}")
-        print("Currretn registered state", registered_stations)
         connected_stations[self.id] = self
+        registry.connect(self.id)
+        if shard:
+            shard.claim(self.id)
         # if current_status == "Inoperative":
         #     logger.warning(f"Charger {self.id} rejected due to non-operative state")
         #     return call_result.BootNotificationPayload(
         #         current_time=datetime.now(timezone.utc).isoformat(),
         #         interval=10,
         #         status="Rejected")
-        registered_stations[self.id] = {
-            "id": self.id,
-            "charging_station": charging_station,
-            "reason": reason,
-            "status": "Operative"
-            }
+        registry.register(self.id, charging_station, reason)
+        publish_status(self.id)
+        self.heartbeat_interval = heartbeat_interval()
+        touch_station(self.id)
         return call_result.BootNotificationPayload(
             current_time=datetime.now(timezone.utc).isoformat(),
-            interval=10,
+            interval=self.heartbeat_interval,
             status="Accepted"
         )
 
     @on(Action.Heartbeat)
     def on_heartbeat(self, **kwargs):
-        logger.info(f"Heartbeat received from {self.id}")
+        message_logger.info("Heartbeat received from %s", self.id)
         return call_result.HeartbeatPayload(
             current_time=datetime.now(timezone.utc).isoformat()
         )
 
     @on(Action.MeterValues)
     async def on_meter_values(self, evse_id, meter_value, **kwargs):
-        logger.info(f" Meter Values received from {self.id}")
-        logger.info(f"EVSE ID: {evse_id}")
-        logger.info(f"Raw meter_value: {meter_value}")
+        message_logger.debug("Raw meter_value from %s (EVSE %s): %s", self.id, evse_id, meter_value)
         
         try:
-            # Initialize meter readings for this charge point if not exists
-            if self.id not in meter_readings:
-                meter_readings[self.id] = []
-            
             # Process each meter value in the array
             for mv in meter_value:
-                logger.info(f"Processing meter value: {mv}")
-                
-                meter_reading = {
-                    "evse_id": evse_id,
-                    "timestamp": mv.get('timestamp', datetime.now(timezone.utc).isoformat()),
-                    "sampled_values": []
-                }
-                
-                sampled_values = mv.get('sampled_value', [])
-                for sv in sampled_values:
-                    sampled_value_data = {
-                        "value": sv.get('value', 'N/A'),
-                        "measurand": sv.get('measurand', 'Unknown'),
-                        "unit": sv.get('unit_of_measure', {}).get('unit', 'Unknown') if sv.get('unit_of_measure') else 'Unknown',
-                        "multiplier": sv.get('unit_of_measure', {}).get('multiplier', 0) if sv.get('unit_of_measure') else 0
-                    }
-                    meter_reading["sampled_values"].append(sampled_value_data)
-                    logger.info(f" Sampled Value: {sampled_value_data}")
-                
-                meter_readings[self.id].append(meter_reading)
-            
-            logger.info(f"Successfully stored {len(meter_value)} meter values for {self.id}")
+                samples = [parse_sampled_value(sv) for sv in mv.get('sampled_value', [])]
+                timestamp = parse_timestamp(mv.get('timestamp', datetime.now(timezone.utc).isoformat()))
+                reading_id = meter_store.append(self.id, evse_id, timestamp, samples)
+                rollups.add(self.id, evse_id, timestamp, samples)
+                sessions.add(self.id, evse_id, timestamp, samples)
+                if meter_db:
+                    meter_db.enqueue(self.id, evse_id, timestamp, samples, reading_id)
+                if events:
+                    publish_event("meter", self.id, {
+                        "station": self.id,
+                        "cursor": encode_cursor(reading_id),
+                        "evse_id": evse_id,
+                        "timestamp": format_timestamp(timestamp),
+                        "sampled_values": [sample_dict(*sample) for sample in samples]
+                    })
+
+            message_logger.info("Stored meter values from %s: %d readings, EVSE %s",
+                                self.id, len(meter_value), evse_id)
             
         except Exception as e:
-            logger.error(f" Error processing meter values from {self.id}: {e}")
-            logger.error(f" Raw data: evse_id={evse_id}, meter_value={meter_value}")
+            logger.error("Error processing meter values from %s: %s", self.id, e)
+            logger.error("Raw data: evse_id=%s, meter_value=%s", evse_id, meter_value)
         
         return call_result.MeterValuesPayload()
 
+    @on(Action.TransactionEvent)
+    def on_transaction_event(self, event_type, timestamp, transaction_info, evse=None,
+                             meter_value=None, **kwargs):
+        # Stations that report transactions themselves: their transaction id
+        # replaces the one we made up when starting it remotely.
+        transaction_id = transaction_info["transaction_id"]
+        evse_id = (evse or {}).get("id", 1)
+        session = sessions.transaction(self.id, transaction_id)
+        if session is None:
+            session = sessions.active(self.id, evse_id)
+            if session is not None and session.remote_start_id is not None and \
+                    session.remote_start_id == transaction_info.get("remote_start_id"):
+                sessions.rename(session, transaction_id)
+            elif event_type != "Ended":
+                # Ends a session of another transaction still open on the EVSE
+                session = sessions.start(self.id, evse_id, transaction_id, parse_timestamp(timestamp))
+        if session is not None:
+            for mv in meter_value or []:
+                samples = [parse_sampled_value(sv) for sv in mv.get('sampled_value', [])]
+                session.add(parse_timestamp(mv['timestamp']), samples,
+                            started=event_type == "Started")
+            if event_type == "Ended":
+                sessions.end(session, parse_timestamp(timestamp))
+        if event_type in ("Started", "Ended"):
+            # A profile of the previous transaction does not carry over
+            self.profiles.pop(evse_id, None)
+        return call_result.TransactionEventPayload()
+
 
 # WebSocket handler for OCPP
 async def on_connect(websocket, path):
@@ -125,183 +579,1158 @@ async def on_connect(websocket, path):
 
     charge_point = ChargePoint(cp_id, websocket)
     connected_stations[cp_id] = charge_point
+    registry.connect(cp_id)
+    if shard:
+        shard.claim(cp_id)
+    websocket.station_id = cp_id
+    touch_station(cp_id)
+    if journal:
+        journal.record(cp_id, CONNECTED)
 
     try:
         await charge_point.start()
     except Exception as e:
         logger.error(f"Error handling charge point {cp_id}: {e}")
     finally:
-        connected_stations.pop(cp_id, None)
-        registered_stations[cp_id]["status"] = "Inoperative"
+        if journal:
+            journal.record(cp_id, DISCONNECTED)
+        charge_point.commands.close({"status": "station disconnected"})
+        if connected_stations.get(cp_id) is charge_point:
+            connected_stations.pop(cp_id, None)
+            registry.disconnect(cp_id)
+            liveness.remove(cp_id)
+            if shard:
+                shard.release(cp_id)
+        admission.forget(cp_id)
+        registry.set_status(cp_id, "Inoperative")
+        publish_status(cp_id)
         logger.info(f"Charge point {cp_id} disconnected")
 
 
+class ChargePointProtocol(WebSocketServerProtocol):
+    """
+    Answers 503 while too many opening handshakes are in progress, and
+    counts keepalive pongs as a sign of life of the station.
+    """
+    station_id = None
+
+    async def handshake(self, *args, **kwargs):
+        self.admitted = admission.begin_handshake()
+        try:
+            return await super().handshake(*args, **kwargs)
+        finally:
+            if self.admitted:
+                admission.end_handshake()
+
+    async def process_request(self, path, request_headers):
+        if not self.admitted:
+            return (HTTPStatus.SERVICE_UNAVAILABLE,
+                    [("Retry-After", str(admission.retry_interval()))],
+                    b"Too many charge points connecting, retry later\n")
+        return await super().process_request(path, request_headers)
+
+    async def ping(self, data=None):
+        waiter = await super().ping(data)
+        if self.station_id is not None:
+            waiter.add_done_callback(self.pong_received)
+        return waiter
+
+    def pong_received(self, waiter):
+        if not waiter.cancelled() and waiter.exception() is None:
+            touch_station(self.station_id)
+
+
+async def close_dead_stations():
+    """Disconnect stations whose liveness deadline passed."""
+    while True:
+        await asyncio.sleep(liveness.tick)
+        for cp_id in liveness.advance():
+            charge_point = connected_stations.get(cp_id)
+            if charge_point is None:
+                continue
+            logger.warning("No sign of life from %s for %.0fs; closing its connection",
+                           cp_id, time.time() - last_seen.get(cp_id, 0))
+            dead_stations.inc()
+            charge_point._connection.fail_connection(1011, "liveness timeout")
+
+
 async def start_websocket_server():
     logger.info("Starting OCPP WebSocket server on ws://0.0.0.0:9000")
-    async with serve(on_connect, "0.0.0.0", 9000, subprotocols=["ocpp2.0.1"]):
+    # With several workers every process listens on the same port and the
+    # kernel balances new connections between them.
+    # Missing pongs are handled by close_dead_stations, not by websockets
+    async with serve(on_connect, "0.0.0.0", 9000, subprotocols=["ocpp2.0.1"],
+                     create_protocol=ChargePointProtocol, reuse_port=bool(shard),
+                     ping_interval=WS_PING_INTERVAL_S or None, ping_timeout=None):
         await asyncio.Future()
 
 
-@app.get("/stations")
-async def list_stations():
-    return {"stations": list(connected_stations.keys())}
+# Commands sent to a charge point. They run in the worker that holds the
+# station's websocket; ``body`` is the JSON request body as a dict.
 
+async def command_start(cp, body):
+    remote_start_id = next(remote_start_ids)
+    evse_id = body.get("evse_id", 1)
+    request = call.RequestStartTransactionPayload(
+        id_token={"id_token": "TEST1234", "type": "ISO14443"},
+        remote_start_id=remote_start_id,
+        evse_id=evse_id
+    )
+    response = await cp.call(request)
+    if response is None:
+        return {"status": "no response from charge point"}
+    if response.status == "Accepted":
+        # A profile of the previous transaction does not carry over
+        cp.profiles.pop(evse_id, None)
+        # The station may report its own transaction id later (TransactionEvent)
+        session = sessions.start(cp.id, evse_id, response.transaction_id or str(uuid.uuid4()),
+                                 remote_start_id=remote_start_id)
+        return {"status": response.status, "transaction_id": session.transaction_id}
+    return {"status": response.status}
 
-@app.post("/stations/{cp_id}/start")
-async def start_charging(cp_id: str):
-    if cp_id in connected_stations:
-        cp = connected_stations[cp_id]
+
+async def command_stop(cp, body):
+    session = sessions.active(cp.id, body.get("evse_id"))
+    # Without a tracked session (e.g. started before a restart) fall back to
+    # the id the demo charge point has always been sent.
+    request = call.RequestStopTransactionPayload(
+        transaction_id=session.transaction_id if session else "1"
+    )
+    response = await cp.call(request)
+    if response is None:
+        return {"status": "no response from charge point"}
+    if response.status == "Accepted":
+        if session is not None:
+            cp.profiles.pop(session.evse_id, None)
+        else:
+            cp.profiles.clear()
+    if response.status == "Accepted" and session is not None:
+        return {"status": response.status, "session": sessions.end(session).to_dict()}
+    return {"status": response.status}
+
+
+async def command_availability(cp, body):
+    request = call.ChangeAvailabilityPayload(
+            operational_status=body["status"], # "Operative" or "Inoperative
+            evse = {"id": body["evse_id"],
+                "connectorId": body["connector_id"]
+                })
+    response = await cp.call(request)
+    if response is None:
+            return {"status": "no response from charge point"}
+    if body["status"] in ("Operative", "Inoperative") and response.status == "Accepted":
+        registry.set_status(cp.id, body["status"])
+        publish_status(cp.id)
+    return {"status": response.status}
+
+
+async def command_change_profile(cp, body):
+    await set_charge_rate(body["meter_rate_kw"])
+    return await send_charging_profile(cp, body["evse_id"], body["meter_rate_kw"])
+
+
+async def command_set_limit(cp, body):
+    # From the site allocator: leaves the global charge rate alone. The
+    # allocator keeps track of its own pushes (deadband, new sessions).
+    return await send_charging_profile(cp, body["evse_id"], body["limit_kw"], force=True)
+
+
+def profile_unchanged(cp, evse_id, limit_kw):
+    """Whether the EVSE's running transaction already has this limit."""
+    accepted = cp.profiles.get(evse_id)
+    if accepted is None or accepted.limit_kw != limit_kw or accepted.expires <= time.monotonic():
+        return False
+    session = sessions.active(cp.id, evse_id)
+    return session is not None and session.transaction_id == accepted.transaction_id
+
+
+async def send_charging_profile(cp, evse_id, limit_kw, force=False):
+    if not force and profile_unchanged(cp, evse_id, limit_kw):
+        skipped_profiles.inc()
+        return {"status": "Accepted", "unchanged": True}
+    charging_profile = {"id": 1, 
+                        "stackLevel": 0,
+                        "chargingProfilePurpose": ChargingProfilePurposeType.tx_profile,
+                        "chargingProfileKind": ChargingProfileKindType.absolute,
+                        "chargingSchedule": [{
+                            "id": 1, # schedule ID
+                            "duration": PROFILE_DURATION_S, # seconds
+            "chargingRateUnit": ChargingRateUnitType.watts, 
+            "chargingSchedulePeriod": [{
+                 "startPeriod": 0, # start immediately
+                 "limit": limit_kw * 1000, # kW → W
+                 "numberPhases": 3
+                 }]}]}
+    # Request payload
+    request = call.SetChargingProfilePayload(
+        evse_id=evse_id,
+        charging_profile=charging_profile)
+    # Unknown until the station answers (the call may also time out)
+    cp.profiles.pop(evse_id, None)
+    sent = time.monotonic()
+    response = await cp.call(request)
+    if response is None:
+        return {"status": "no response from charge point"}
+    session = sessions.active(cp.id, evse_id)
+    if response.status == "Accepted" and session is not None:
+        cp.profiles[evse_id] = AcceptedProfile(limit_kw, session.transaction_id,
+                                               sent + PROFILE_DURATION_S)
+    return {"status": response.status}
+
+
+STATION_COMMANDS = {
+    "start": command_start,
+    "stop": command_stop,
+    "availability": command_availability,
+    "change_profile": command_change_profile,
+    "set_limit": command_set_limit,
+}
+
+
+async def queue_command(cp, action, body, timeout):
+    return await cp.commands.submit(action, body, timeout)
+
+
+async def run_station_command(action, cp_id, body=None, forward=True, timeout=None):
+    """
+    Run a command on a charge point, forwarding it to the owning worker.
+    It waits in the station's command queue; ``timeout`` (default
+    COMMAND_DEADLINE_S) is its deadline, queueing included.
+    """
+    result = await dispatch_station_command(action, cp_id, body, forward, timeout)
+    if forward and action in ("change_profile", "set_limit"):
+        # Whatever the allocator pushed may have been replaced: compare its
+        # next plan with no push at all (it records its own pushes again
+        # once this returns)
+        await forget_site_push(cp_id, (body or {}).get("evse_id"))
+    return result
+
+
+async def dispatch_station_command(action, cp_id, body, forward, timeout):
+    timeout = timeout or COMMAND_DEADLINE_S
+    cp = connected_stations.get(cp_id)
+    if cp is not None:
+        return await on_ocpp_loop(queue_command, cp, action, body or {}, timeout)
+    owner = await shard.owner(cp_id) if shard else None
+    if forward and owner is not None and owner != shard.index:
         try:
-            request = call.RequestStartTransactionPayload(
-                id_token={"id_token": "TEST1234", "type": "ISO14443"},
-                remote_start_id=1,
-                evse_id=1
-            )
-            response = await cp.call(request)
-            return {"status": response.status}
-        except Exception as e:
-            logger.error(f"Error starting charging for {cp_id}: {e}")
+            return await shard.request(owner, {
+                "op": "command", "action": action, "cp_id": cp_id, "body": body,
+                "timeout": timeout})
+        except (OSError, ValueError) as e:
+            logger.error(f"Error forwarding {action} for {cp_id} to worker {owner}: {e}")
             return {"status": "error", "message": str(e)}
     return {"status": "station not connected"}
 
 
-@app.post("/stations/{cp_id}/stop")
-async def stop_charging(cp_id: str):
-    if cp_id in connected_stations:
-        cp = connected_stations[cp_id]
+async def forget_site_push(cp_id, evse_id=None):
+    # The allocator runs in worker 0
+    if shard and shard.index != 0:
         try:
-            request = call.RequestStopTransactionPayload(
-                transaction_id="1"
-            )
-            response = await cp.call(request)
-            return {"status": response.status}
-        except Exception as e:
-            logger.error(f"Error stopping charging for {cp_id}: {e}")
-            return {"status": "error", "message": str(e)}
-    return {"status": "station not connected"}
+            await shard.request(0, {"op": "forget_push", "cp_id": cp_id, "evse_id": evse_id})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Worker 0 did not answer forget_push for {cp_id}: {e}")
+    else:
+        allocator.forget(cp_id, evse_id)
+
+
+async def peer_owner(cp_id):
+    """Index of the other worker holding this station's connection, if any."""
+    if shard and cp_id not in connected_stations:
+        owner = await shard.owner(cp_id)
+        if owner is not None and owner != shard.index:
+            return owner
+    return None
+
+
+def local_station_listing(filters=None, registered=True):
+    """Connected station ids and the registered stations matching ``filters``."""
+    return {
+        "connected": registry.connected,
+        "registered": registry.select(**(filters or {})) if registered else [],
+    }
+
+
+async def station_listings(filters=None, registered=True):
+    """Station listings of this worker followed by those of its peers."""
+    listings = [await on_ocpp_loop(local_station_listing, filters, registered)]
+    if shard:
+        listings += await shard.broadcast({"op": "stations", "filters": filters,
+                                           "registered": registered})
+    return listings
+
+
+async def registry_etag():
+    """ETag of the station listings: changes with any worker's registry."""
+    etags = [await on_ocpp_loop(lambda: registry.etag)]
+    if shard:
+        etags += [response["etag"] for response in await shard.broadcast({"op": "registry_etag"})]
+    # Sorted: the same whichever worker answers
+    return '"' + "-".join(sorted(etags)) + '"'
+
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+def station_filters(**filters):
+    return {field: value for field, value in filters.items() if value is not None}
+
+
+def paginate_listing(response: Response, items, offset, limit, etag):
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(len(items))
+    return items[offset:offset + limit if limit is not None else None]
+
+
+@app.get("/stations")
+async def list_stations(
+    request: Request, response: Response,
+    status: Optional[str] = None, model: Optional[str] = None, vendor: Optional[str] = None,
+    offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1, le=10000),
+):
+    """
+    Connected stations, sorted by id. status, model and vendor only match
+    stations that sent a BootNotification. X-Total-Count has the number of
+    matches; the ETag answers an unchanged listing with 304.
+    """
+    etag = await registry_etag()
+    if etag_matches(request, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+    filters = station_filters(status=status, model=model, vendor=vendor)
+    if filters:
+        stations = {info["id"] for listing in await station_listings({**filters, "connected": True})
+                    for info in listing["registered"]}
+    else:
+        stations = {cp_id for listing in await station_listings(registered=False)
+                    for cp_id in listing["connected"]}
+    return {"stations": paginate_listing(response, sorted(stations), offset, limit, etag),
+            "total": len(stations)}
+
+
+def deregister_station(cp_id):
+    if cp_id in connected_stations:
+        return False
+    rollups.remove(cp_id)
+    return registry.remove(cp_id)
+
+
+@app.delete("/stations/{cp_id}")
+async def delete_station(cp_id: str):
+    """
+    Forget a disconnected station: its registration and its meter rollups.
+    Meter history stays until retention removes it.
+    """
+    if cp_id in connected_stations or await peer_owner(cp_id) is not None:
+        return {"status": "error", "message": "station is connected"}
+    removed = await on_ocpp_loop(deregister_station, cp_id)
+    if shard:
+        removed = any([removed] + [response["removed"] for response in
+                                   await shard.broadcast({"op": "deregister", "cp_id": cp_id})])
+    return {"status": "success" if removed else "station not registered", "station": cp_id}
+
+
+@app.post("/stations/{cp_id}/start")
+async def start_charging(cp_id: str, evse_id: int = Query(1, ge=1)):
+    return await run_station_command("start", cp_id, {"evse_id": evse_id})
+
+
+@app.post("/stations/{cp_id}/stop")
+async def stop_charging(cp_id: str, evse_id: Optional[int] = Query(None, ge=1)):
+    """Stop the transaction on ``evse_id``, or on any EVSE of the station."""
+    return await run_station_command("stop", cp_id, {"evse_id": evse_id})
+
+
+def command_queues(cp_id=None):
+    """Queue state of one connected station, or of every station with commands pending."""
+    if cp_id is not None:
+        charge_point = connected_stations.get(cp_id)
+        return [{"station": cp_id, **charge_point.commands.snapshot()}] if charge_point else []
+    return [{"station": station, **charge_point.commands.snapshot()}
+            for station, charge_point in list(connected_stations.items())
+            if len(charge_point.commands) or charge_point.commands.running]
+
+
+async def cluster_command_queues(cp_id=None):
+    queues = await on_ocpp_loop(command_queues, cp_id)
+    if shard:
+        for response in await shard.broadcast({"op": "command_queues", "cp_id": cp_id}):
+            queues += response["queues"]
+    return queues
+
+
+@app.get("/commands")
+async def list_command_queues():
+    """Stations with commands queued or running: depth, wait times and totals."""
+    queues = await cluster_command_queues()
+    queues.sort(key=lambda queue: queue["oldest_wait_s"], reverse=True)
+    return {"queued": sum(queue["depth"] for queue in queues), "stations": queues}
+
+
+@app.get("/stations/{cp_id}/commands")
+async def station_command_queue(cp_id: str):
+    queues = await cluster_command_queues(cp_id)
+    if not queues:
+        return {"status": "station not connected"}
+    return queues[0]
+
+
+async def select_stations(target: FleetTarget):
+    if target.stations is not None:
+        return list(dict.fromkeys(target.stations))
+    if not target.selector:
+        raise ValueError("either stations or selector is required")
+    stations = {}
+    for listing in await station_listings():
+        status = {info["id"]: info.get("status") for info in listing["registered"]}
+        for cp_id in listing["connected"]:
+            if target.selector == "all" or status.get(cp_id, "Operative") == target.selector:
+                stations[cp_id] = None
+    return list(stations)
+
+
+async def run_fleet_command(action, target: FleetTarget, body=None):
+    """
+    Run one command on many stations concurrently. At most
+    ``target.concurrency`` calls are in flight and each station gets
+    ``target.timeout`` seconds; the result is keyed by station.
+    """
+    try:
+        stations = await select_stations(target)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    semaphore = asyncio.Semaphore(target.concurrency)
+
+    async def run(cp_id):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    run_station_command(action, cp_id, body, timeout=target.timeout),
+                    target.timeout)
+            except asyncio.TimeoutError:
+                return {"status": "timeout"}
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run(cp_id) for cp_id in stations))
+    return {
+        "action": action,
+        "requested": len(stations),
+        "accepted": sum(1 for result in results if result.get("status") == "Accepted"),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": dict(zip(stations, results)),
+    }
+
+
+def command_body(request: BaseModel, fields):
+    return request.model_dump(include=set(fields))
+
+
+@app.post("/fleet/start")
+async def fleet_start(target: FleetTarget):
+    return await run_fleet_command("start", target)
+
+
+@app.post("/fleet/stop")
+async def fleet_stop(target: FleetTarget):
+    return await run_fleet_command("stop", target)
+
+
+@app.post("/fleet/availability")
+async def fleet_availability(req: FleetAvailabilityRequest):
+    return await run_fleet_command(
+        "availability", req, command_body(req, AvailabilityRequest.model_fields))
+
+
+@app.post("/fleet/change_profile")
+async def fleet_change_profile(req: FleetChargingProfileRequest):
+    return await run_fleet_command(
+        "change_profile", req, command_body(req, ChargingProfileRequest.model_fields))
+
+
+async def meter_page(cp_id, after=0, start=None, end=None, limit=None):
+    if meter_db:
+        return await on_ocpp_loop(meter_db.page, cp_id, after, start, end, limit)
+    return await on_ocpp_loop(meter_store.page, cp_id, after, start, end, limit)
+
+
+async def meter_columnar_page(cp_id, after=0, start=None, end=None, limit=None):
+    if meter_db:
+        return await on_ocpp_loop(meter_db.columnar_page, cp_id, after, start, end, limit)
+    return await on_ocpp_loop(meter_store.columnar_page, cp_id, after, start, end, limit)
+
+
+async def meter_stations():
+    if meter_db:
+        return await on_ocpp_loop(meter_db.stations)
+    return await on_ocpp_loop(meter_store.stations)
+
+
+async def has_meter_data(cp_id):
+    if meter_db:
+        return await on_ocpp_loop(meter_db.has_station, cp_id)
+    return await on_ocpp_loop(meter_store.__contains__, cp_id)
+
+
+def parse_time_param(value):
+    """Accept epoch seconds or an ISO 8601 timestamp from a query parameter."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    text = value[:-1] + "+00:00" if value.endswith("Z") else value
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+METER_HISTORY_FORMATS = ("readings", "columnar")
 
 
 @app.get("/stations/{cp_id}/meter-history")
-async def get_meter_history(cp_id: str):
+async def get_meter_history(
+    cp_id: str,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    format_: str = Query("readings", alias="format"),
+):
+    """
+    Readings for a station, oldest first.
+
+    ``from``/``to`` bound the sample timestamp (epoch seconds or ISO 8601).
+    With ``limit`` the response carries ``next_cursor`` while more readings
+    follow; pass it back as ``cursor`` to get the next page. ``latest_cursor``
+    marks the newest reading returned: poll with ``since=<latest_cursor>`` to
+    receive only readings that arrived after it.
+
+    ``format=columnar`` returns ``series`` instead of ``readings``: one per
+    EVSE, measurand, unit and multiplier, with parallel ``timestamps``
+    (epoch seconds) and ``values`` arrays. Cursors and limits still count
+    readings.
+    """
     logger.info(f"Requesting meter history for {cp_id}")
-    logger.info(f"Available stations with meter data: {list(meter_readings.keys())}")
-    
-    if cp_id in meter_readings:
+    if format_ not in METER_HISTORY_FORMATS:
+        return {"status": "error", "message": f"format must be one of {list(METER_HISTORY_FORMATS)}"}
+    try:
+        token = cursor or since
+        after = decode_cursor(token) if token else 0
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    owner = await peer_owner(cp_id)
+    if owner is not None:
+        # The owning worker has the newest readings, including any its
+        # database writer has not committed yet.
+        try:
+            return await shard.request(owner, {
+                "op": "meter_history", "cp_id": cp_id, "after": after, "token": token,
+                "start": start, "end": end, "limit": limit, "format": format_})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Worker {owner} did not answer meter history for {cp_id}: {e}")
+    return await meter_history(cp_id, after, token, start, end, limit, format_)
+
+
+async def meter_history(cp_id, after, token, start, end, limit, format_="readings"):
+    if format_ == "columnar":
+        series, count, last_id, has_more = await meter_columnar_page(cp_id, after, start, end, limit)
+        body = {"station": cp_id, "format": "columnar", "series": series}
+    else:
+        readings, last_id, has_more = await meter_page(cp_id, after, start, end, limit)
+        count = len(readings)
+        body = {"station": cp_id, "readings": readings}
+    known = count or after or await has_meter_data(cp_id)
+
+    if known:
         return {
-            "station": cp_id, 
-            "readings": meter_readings[cp_id],
-            "total_readings": len(meter_readings[cp_id])
+            **body,
+            "total_readings": count,
+            "next_cursor": encode_cursor(last_id) if has_more else None,
+            "latest_cursor": encode_cursor(last_id) if last_id else token
         }
     else:
         return {
             "status": "no meter readings found", 
             "station": cp_id,
-            "connected": cp_id in connected_stations,
-            "available_stations": list(meter_readings.keys())
+            "connected": cp_id in connected_stations or (await peer_owner(cp_id)) is not None,
+            "available_stations": await meter_stations()
         }
 
-@app.post("/stations/{cp_id}/availability")
-async def change_availability(cp_id: str, payload: AvailabilityRequest):
-    # print("SSSSSSS----",connected_stations)
-    global connected_stations, registered_stations
+@app.get("/stations/{cp_id}/meter-rollups")
+async def get_meter_rollups(
+    cp_id: str,
+    resolution: str = "1m",
+    measurand: Optional[str] = None,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+):
+    """Aggregated meter values per bucket (resolution: 1m, 15m or 1h)."""
+    if resolution not in RESOLUTIONS:
+        return {"status": "error", "message": f"resolution must be one of {list(RESOLUTIONS)}"}
     try:
-        cp = connected_stations[cp_id]
-        request = call.ChangeAvailabilityPayload(
-                operational_status=payload.status, # "Operative" or "Inoperative
-                evse = {"id": payload.evse_id,
-                    "connectorId": payload.connector_id
-                    })
-        response = await cp.call(request)
-        if response is None:
-                return {"status": "no response from charge point"}
-        if payload.status == "Inoperative" and response.status == "Accepted": 
-                #connected_stations.pop(cp_id, None)
-                registered_stations[cp_id]["status"] = "Inoperative"
-                return {"status": response.status}
-        elif payload.status == "Operative" and response.status == "Accepted":
-            registered_stations[cp_id]["status"] = "Operative"
-            return {"status": response.status}
-    
-    except Exception as e:
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
         return {"status": "error", "message": str(e)}
+    return {
+        "station": cp_id,
+        "resolution": resolution,
+        "series": await station_rollups(cp_id, resolution, measurand, start, end)
+    }
+
+
+async def station_rollups(cp_id, resolution, measurand, start, end):
+    # Rollups live in the memory of the worker that received the samples:
+    # the current owner, or for a disconnected station whichever worker had it.
+    request = {"op": "rollups", "cp_id": cp_id, "resolution": resolution,
+               "measurand": measurand, "start": start, "end": end}
+    owner = await peer_owner(cp_id)
+    if owner is not None:
+        try:
+            return (await shard.request(owner, request))["series"]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Worker {owner} did not answer rollups for {cp_id}: {e}")
+            return []
+    series = await on_ocpp_loop(rollups.query, cp_id, resolution, measurand, start, end)
+    if not series and shard and cp_id not in connected_stations:
+        for response in await shard.broadcast(request):
+            if response["series"]:
+                return response["series"]
+    return series
+
+
+async def session_listing(state, station=None, limit=100):
+    if state == "active":
+        return await on_ocpp_loop(sessions.active_sessions, station)
+    return await on_ocpp_loop(sessions.completed_sessions, station, limit)
+
+
+async def cluster_sessions(state, station, limit=100):
+    # Sessions are tracked by the worker that received the station's messages
+    result = await session_listing(state, station, limit)
+    if shard:
+        for response in await shard.broadcast({"op": "sessions", "state": state,
+                                               "station": station, "limit": limit}):
+            result += response["sessions"]
+    return result
+
+
+@app.get("/sessions/active")
+async def get_active_sessions(station: Optional[str] = None):
+    """Charging sessions in progress with their running totals."""
+    return {"sessions": await cluster_sessions("active", station)}
+
+
+@app.get("/sessions/completed")
+async def get_completed_sessions(station: Optional[str] = None,
+                                 limit: int = Query(100, ge=1, le=1000)):
+    """Finished charging sessions, newest first."""
+    result = await cluster_sessions("completed", station, limit)
+    result.sort(key=lambda session: session["ended_at"], reverse=True)
+    return {"sessions": result[:limit]}
+
+
+async def rebalance_site():
+    """Share the site limit between charging EVSEs and push the changed limits."""
+    settings = await site_settings()
+    allocator.site_limit_kw = settings["limit_kw"]
+    if not allocator.site_limit_kw:
+        return {"status": "disabled"}
+    transactions = {(session["station"], session["evse_id"]): session["transaction_id"]
+                    for session in await cluster_sessions("active", None)}
+    evses = sorted(transactions)
+    started = time.perf_counter()
+    allocation, pushes = allocator.plan(evses, settings["stations"], transactions)
+    solve_ms = (time.perf_counter() - started) * 1000
+
+    semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+
+    async def push(cp_id, evse_id, limit_kw):
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(run_station_command(
+                    "set_limit", cp_id, {"evse_id": evse_id, "limit_kw": limit_kw},
+                    timeout=FLEET_TIMEOUT_S), FLEET_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                return False
+            if result.get("status") == "Accepted":
+                allocator.accepted(cp_id, evse_id, limit_kw, transactions.get((cp_id, evse_id)))
+                return True
+            return False
+
+    accepted = await asyncio.gather(*(push(*change) for change in pushes))
+    summary = {
+        "time": format_timestamp(time.time()),
+        "limit_kw": allocator.site_limit_kw,
+        "evses": len(evses),
+        "allocated_kw": round(sum(allocation.values()), 3),
+        "solve_ms": round(solve_ms, 3),
+        "pushed": len(pushes),
+        "accepted": sum(accepted),
+        "allocation": [{"station": cp_id, "evse_id": evse_id, "limit_kw": limit}
+                       for (cp_id, evse_id), limit in allocation.items()],
+    }
+    await update_site_settings(last_rebalance=summary)
+    return summary
+
+
+async def run_site_allocator():
+    while True:
+        await asyncio.sleep(SITE_REBALANCE_INTERVAL_S)
+        try:
+            await rebalance_site()
+        except Exception as e:
+            logger.error(f"Site rebalance failed: {e}")
+
+
+@app.get("/site")
+async def get_site():
+    """Site limit, per-station settings and the last allocation."""
+    return await site_settings()
+
+
+@app.post("/site")
+async def set_site_limit(req: SiteLimitRequest):
+    await update_site_settings(limit_kw=req.limit_kw)
+    return {"status": "success", "limit_kw": req.limit_kw}
+
+
+@app.post("/site/stations/{cp_id}")
+async def set_site_station(cp_id: str, req: SiteStationRequest):
+    """Per-station maximum (kW per EVSE) and priority weight for the allocator."""
+    stations = dict((await site_settings())["stations"])
+    stations[cp_id] = {**stations.get(cp_id, {}), **req.model_dump(exclude_none=True)}
+    await update_site_settings(stations=stations)
+    return {"status": "success", "station": cp_id, **stations[cp_id]}
+
+
+@app.post("/site/rebalance")
+async def post_site_rebalance():
+    # The allocator runs in worker 0, which remembers what it pushed
+    if shard and shard.index != 0:
+        return await shard.request(0, {"op": "rebalance"})
+    return await rebalance_site()
+
+
+@app.post("/stations/{cp_id}/availability")
+async def change_availability(cp_id: str, payload: AvailabilityRequest):
+    return await run_station_command("availability", cp_id, payload.model_dump())
     
 @app.get("/stations/get_meter_rate")
 async def get_charge_rate():
-    if latest_charging_rates is None:
+    rate = await charge_rate()
+    if rate is None:
         return {"status": "sucsess", "message": "no charge set"}
-    return {"status": "success", "charge_rate": latest_charging_rates}
+    return {"status": "success", "charge_rate": rate}
     
 @app.post("/stations/{cp_id}/change_profile")
 async def set_charging_profile(cp_id: str, req: ChargingProfileRequest):
-    global latest_charging_rates
-    # if cp_id not in connected_stations:
-    #     return {"status": "station not connected"}
-    cp = connected_stations[cp_id]
-    try:
-        latest_charging_rates = req.meter_rate_kw
-        charging_profile = {"id": 1, 
-                            "stackLevel": 0,
-                            "chargingProfilePurpose": ChargingProfilePurposeType.tx_profile,
-                            "chargingProfileKind": ChargingProfileKindType.absolute,
-                            "chargingSchedule": [{
-                                "id": 1, # schedule ID
-                                "duration": 3600, # seconds
-                "chargingRateUnit": ChargingRateUnitType.watts, 
-                "chargingSchedulePeriod": [{
-                     "startPeriod": 0, # start immediately
-                     "limit": req.meter_rate_kw * 1000, # kW → W
-                     "numberPhases": 3
-                     }]}]}
-        # Request payload
-        request = call.SetChargingProfilePayload(
-            evse_id=req.evse_id,
-            charging_profile=charging_profile)
-        response = await cp.call(request)
-        return {"status": response.status}
-    except Exception as e:
-        logger.error(f"Error starting transaction with profile for {cp_id}: {e}")
-        return {"status": "error", "message": str(e)}
+    return await run_station_command("change_profile", cp_id, req.model_dump())
     
+STATION_SORT_KEYS = {
+    "id": lambda info: info["id"],
+    "status": lambda info: (info["status"], info["id"]),
+    "model": lambda info: ((info["charging_station"] or {}).get("model") or "", info["id"]),
+    "vendor": lambda info: ((info["charging_station"] or {}).get("vendor_name") or "", info["id"]),
+    "connected": lambda info: (info["connected"], info["id"]),
+}
+
+
 @app.get("/stations/admin")
-def get_admin_stations():
-    print("Connected statios", connected_stations)
-    return[{"id": cp_id, **info}
-        for cp_id, info in registered_stations.items()]
+async def get_admin_stations(
+    request: Request, response: Response,
+    status: Optional[str] = None, model: Optional[str] = None, vendor: Optional[str] = None,
+    connected: Optional[bool] = None, sort: str = "id",
+    offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1, le=10000),
+):
+    """
+    Registered stations matching the filters, sorted by ``sort`` (id,
+    status, model, vendor or connected; "-" in front for descending).
+    X-Total-Count has the number of matches; the ETag answers an unchanged
+    listing with 304.
+    """
+    if sort.lstrip("-") not in STATION_SORT_KEYS:
+        return {"status": "error", "message": f"sort must be one of {list(STATION_SORT_KEYS)}"}
+    etag = await registry_etag()
+    if etag_matches(request, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+    filters = station_filters(status=status, model=model, vendor=vendor)
+    # A station that moved between workers can be registered in several;
+    # the entry of the worker it is connected to wins, so stale entries of
+    # the others are dropped before the connected filter is applied.
+    listings = await station_listings(filters)
+    connected_anywhere = {cp_id for listing in listings for cp_id in listing["connected"]}
+    stations = {}
+    for listing in listings:
+        for info in listing["registered"]:
+            if info["connected"] or info["id"] not in connected_anywhere:
+                stations.setdefault(info["id"], info)
+    matches = [info for info in stations.values()
+               if connected is None or info["connected"] == connected]
+    matches.sort(key=STATION_SORT_KEYS[sort.lstrip("-")], reverse=sort.startswith("-"))
+    return paginate_listing(response, matches, offset, limit, etag)
+
+EXPORT_CHUNK_READINGS = 500
+CSV_COLUMNS = ["station", "evse_id", "timestamp", "measurand", "unit", "multiplier", "value"]
+
+
+def format_export_chunk(cp_id, readings, fmt):
+    if fmt == "ndjson":
+        return "".join(fast_json.dumps({"station": cp_id, **reading}) + "\n" for reading in readings)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for reading in readings:
+        for sv in reading["sampled_values"]:
+            writer.writerow([cp_id, reading["evse_id"], reading["timestamp"], sv["measurand"],
+                             sv["unit"], sv["multiplier"], sv["value"]])
+    return out.getvalue()
+
+
+async def export_meter_readings(stations, fmt, start, end):
+    # One page at a time per station, so memory stays flat however large
+    # the history is, and the loop gets a turn between pages.
+    if fmt == "csv":
+        yield ",".join(CSV_COLUMNS) + "\n"
+    for cp_id in stations:
+        after = 0
+        while True:
+            readings, after, has_more = await meter_page(
+                cp_id, after, start, end, EXPORT_CHUNK_READINGS)
+            if readings:
+                yield format_export_chunk(cp_id, readings, fmt)
+            if not has_more:
+                break
+            await asyncio.sleep(0)
+
 
 @app.get("/meter-readings/all")
-async def get_all_meter_readings():
-    """Get all meter readings from all stations"""
-    return {"all_readings": meter_readings}
+async def get_all_meter_readings(
+    fmt: str = Query("json", alias="format"),
+    station: Optional[List[str]] = Query(None),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+):
+    """
+    Get all meter readings from all stations.
+
+    format=ndjson (one reading per line) and format=csv (one sampled value
+    per line) stream the export; station (repeatable) and from/to filter it.
+    """
+    try:
+        start = parse_time_param(from_)
+        end = parse_time_param(to)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    stations = station or await meter_stations()
+
+    if fmt in ("ndjson", "csv"):
+        media_type = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+        return StreamingResponse(export_meter_readings(stations, fmt, start, end),
+                                 media_type=media_type)
+    if fmt != "json":
+        return {"status": "error", "message": "format must be one of json, ndjson, csv"}
+
+    all_readings = {}
+    for cp_id in stations:
+        readings = (await meter_page(cp_id, 0, start, end))[0]
+        if readings:
+            all_readings[cp_id] = readings
+    return {"all_readings": all_readings}
 
 
 @app.get("/")
 async def root():
+    connected = set()
+    for listing in await station_listings(registered=False):
+        connected.update(listing["connected"])
     return {
         "message": "OCPP Central Server", 
-        "connected_stations": len(connected_stations),
-        "stations_with_meter_data": len(meter_readings)
+        "connected_stations": len(connected),
+        "stations_with_meter_data": len(await on_ocpp_loop(meter_store.stations))
     }
 
 @app.get("/status/{cp_id}")
 async def get_status(cp_id: str):
-    status = registered_stations.get(cp_id, {}).get("status", "Operative")
-    return {"cp_id": cp_id, "status": status}
+    owner = await peer_owner(cp_id)
+    if owner is not None:
+        try:
+            return await shard.request(owner, {"op": "status", "cp_id": cp_id})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Worker {owner} did not answer status for {cp_id}: {e}")
+    return await on_ocpp_loop(station_status, cp_id)
+
+
+def station_status(cp_id):
+    status = registry.status(cp_id)
+    seen = last_seen.get(cp_id)
+    return {"cp_id": cp_id, "status": status,
+            "last_seen": datetime.fromtimestamp(seen, timezone.utc).isoformat() if seen else None}
+
+@app.get("/events")
+async def subscribe_events(
+    topic: Optional[List[str]] = Query(None),
+    station: Optional[List[str]] = Query(None),
+):
+    """
+    Server-sent events for new meter readings ("meter") and station status
+    changes ("status"). topic and station are repeatable filters.
+    """
+    if topic and not set(topic) <= set(TOPICS):
+        return {"status": "error", "message": f"topic must be one of {list(TOPICS)}"}
+    subscriber = events.subscribe(topic, station)
+    return StreamingResponse(
+        cluster_event_stream(subscriber) if shard else events.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def relay_events(worker, subscriber):
+    # Events published by a peer worker, passed on to a local subscriber
+    request = {"op": "subscribe",
+               "topics": sorted(subscriber.topics) if subscriber.topics else None,
+               "stations": sorted(subscriber.stations) if subscriber.stations else None}
+    try:
+        async for event in shard.stream(worker, request):
+            if not event.startswith(":"):
+                events.deliver(subscriber, event)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Event relay from worker {worker} failed: {e}")
+    # The peer went away or dropped us; end the stream so the browser
+    # reconnects and catches up instead of silently missing events.
+    events.close(subscriber)
+
+
+async def cluster_event_stream(subscriber):
+    relays = [asyncio.create_task(relay_events(worker, subscriber)) for worker in shard.peers]
+    try:
+        async for event in events.stream(subscriber):
+            yield event
+    finally:
+        for relay in relays:
+            relay.cancel()
+
 
 @app.get("/health")
 async def health():
     return {"status":"OK"}
-    
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics; with several workers each sample has a worker label."""
+    collections = [metrics.collect()]
+    if shard:
+        collections += [response["metrics"] for response in await shard.broadcast({"op": "metrics"})]
+    return PlainTextResponse(render(*collections), media_type="text/plain; version=0.0.4")
+
+
+async def monitor_event_loop(name="main", interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(max(0.0, loop.time() - expected), name)
+
+
+async def expire_meter_history(interval=60):
+    # Age retention for stations that stopped sending meter values
+    while True:
+        await asyncio.sleep(interval)
+        meter_store.expire()
+        rollups.expire()
+
+
+async def handle_control(request):
+    """Requests from peer workers (see workers.ShardRouter)."""
+    op = request.get("op")
+    if op == "command":
+        return await run_station_command(request["action"], request["cp_id"],
+                                         request.get("body"), forward=False,
+                                         timeout=request.get("timeout"))
+    if op == "command_queues":
+        return {"queues": await on_ocpp_loop(command_queues, request["cp_id"])}
+    if op == "stations":
+        return await on_ocpp_loop(local_station_listing, request.get("filters"),
+                                  request.get("registered", True))
+    if op == "registry_etag":
+        return {"etag": await on_ocpp_loop(lambda: registry.etag)}
+    if op == "status":
+        return await on_ocpp_loop(station_status, request["cp_id"])
+    if op == "metrics":
+        return {"metrics": metrics.collect()}
+    if op == "meter_history":
+        return await meter_history(request["cp_id"], request["after"], request["token"],
+                                   request["start"], request["end"], request["limit"],
+                                   request.get("format", "readings"))
+    if op == "rebalance":
+        return await rebalance_site()
+    if op == "deregister":
+        return {"removed": await on_ocpp_loop(deregister_station, request["cp_id"])}
+    if op == "forget_push":
+        allocator.forget(request["cp_id"], request.get("evse_id"))
+        return {"status": "success"}
+    if op == "sessions":
+        return {"sessions": await session_listing(request["state"], request["station"],
+                                                  request["limit"])}
+    if op == "rollups":
+        return {"series": await on_ocpp_loop(
+            rollups.query, request["cp_id"], request["resolution"],
+            request["measurand"], request["start"], request["end"])}
+    return {"status": "error", "message": f"unknown op {op!r}"}
+
+
+async def stream_control(request):
+    subscriber = events.subscribe(request.get("topics"), request.get("stations"))
+    async for event in events.stream(subscriber):
+        yield event
+
+
+def reuse_port_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def new_ocpp_loop():
+    if OCPP_UVLOOP:
+        try:
+            import uvloop
+            return uvloop.new_event_loop()
+        except ImportError:
+            logger.warning("OCPP_UVLOOP is set but uvloop is not installed; using asyncio")
+    return asyncio.new_event_loop()
+
+
+def start_ocpp_loop():
+    """Start an event loop on its own thread for the OCPP side."""
+    loop = new_ocpp_loop()
+    threading.Thread(target=loop.run_forever, name="ocpp-loop", daemon=True).start()
+    return loop
+
+
+async def cancel_tasks():
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def main():
-    config = uvicorn.Config(app, host="0.0.0.0", port=8001, log_level="info")
+    global ocpp_loop, rest_loop, journal
+    # log_config=None: uvicorn's loggers propagate to the queued root handler
+    config = uvicorn.Config(app, host="0.0.0.0", port=8001, log_level="info", log_config=None)
     server = uvicorn.Server(config)
 
-    await asyncio.gather(
-        server.serve(),
-        start_websocket_server()
-    )
+    if meter_db:
+        meter_store.resume_reading_ids(meter_db.open())
+    ocpp_tasks = [start_websocket_server(), close_dead_stations(), expire_meter_history()]
+    if meter_db:
+        ocpp_tasks.append(meter_db.run())
+    if OCPP_JOURNAL_PATH:
+        journal = FrameJournal(
+            f"{OCPP_JOURNAL_PATH}.{shard.index}" if shard else OCPP_JOURNAL_PATH,
+            batch_size=int(os.getenv("OCPP_JOURNAL_BATCH_SIZE", "1000")),
+            flush_interval=float(os.getenv("OCPP_JOURNAL_FLUSH_INTERVAL_S", "1.0")),
+            max_bytes=int(float(os.getenv("OCPP_JOURNAL_MAX_MB", "1024")) * 1024 * 1024))
+        journal.open()
+        ocpp_tasks.append(journal.run())
+        # uvicorn re-raises SIGTERM once it has shut down, before the
+        # journal task could write what is pending on cancellation
+        app.add_event_handler("shutdown", journal.flush)
+    tasks = [
+        server.serve(sockets=[reuse_port_socket("0.0.0.0", 8001)]) if shard else server.serve(),
+    ]
+    if shard:
+        tasks.append(shard.serve(handle_control, stream_control))
+    if not shard or shard.index == 0:
+        tasks.append(run_site_allocator())
+
+    if OCPP_LOOP == "thread":
+        async def run_ocpp_side():
+            await asyncio.gather(monitor_event_loop("ocpp"), *ocpp_tasks)
+
+        rest_loop = asyncio.get_running_loop()
+        ocpp_loop = start_ocpp_loop()
+        logger.info("OCPP websocket server runs on its own event loop (%s)",
+                    type(ocpp_loop).__module__)
+        # If the OCPP side fails, the whole server stops as in shared mode
+        tasks += [monitor_event_loop("rest"), asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(run_ocpp_side(), ocpp_loop))]
+    else:
+        tasks += [monitor_event_loop()] + ocpp_tasks
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if ocpp_loop is not None:
+            # Let the OCPP side unwind (the meter database flushes its
+            # queue) before the thread goes away with the process.
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(cancel_tasks(), ocpp_loop))
+            ocpp_loop.call_soon_threadsafe(ocpp_loop.stop)
+
+
+def run_worker(index, count, registry, settings, socket_dir):
+    global shard, meter_store
+    shard = ShardRouter(index, count, registry, settings, socket_dir)
+    # Interleaved reading ids keep the shared database free of collisions
+    meter_store = create_meter_store(id_stride=count, id_offset=index)
+    metrics.const_labels = {"worker": str(index)}
+    logger.info(f"OCPP worker {index} of {count} starting (pid {os.getpid()})")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(count):
+    if not meter_db:
+        logger.warning("METER_DB_PATH is empty: with several workers each keeps its own "
+                       "meter history, exports only cover the worker that answers")
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager, tempfile.TemporaryDirectory(prefix="ocpp-workers-") as socket_dir:
+        registry = manager.dict()
+        settings = manager.dict(charge_rate=latest_charging_rates)
+        workers = [
+            context.Process(target=run_worker, name=f"ocpp-worker-{index}",
+                            args=(index, count, registry, settings, socket_dir))
+            for index in range(count)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # systemd stops the service with SIGTERM: take the workers down too
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if OCPP_WORKERS > 1:
+        run_workers(OCPP_WORKERS)
+    else:
+        asyncio.run(main())
 
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+
+class Command:
+    __slots__ = ("action", "body", "key", "deadline", "enqueued", "waiters")
+
+    def __init__(self, action: str, body: dict, key: Optional[Hashable], deadline: float,
+                 waiter: asyncio.Future):
+        self.action = action
+        self.body = body
+        self.key = key
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.waiters: List[asyncio.Future] = [waiter]
+
+
+class CommandQueue:
+    """
+    Commands for one charge point, run one at a time in arrival order (the
+    OCPP library only allows one outstanding call per station anyway).
+
+    * Every command has a deadline; one still queued when it passes is
+      answered ``{"status": "expired"}`` without being sent, one running
+      past it ``{"status": "timeout"}``.
+    * Commands with the same ``coalesce_key(action, body)`` that are still
+      queued collapse into one carrying the newest body; everyone who
+      submitted them gets its result.
+    * A caller that stops waiting (e.g. its own timeout) just drops out; a
+      command nobody waits for any more is not sent.
+    """
+
+    def __init__(self, run: Callable[[str, dict], Awaitable[dict]],
+                 coalesce_key: Optional[Callable[[str, dict], Optional[Hashable]]] = None,
+                 observe_wait: Optional[Callable[[str, float], None]] = None):
+        self._run = run
+        self._coalesce_key = coalesce_key
+        self._observe_wait = observe_wait
+        self._pending: Deque[Command] = deque()
+        self._by_key: Dict[Hashable, Command] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self.running: Optional[Command] = None
+        self.completed = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.wait_total = 0.0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, action: str, body: dict, timeout: float) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        deadline = time.monotonic() + timeout
+        key = self._coalesce_key(action, body) if self._coalesce_key else None
+        queued = self._by_key.get(key) if key is not None else None
+        if queued is not None:
+            queued.body = body
+            queued.deadline = deadline
+            queued.waiters.append(waiter)
+            self.coalesced += 1
+        else:
+            command = Command(action, body, key, deadline, waiter)
+            self._pending.append(command)
+            if key is not None:
+                self._by_key[key] = command
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._drain())
+        return waiter
+
+    async def _drain(self):
+        while self._pending:
+            command = self._pending.popleft()
+            if command.key is not None:
+                self._by_key.pop(command.key, None)
+            waiters = [waiter for waiter in command.waiters if not waiter.done()]
+            if not waiters:
+                continue
+            now = time.monotonic()
+            self.wait_total += now - command.enqueued
+            if self._observe_wait:
+                self._observe_wait(command.action, now - command.enqueued)
+            if now >= command.deadline:
+                self.expired += 1
+                result = {"status": "expired"}
+            else:
+                self.running = command
+                try:
+                    result = await asyncio.wait_for(
+                        self._run(command.action, command.body), command.deadline - now)
+                except asyncio.TimeoutError:
+                    result = {"status": "timeout"}
+                finally:
+                    self.running = None
+            self.completed += 1
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    def close(self, result: dict):
+        """Answer everything still queued with ``result`` and stop."""
+        if self._worker is not None:
+            self._worker.cancel()
+        commands = list(self._pending) + ([self.running] if self.running else [])
+        self._pending.clear()
+        self._by_key.clear()
+        for command in commands:
+            for waiter in command.waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "depth": len(self._pending),
+            "running": self.running.action if self.running else None,
+            "running_for_s": round(now - self.running.enqueued, 3) if self.running else None,
+            "oldest_wait_s": round(now - self._pending[0].enqueued, 3) if self._pending else 0.0,
+            "queued": [command.action for command in self._pending],
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "mean_wait_ms": round(self.wait_total / self.completed * 1000, 3) if self.completed else None,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Iterable, Optional, Set
+
+import fast_json
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("meter", "status")
+
+
+class Subscriber:
+    def __init__(self, topics: Optional[Set[str]], stations: Optional[Set[str]], max_queue: int):
+        self.topics = topics
+        self.stations = stations
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+
+    def wants(self, topic: str, cp_id: str) -> bool:
+        return (self.topics is None or topic in self.topics) and \
+            (self.stations is None or cp_id in self.stations)
+
+
+class EventHub:
+    """
+    Fan-out of live events to server-sent-event subscribers.
+
+    Each subscriber has a bounded queue. Publishing never waits: a
+    subscriber whose queue is full is disconnected (its queue is replaced by
+    a single ``None``), and the browser's EventSource reconnects and
+    catches up from the REST API.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self.dropped_subscribers = 0
+        self._subscribers: Set[Subscriber] = set()
+
+    def __bool__(self):
+        return bool(self._subscribers)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None,
+                  stations: Optional[Iterable[str]] = None) -> Subscriber:
+        subscriber = Subscriber(set(topics) if topics else None,
+                                set(stations) if stations else None,
+                                self.max_queue)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, topic: str, cp_id: str, data: dict):
+        event = None
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(topic, cp_id):
+                continue
+            if event is None:
+                event = f"event: {topic}\ndata: {fast_json.dumps(data)}\n\n"
+            self.deliver(subscriber, event)
+
+    def deliver(self, subscriber: Subscriber, event: str):
+        """Queue an already formatted event, e.g. one relayed from another worker."""
+        try:
+            subscriber.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_subscribers += 1
+            logger.warning("Dropping slow event subscriber")
+            self.close(subscriber)
+
+    def close(self, subscriber: Subscriber):
+        """End a subscriber's stream after the events already queued."""
+        self.unsubscribe(subscriber)
+        if subscriber.queue.full():
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    async def stream(self, subscriber: Subscriber, keepalive: float = 15.0):
+        """Server-sent-event body for one subscriber."""
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
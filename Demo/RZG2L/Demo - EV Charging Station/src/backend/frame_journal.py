@@ -0,0 +1,187 @@
+"""
+Journal of the raw OCPP traffic, for replaying real fleet traffic against a
+local central server (see journal_replay.py).
+
+The file is a magic header followed by back-to-back records::
+
+    timestamp  float64   time.time() when the frame was received or sent
+    direction  uint8     INBOUND, OUTBOUND, CONNECTED or DISCONNECTED
+    station    uint16    length of the station id
+    frame      uint32    length of the frame
+    <station id><frame>  UTF-8
+
+all little-endian, so ``read_journal`` can walk a memory map of the file
+without parsing any JSON. ``record`` only appends a tuple to a list; a
+background task packs and writes the list every ``flush_interval`` seconds
+(or once ``batch_size`` frames are waiting) on a worker thread. A record
+torn by a crash is cut off when the journal is opened again, so new
+records never follow a partial one.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OCPPJRN1"
+HEADER = struct.Struct("<dBHI")
+
+INBOUND = 0
+OUTBOUND = 1
+CONNECTED = 2
+DISCONNECTED = 3
+DIRECTIONS = {INBOUND: "in", OUTBOUND: "out", CONNECTED: "connected", DISCONNECTED: "disconnected"}
+
+
+class Record(NamedTuple):
+    timestamp: float
+    station: str
+    direction: int
+    frame: str
+
+
+class FrameJournal:
+    def __init__(self, path: str, batch_size: int = 1000, flush_interval: float = 1.0,
+                 max_bytes: int = 1 << 30):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Recording stops once the file reaches max_bytes (0: no limit)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.recorded = 0
+        self.dropped = 0
+        self._pending: List[Tuple[float, str, int, Union[str, bytes]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-journal")
+        self._file: Optional[BinaryIO] = None
+
+    def open(self):
+        self._file = open(self.path, "ab")
+        complete = complete_size(self.path)
+        if complete == 0:
+            self._file.truncate(0)
+            self._file.write(MAGIC)
+        elif complete < self._file.tell():
+            logger.warning(f"Cutting a torn record off {self.path} at byte {complete}")
+            self._file.truncate(complete)
+        self.size = self._file.seek(0, os.SEEK_END)
+        logger.info(f"Recording OCPP frames to {self.path}")
+
+    @property
+    def full(self) -> bool:
+        return bool(self.max_bytes) and self.size >= self.max_bytes
+
+    def record(self, station: str, direction: int, frame: Union[str, bytes] = ""):
+        if self.full:
+            self.dropped += 1
+            return
+        self._pending.append((time.time(), station, direction, frame))
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _write(self, batch):
+        chunks = []
+        for timestamp, station, direction, frame in batch:
+            station_bytes = station.encode()
+            # Binary websocket frames are kept as they are
+            frame_bytes = frame if isinstance(frame, bytes) else frame.encode()
+            chunks += (HEADER.pack(timestamp, direction, len(station_bytes), len(frame_bytes)),
+                       station_bytes, frame_bytes)
+        data = b"".join(chunks)
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError:
+            # Do not leave part of the batch behind (e.g. disk full)
+            self._file.truncate(self.size)
+            raise
+        self.size += len(data)
+        self.recorded += len(batch)
+        if self.full:
+            logger.warning(f"Frame journal {self.path} reached {self.size} bytes; recording stopped")
+
+    def _take_pending(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            # Losing frames beats taking the server down with the journal
+            self.dropped += len(batch)
+            logger.error(f"Could not write {len(batch)} frames to {self.path}: {e}")
+
+    async def flush(self):
+        """Write what is pending now, from any event loop."""
+        batch = self._take_pending()
+        if batch:
+            await asyncio.wrap_future(self._executor.submit(self._write_batch, batch))
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                batch = self._take_pending()
+                if batch:
+                    await loop.run_in_executor(self._executor, self._write_batch, batch)
+        except asyncio.CancelledError:
+            # Shutting down: write what is still pending synchronously
+            batch = self._take_pending()
+            if batch:
+                self._executor.submit(self._write_batch, batch).result()
+            self._file.close()
+            raise
+
+
+def complete_size(path: str) -> int:
+    """
+    Bytes of ``path`` up to the end of its last complete record; 0 for a
+    file that is empty or too short to be a journal.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < len(MAGIC):
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an OCPP frame journal")
+            offset = len(MAGIC)
+            while offset + HEADER.size <= len(data):
+                _, _, station_len, frame_len = HEADER.unpack_from(data, offset)
+                end = offset + HEADER.size + station_len + frame_len
+                if end > len(data):
+                    break
+                offset = end
+            return offset
+
+
+def read_journal(path: str) -> Iterator[Record]:
+    """Records of a journal in file order; a torn last record is ignored."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an OCPP frame journal")
+            offset = len(MAGIC)
+            while offset + HEADER.size <= len(data):
+                timestamp, direction, station_len, frame_len = HEADER.unpack_from(data, offset)
+                start = offset + HEADER.size
+                end = start + station_len + frame_len
+                if end > len(data):
+                    break
+                yield Record(timestamp, data[start:start + station_len].decode(), direction,
+                             data[start + station_len:end].decode(errors="replace"))
+                offset = end
@@ -0,0 +1,64 @@
+"""
+Per-station limits on inbound OCPP calls.
+
+Each charge point connection gets a token bucket (``rate`` calls per
+second, bursts of ``burst``) and a bounded queue of calls waiting for
+their handler. A call that finds the bucket empty or the queue full is
+answered with a GenericError CallError, or with ``overflow="drop"``
+silently discarded. Responses to the server's own calls (CallResult and
+CallError frames) are never limited.
+"""
+import os
+import re
+import time
+
+OVERFLOW_ACTIONS = ("error", "drop")
+
+# A frame whose first element is MessageType.Call
+_CALL_FRAME = re.compile(r"\s*\[\s*2\s*,")
+
+
+def is_call(frame) -> bool:
+    return isinstance(frame, str) and _CALL_FRAME.match(frame) is not None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class InboundLimits:
+    def __init__(self, rate: float = 20.0, burst: int = 40, queue_size: int = 8,
+                 overflow: str = "error"):
+        if overflow not in OVERFLOW_ACTIONS:
+            raise ValueError(f"Invalid overflow action {overflow!r}; "
+                             f"use one of {', '.join(OVERFLOW_ACTIONS)}")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow
+
+    @classmethod
+    def from_env(cls) -> "InboundLimits":
+        # OCPP_INBOUND_RATE=0 turns the rate limit off
+        return cls(rate=float(os.getenv("OCPP_INBOUND_RATE", "20")),
+                   burst=int(os.getenv("OCPP_INBOUND_BURST", "40")),
+                   queue_size=int(os.getenv("OCPP_INBOUND_QUEUE", "8")),
+                   overflow=os.getenv("OCPP_INBOUND_OVERFLOW", "error").lower())
+
+    def bucket(self) -> TokenBucket:
+        return TokenBucket(self.rate, self.burst)
@@ -0,0 +1,252 @@
+"""
+Replay a frame journal (see frame_journal.py) against a central server.
+
+Every station in the capture gets its own websocket and sends the calls it
+sent originally, at the recorded times divided by ``--speed`` (0 sends as
+fast as possible); connects and disconnects are replayed as well. Calls
+the server makes to a station are answered with the payload the station
+gave to the same action in the capture. Like a real charge point, a
+station waits for the answer to its previous call (up to ``--timeout``)
+before sending the next one. Frames that are not OCPP messages (the
+journal records them before validation) are skipped and counted. Prints
+round trips of the replayed calls and how far the replay fell behind the
+schedule:
+
+    OCPP_JOURNAL_PATH=ocpp.journal python3 central_server.py    # record
+    python3 journal_replay.py ocpp.journal --speed 10            # replay
+    python3 journal_replay.py ocpp.journal.0 ocpp.journal.1 --dump | head
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+import websockets
+
+from frame_journal import CONNECTED, DIRECTIONS, DISCONNECTED, INBOUND, OUTBOUND, Record, read_journal
+
+CALL, CALL_RESULT, CALL_ERROR = 2, 3, 4
+
+
+class Connection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.receiver: Optional[asyncio.Task] = None
+        # unique id -> when the call was sent; at most one at a time
+        self.pending: Dict[str, float] = {}
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+
+def parse(frame: str) -> Optional[list]:
+    """The OCPP message in a frame, or None if the frame is not one."""
+    try:
+        message = json.loads(frame)
+    except ValueError:
+        return None
+    if not isinstance(message, list) or len(message) < 3 or \
+            message[0] not in (CALL, CALL_RESULT, CALL_ERROR) or not isinstance(message[1], str) or \
+            (message[0] == CALL and (len(message) < 4 or not isinstance(message[2], str))):
+        return None
+    return message
+
+
+def load(paths):
+    """
+    Replayed events per station (connects, disconnects and the station's
+    own calls), per station and action its recorded answers to calls from
+    the server, and the number of frames skipped as malformed.
+    """
+    events: Dict[str, List[Record]] = defaultdict(list)
+    answers: Dict[str, Dict[str, Deque[list]]] = defaultdict(lambda: defaultdict(deque))
+    server_calls: Dict[tuple, str] = {}
+    start = None
+    malformed = 0
+    for record in heapq.merge(*(read_journal(path) for path in paths), key=lambda r: r.timestamp):
+        start = record.timestamp if start is None else start
+        if record.direction in (CONNECTED, DISCONNECTED):
+            events[record.station].append(record)
+            continue
+        message = parse(record.frame)
+        if message is None:
+            malformed += 1
+            continue
+        if record.direction == OUTBOUND:
+            if message[0] == CALL:
+                server_calls[(record.station, message[1])] = message[2]
+        elif message[0] == CALL:
+            events[record.station].append(record)
+        else:
+            action = server_calls.pop((record.station, message[1]), None)
+            if action is not None:
+                answers[record.station][action].append(message[2:])
+    return start, events, answers, malformed
+
+
+class Replay:
+    def __init__(self, url, speed, timeout, start, answers):
+        self.url = url.rstrip("/")
+        self.speed = speed
+        self.timeout = timeout
+        self.start = start
+        self.answers = answers
+        self.round_trips: List[float] = []
+        self.sent = 0
+        self.errors = 0
+        self.unanswered = 0
+        self.failed_connects = 0
+        self.max_behind = 0.0
+
+    async def wait_until(self, timestamp, began):
+        if not self.speed:
+            return
+        due = began + (timestamp - self.start) / self.speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self.max_behind = max(self.max_behind, -delay)
+
+    async def receive(self, station, connection):
+        async for frame in connection.ws:
+            message = json.loads(frame)
+            if message[0] == CALL:
+                await connection.ws.send(json.dumps(self.answer(station, message)))
+                continue
+            sent = connection.pending.pop(message[1], None)
+            if sent is not None:
+                self.round_trips.append(time.monotonic() - sent)
+                connection.idle.set()
+            if message[0] == CALL_ERROR:
+                self.errors += 1
+
+    async def settle(self, connection):
+        """Wait for the answer to the outstanding call, if any."""
+        try:
+            await asyncio.wait_for(connection.idle.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            self.unanswered += len(connection.pending)
+            connection.pending.clear()
+            connection.idle.set()
+
+    def answer(self, station, call):
+        recorded = self.answers[station].get(call[2])
+        if recorded:
+            # Keep the last answer for calls made more often than recorded
+            answer = recorded.popleft() if len(recorded) > 1 else recorded[0]
+            # A result is [payload]; an error [code, description, details]
+            return [CALL_RESULT if len(answer) == 1 else CALL_ERROR, call[1], *answer]
+        return [CALL_ERROR, call[1], "NotImplemented", f"No recorded answer to {call[2]}", {}]
+
+    async def station(self, station, events, began):
+        connection: Optional[Connection] = None
+
+        async def disconnect():
+            nonlocal connection
+            if connection is not None:
+                if not connection.receiver.done():
+                    await self.settle(connection)
+                await connection.ws.close()
+                await asyncio.gather(connection.receiver, return_exceptions=True)
+                self.unanswered += len(connection.pending)
+            connection = None
+
+        try:
+            for record in events:
+                await self.wait_until(record.timestamp, began)
+                if record.direction == DISCONNECTED:
+                    await disconnect()
+                    continue
+                if record.direction == CONNECTED or connection is None:
+                    await disconnect()
+                    try:
+                        connection = Connection(await websockets.connect(
+                            f"{self.url}/{station}", subprotocols=["ocpp2.0.1"]))
+                    except (OSError, websockets.InvalidHandshake):
+                        self.failed_connects += 1
+                        continue
+                    connection.receiver = asyncio.create_task(self.receive(station, connection))
+                if record.direction == INBOUND:
+                    await self.settle(connection)
+                    connection.pending[json.loads(record.frame)[1]] = time.monotonic()
+                    connection.idle.clear()
+                    try:
+                        await connection.ws.send(record.frame)
+                    except websockets.ConnectionClosed:
+                        await disconnect()
+                        continue
+                    self.sent += 1
+        finally:
+            await disconnect()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 3)
+
+
+async def replay(args):
+    start, events, answers, malformed = load(args.journal)
+    if start is None:
+        return {"status": "error", "message": "the journal is empty"}
+    runner = Replay(args.url, args.speed, args.timeout, start, answers)
+    began = time.monotonic()
+    await asyncio.gather(*(runner.station(station, station_events, began)
+                           for station, station_events in events.items()))
+    elapsed = time.monotonic() - began
+    recorded = max(record.timestamp for station_events in events.values()
+                   for record in station_events) - start
+    return {
+        "stations": len(events),
+        "recorded_s": round(recorded, 3),
+        "elapsed_s": round(elapsed, 3),
+        "speed": args.speed,
+        "calls_sent": runner.sent,
+        "malformed_frames_skipped": malformed,
+        "calls_per_s": round(runner.sent / elapsed, 1) if elapsed else None,
+        "call_errors": runner.errors,
+        "unanswered": runner.unanswered,
+        "failed_connects": runner.failed_connects,
+        "max_behind_schedule_s": round(runner.max_behind, 3),
+        "round_trip_ms": {"p50": percentile(runner.round_trips, 0.5),
+                          "p95": percentile(runner.round_trips, 0.95),
+                          "p99": percentile(runner.round_trips, 0.99),
+                          "max": percentile(runner.round_trips, 1.0)},
+    }
+
+
+def dump(paths):
+    for record in heapq.merge(*(read_journal(path) for path in paths), key=lambda r: r.timestamp):
+        print(f"{record.timestamp:.6f}\t{record.station}\t{DIRECTIONS[record.direction]}\t{record.frame}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an OCPP frame journal")
+    parser.add_argument("journal", nargs="+", help="journal files (one per worker)")
+    parser.add_argument("--url", default="ws://127.0.0.1:9000", help="central server websocket URL")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed factor; 0 sends as fast as possible")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="seconds a station waits for the answer to a call")
+    parser.add_argument("--dump", action="store_true", help="print the records instead of replaying")
+    args = parser.parse_args()
+    if args.dump:
+        try:
+            dump(args.journal)
+        except BrokenPipeError:
+            # Piped into head: stop quietly (and keep Python from
+            # complaining while flushing stdout on exit)
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    else:
+        print(json.dumps(asyncio.run(replay(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Microbenchmark of the stdlib and orjson JSON paths (see fast_json.py).
+
+Times, per operation, parsing and serialising a MeterValues frame through
+the ocpp codec and rendering a meter-history response of ``--readings``
+readings with JSONResponse and ORJSONResponse:
+
+    python3 json_benchmark.py --readings 1000 --samples 4
+"""
+import argparse
+import json
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from ocpp import messages
+
+import fast_json
+from meter_store import MeterStore, encode_cursor
+
+
+def meter_values_frame(samples):
+    return json.dumps([2, "6b3f1c1e-3a5e-4f0a-9a43-0d5a1c3f2e11", "MeterValues", {
+        "evseId": 1,
+        "meterValue": [{
+            "timestamp": "2026-10-18T10:00:00.123456+00:00",
+            "sampledValue": [{
+                "value": 1234.5 + i,
+                "measurand": "Energy.Active.Import.Register",
+                "unitOfMeasure": {"unit": "Wh", "multiplier": 0},
+            } for i in range(samples)],
+        }],
+    }], separators=(",", ":"))
+
+
+def meter_history(readings, samples):
+    store = MeterStore(max_samples=readings * samples)
+    for i in range(readings):
+        store.append("CP_1", 1, 1792317600.0 + 5 * i, [
+            (1000.0 + 100 * i + j, "Energy.Active.Import.Register", "Wh", 0)
+            for j in range(samples)])
+    page, last_id, has_more = store.page("CP_1")
+    return {
+        "station": "CP_1",
+        "readings": page,
+        "total_readings": len(page),
+        "next_cursor": None,
+        "latest_cursor": encode_cursor(last_id),
+    }
+
+
+def per_op_us(fn, seconds):
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(100):
+            fn()
+        count += 100
+        now = time.perf_counter()
+        if now >= deadline:
+            return (now - started) / count * 1e6
+
+
+def run(args):
+    frame = meter_values_frame(args.samples)
+    history = meter_history(args.readings, args.samples)
+    stdlib_unpack = messages.unpack
+    stdlib_to_json = messages.Call.to_json
+    call = stdlib_unpack(frame)
+
+    results = {"stdlib": {
+        "unpack_meter_values_us": per_op_us(lambda: stdlib_unpack(frame), args.seconds),
+        "pack_meter_values_us": per_op_us(lambda: stdlib_to_json(call), args.seconds),
+        "render_meter_history_us": per_op_us(lambda: JSONResponse(history), args.seconds),
+    }}
+    if fast_json.install_ocpp_codec():
+        results["orjson"] = {
+            "unpack_meter_values_us": per_op_us(lambda: messages.unpack(frame), args.seconds),
+            "pack_meter_values_us": per_op_us(lambda: call.to_json(), args.seconds),
+            "render_meter_history_us": per_op_us(lambda: ORJSONResponse(history), args.seconds),
+        }
+        results["speedup"] = {key: round(results["stdlib"][key] / value, 2)
+                              for key, value in results["orjson"].items()}
+    else:
+        results["orjson"] = "not installed (or FAST_JSON=off)"
+
+    for name in ("stdlib", "orjson"):
+        if isinstance(results[name], dict):
+            results[name] = {key: round(value, 2) for key, value in results[name].items()}
+    return {
+        "config": {"samples_per_meter_value": args.samples, "history_readings": args.readings,
+                   "frame_bytes": len(frame),
+                   "history_bytes": len(JSONResponse(history).body)},
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON codec microbenchmark")
+    parser.add_argument("--samples", type=int, default=4, help="sampled values per MeterValues")
+    parser.add_argument("--readings", type=int, default=1000, help="readings in the meter-history response")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per measurement")
+    print(json.dumps(run(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Deadline tracking for connected charge points.
+
+``TimerWheel`` keeps one bucket of keys per tick of ``tick`` seconds. A
+sign of life moves a station to the bucket of its new deadline (two set
+operations), and ``advance`` only looks at the buckets whose tick has
+passed, so a sweep costs O(expired stations) however many are connected.
+"""
+import time
+from typing import Callable, Dict, Hashable, List, Set
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.tick = tick
+        self._clock = clock
+        self._buckets: Dict[int, Set[Hashable]] = {}
+        self._due: Dict[Hashable, int] = {}
+        self._position = self._tick_of(clock())
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.tick)
+
+    def touch(self, key: Hashable, timeout: float):
+        """(Re)arm ``key`` to expire ``timeout`` seconds from now."""
+        due = max(self._tick_of(self._clock() + timeout), self._position + 1)
+        old = self._due.get(key)
+        if old == due:
+            return
+        if old is not None:
+            self._discard(key, old)
+        self._buckets.setdefault(due, set()).add(key)
+        self._due[key] = due
+
+    def remove(self, key: Hashable):
+        due = self._due.pop(key, None)
+        if due is not None:
+            self._discard(key, due)
+
+    def _discard(self, key, due):
+        bucket = self._buckets.get(due)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[due]
+
+    def advance(self) -> List[Hashable]:
+        """Keys whose deadline passed since the previous call."""
+        now = self._tick_of(self._clock())
+        expired = []
+        if now - self._position > len(self._buckets):
+            # Long gap (e.g. a stalled loop): walk the buckets, not the ticks
+            for due in sorted(due for due in self._buckets if due <= now):
+                expired.extend(self._buckets.pop(due))
+        else:
+            for due in range(self._position + 1, now + 1):
+                expired.extend(self._buckets.pop(due, ()))
+        self._position = max(self._position, now)
+        for key in expired:
+            del self._due[key]
+        return expired
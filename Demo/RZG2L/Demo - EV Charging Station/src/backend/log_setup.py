@@ -0,0 +1,167 @@
+"""
+Logging that keeps I/O off the calling thread.
+
+``setup_logging`` routes every record through a bounded queue to a
+background thread that formats and writes it, so a slow console, journald
+or eMMC never stalls the event loop. The message itself is rendered on the
+calling thread before it is queued, so arguments that change afterwards
+(a payload dict) are logged as they were; that only happens for records
+that pass the level and the filters, so pass arguments
+(``logger.info("x %s", payload)``) rather than building an f-string.
+Records that do not fit in the queue are dropped
+rather than blocking; ``dropped_records()`` counts them, and the total is
+reported when logging stops.
+
+``RateLimitFilter`` thins out per-message logs: each key (a station, a
+message template) gets a token bucket and optionally only every Nth record
+is kept. The next record that passes reports how many were suppressed. It
+can be called from several threads (e.g. the OCPP and REST event loops).
+
+This file is shared by the central server, the charging point client and
+the OTA lambda worker. Each is deployed from its own directory with no
+common package to import from, so each carries a copy; keep the copies
+identical (test_shared_modules checks it).
+"""
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Hashable, Optional
+
+DEFAULT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_exception_formatter = logging.Formatter()
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Queue records with their message rendered; drop (and count) them if the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock QueueHandler runs the whole formatter here. Only the
+        # parts that refer to the caller's objects are rendered: the message
+        # and the traceback. Time, level and layout are left to the handlers
+        # that write the record.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per-key token bucket (``rate`` records per second, bursts of ``burst``)
+    plus 1-in-``sample`` sampling. The key is ``key(record)``, else the
+    record's ``log_key`` attribute (``extra={"log_key": ...}``), else its
+    logger name and message template. Warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 10, sample: int = 1,
+                 key: Optional[Callable[[logging.LogRecord], Hashable]] = None,
+                 max_keys: int = 10000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = max(1, sample)
+        self.key = key
+        self.max_keys = max_keys
+        # key -> [tokens, last refill, records seen, suppressed since last pass]
+        self._state: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, record):
+        if self.key is not None:
+            return self.key(record)
+        return getattr(record, "log_key", None) or (record.name, record.msg)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = self._key(record)
+        with self._lock:
+            return self._filter(record, key)
+
+    def _filter(self, record, key):
+        now = time.monotonic()
+        state = self._state.get(key)
+        if state is None:
+            if len(self._state) >= self.max_keys:
+                self._state.clear()
+            state = self._state[key] = [float(self.burst), now, 0, 0]
+        state[2] += 1
+        if self.rate:
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+        if (state[2] - 1) % self.sample or state[0] < 1:
+            state[3] += 1
+            return False
+        state[0] -= 1
+        if state[3]:
+            suppressed, state[3] = state[3], 0
+            if isinstance(record.args, tuple) and record.args:
+                record.msg = f"{record.msg} (%d similar suppressed)"
+                record.args = tuple(record.args) + (suppressed,)
+            else:
+                record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        return True
+
+
+def first_arg_key(record: logging.LogRecord) -> Hashable:
+    """Key by message template and first argument, e.g. a charge point id."""
+    first = record.args[0] if isinstance(record.args, tuple) and record.args else None
+    return record.msg, first
+
+
+def dropped_records() -> int:
+    """Records dropped so far because the log queue was full."""
+    return sum(handler.dropped for handler in logging.getLogger().handlers
+               if isinstance(handler, BackgroundQueueHandler))
+
+
+def setup_logging(level: int = logging.INFO, fmt: str = DEFAULT_FORMAT, stream=None,
+                  queue_size: int = 10000) -> QueueListener:
+    """
+    Replace the root logger's handlers with a queue drained by a background
+    thread that writes to ``stream`` (stdout by default). The thread is
+    stopped, and the queue flushed, at interpreter exit; records dropped
+    along the way are then reported on ``stream``.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(fmt))
+
+    log_queue = queue.Queue(queue_size)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    queue_handler = BackgroundQueueHandler(log_queue)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+
+    def stop():
+        listener.stop()
+        if queue_handler.dropped:
+            # Straight to the stream: the listener is gone
+            handler.handle(logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "%d log records were dropped because the log queue was full",
+                (queue_handler.dropped,), None))
+
+    atexit.register(stop)
+    return listener
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from meter_store import Sample, columnar, paginate
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meter_values (
+    reading_id INTEGER NOT NULL,
+    station    TEXT    NOT NULL,
+    evse_id    INTEGER NOT NULL,
+    ts         REAL    NOT NULL,
+    value      REAL,
+    measurand  TEXT    NOT NULL,
+    unit       TEXT    NOT NULL,
+    multiplier INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_meter_values_station_evse_ts
+    ON meter_values (station, evse_id, ts);
+CREATE INDEX IF NOT EXISTS idx_meter_values_station_reading
+    ON meter_values (station, reading_id);
+CREATE INDEX IF NOT EXISTS idx_meter_values_ts
+    ON meter_values (ts);
+"""
+
+# Rows deleted per retention step (through the ts index)
+PRUNE_CHUNK = 10000
+
+ROW_COLUMNS = "reading_id, evse_id, ts, value, measurand, unit, multiplier"
+
+
+class MeterDatabase:
+    """
+    Durable meter history in SQLite (WAL mode).
+
+    ``enqueue`` only puts rows on an asyncio queue; ``run`` is a background
+    task that drains the queue and commits in batches, either when
+    ``batch_size`` rows are pending or ``flush_interval`` seconds have passed.
+    All disk I/O happens on a single worker thread that owns the connection.
+    With ``retention`` rows older than that are deleted hourly, a chunk
+    after each batch.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_pending: int = 100000, retention: Optional[float] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention = retention
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch: list = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meter-db")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> int:
+        """Create the schema and return the highest stored reading id."""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Worker processes share the file; wait for another writer's commit
+        # instead of failing with "database is locked".
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        row = self._conn.execute("SELECT MAX(reading_id) FROM meter_values").fetchone()
+        return row[0] or 0
+
+    def enqueue(self, cp_id: str, evse_id: int, timestamp: float,
+                samples: List[Sample], reading_id: int):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_pending)
+        for value, measurand, unit, multiplier in samples:
+            try:
+                self._queue.put_nowait((reading_id, cp_id, evse_id, timestamp,
+                                        value, measurand, unit, multiplier))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"Meter DB queue full, dropped {self.dropped} samples so far")
+
+    def _write(self, rows):
+        self._conn.executemany(
+            "INSERT INTO meter_values (reading_id, station, evse_id, ts, value, "
+            "measurand, unit, multiplier) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def _prune(self, cutoff: float) -> int:
+        """Delete up to PRUNE_CHUNK rows older than ``cutoff``; how many were deleted."""
+        deleted = self._conn.execute(
+            "DELETE FROM meter_values WHERE rowid IN "
+            "(SELECT rowid FROM meter_values WHERE ts < ? LIMIT ?)",
+            (cutoff, PRUNE_CHUNK)).rowcount
+        self._conn.commit()
+        return deleted
+
+    def _take_pending(self):
+        # Rows the writer has collected but not handed to the worker thread
+        # yet, plus anything still queued.
+        rows = self._batch[:]
+        self._batch.clear()
+        while self._queue is not None and not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _next_batch(self):
+        self._batch = batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            timeout = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._batch = []
+        return batch
+
+    async def run(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_pending)
+        loop = asyncio.get_running_loop()
+        last_prune = time.monotonic()
+        prune_cutoff = None
+        try:
+            while True:
+                batch = await self._next_batch()
+                if batch:
+                    await loop.run_in_executor(self._executor, self._write, batch)
+                if self.retention and prune_cutoff is None and \
+                        time.monotonic() - last_prune > 3600:
+                    last_prune = time.monotonic()
+                    prune_cutoff = time.time() - self.retention
+                if prune_cutoff is not None:
+                    # One chunk per batch, so inserts keep flowing while a
+                    # large backlog is pruned
+                    if await loop.run_in_executor(self._executor, self._prune,
+                                                  prune_cutoff) < PRUNE_CHUNK:
+                        prune_cutoff = None
+        except asyncio.CancelledError:
+            # Shutting down: write whatever is still pending synchronously.
+            pending = self._take_pending()
+            if pending:
+                self._executor.submit(self._write, pending).result()
+            raise
+
+    async def _query(self, fn, *args):
+        # Reads first commit rows that are still waiting for the writer, so
+        # a reading acknowledged to the charge point is always visible. The
+        # single worker thread keeps this ordered after any in-flight batch.
+        pending = self._take_pending()
+
+        def read():
+            if pending:
+                self._write(pending)
+            return fn(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, read)
+
+    def _stations(self):
+        return [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT station FROM meter_values ORDER BY station")]
+
+    def _has_station(self, cp_id):
+        return self._conn.execute(
+            "SELECT 1 FROM meter_values WHERE station = ? LIMIT 1", (cp_id,)).fetchone() is not None
+
+    def _rows(self, cp_id, after=0, start=None, end=None):
+        query = f"SELECT {ROW_COLUMNS} FROM meter_values WHERE station = ? AND reading_id > ?"
+        params = [cp_id, after]
+        if start is not None:
+            query += " AND ts >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND ts <= ?"
+            params.append(end)
+        # Ordered by the (station, reading_id) index, so rows stream lazily
+        # and a page stops reading as soon as it is full.
+        return self._conn.execute(query + " ORDER BY reading_id", params)
+
+    def _page(self, cp_id, after, start, end, limit):
+        return paginate(self._rows(cp_id, after, start, end), limit)
+
+    def _columnar_page(self, cp_id, after, start, end, limit):
+        return columnar(self._rows(cp_id, after, start, end), limit)
+
+    async def stations(self) -> List[str]:
+        return await self._query(self._stations)
+
+    async def has_station(self, cp_id: str) -> bool:
+        return await self._query(self._has_station, cp_id)
+
+    async def page(self, cp_id: str, after: int = 0, start: Optional[float] = None,
+                   end: Optional[float] = None, limit: Optional[int] = None):
+        return await self._query(self._page, cp_id, after, start, end, limit)
+
+    async def columnar_page(self, cp_id: str, after: int = 0, start: Optional[float] = None,
+                            end: Optional[float] = None, limit: Optional[int] = None):
+        return await self._query(self._columnar_page, cp_id, after, start, end, limit)
@@ -0,0 +1,137 @@
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from meter_store import Sample, format_timestamp
+
+# Bucket width in seconds and how many buckets are kept per series
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1m": (60, 1440),     # 1 day
+    "15m": (900, 672),    # 7 days
+    "1h": (3600, 720),    # 30 days
+}
+# A series without samples for this long has no bucket left in any resolution
+IDLE_EXPIRY_S = max(width * keep for width, keep in RESOLUTIONS.values())
+
+
+class Bucket:
+    __slots__ = ("start", "count", "min", "max", "total", "first", "last", "baseline")
+
+    def __init__(self, start: int, value: float, baseline: Optional[float]):
+        self.start = start
+        self.count = 1
+        self.min = self.max = self.total = self.first = self.last = value
+        # Last value of the previous bucket, so energy deltas of consecutive
+        # buckets add up to the total.
+        self.baseline = baseline
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+
+    def to_dict(self, with_energy: bool) -> dict:
+        bucket = {
+            "start": format_timestamp(self.start),
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count,
+            "last": self.last,
+        }
+        if with_energy:
+            base = self.first if self.baseline is None else self.baseline
+            bucket["energy_delta"] = self.last - base
+        return bucket
+
+
+class Series:
+    """Fixed-size rolling buckets for one station/EVSE/measurand."""
+
+    def __init__(self, unit: str):
+        self.unit = unit
+        self.buckets = {name: deque(maxlen=keep) for name, (_, keep) in RESOLUTIONS.items()}
+        # Server time of the last sample, for idle expiry
+        self.updated = time.time()
+
+    def add(self, timestamp: float, value: float):
+        self.updated = time.time()
+        for name, (width, _) in RESOLUTIONS.items():
+            buckets = self.buckets[name]
+            start = int(timestamp // width) * width
+            if buckets and buckets[-1].start == start:
+                buckets[-1].add(value)
+            elif not buckets or buckets[-1].start < start:
+                buckets.append(Bucket(start, value, buckets[-1].last if buckets else None))
+            else:
+                # Late sample: update its bucket if it is still retained.
+                for bucket in reversed(buckets):
+                    if bucket.start == start:
+                        bucket.add(value)
+                        break
+                    if bucket.start < start:
+                        break
+
+
+class MeterRollups:
+    """
+    Count/min/max/mean/last and energy delta per 1-minute, 15-minute and
+    1-hour bucket, updated as samples arrive. Values are scaled by their
+    multiplier. Serving a chart costs O(buckets) regardless of how many
+    samples went into them. Rollups live in memory and are rebuilt from
+    new samples after a restart. Series that received nothing for
+    IDLE_EXPIRY_S are dropped by ``expire``, a deregistered station's by
+    ``remove``.
+    """
+
+    def __init__(self):
+        self._series: Dict[str, Dict[Tuple[int, str], Series]] = {}
+
+    def add(self, cp_id: str, evse_id: int, timestamp: float, samples: List[Sample]):
+        station = self._series.setdefault(cp_id, {})
+        for value, measurand, unit, multiplier in samples:
+            if math.isnan(value):
+                continue
+            series = station.get((evse_id, measurand))
+            if series is None:
+                series = station[(evse_id, measurand)] = Series(unit)
+            series.add(timestamp, value * 10 ** multiplier if multiplier else value)
+
+    def expire(self, now: Optional[float] = None):
+        cutoff = (time.time() if now is None else now) - IDLE_EXPIRY_S
+        for cp_id, station in list(self._series.items()):
+            for key in [key for key, series in station.items() if series.updated < cutoff]:
+                del station[key]
+            if not station:
+                del self._series[cp_id]
+
+    def remove(self, cp_id: str):
+        self._series.pop(cp_id, None)
+
+    def __len__(self):
+        return sum(len(station) for station in self._series.values())
+
+    def query(self, cp_id: str, resolution: str, measurand: Optional[str] = None,
+              start: Optional[float] = None, end: Optional[float] = None) -> List[dict]:
+        width = RESOLUTIONS[resolution][0]
+        result = []
+        for (evse_id, name), series in self._series.get(cp_id, {}).items():
+            if measurand is not None and name != measurand:
+                continue
+            with_energy = name.startswith("Energy.")
+            result.append({
+                "evse_id": evse_id,
+                "measurand": name,
+                "unit": series.unit,
+                "buckets": [
+                    bucket.to_dict(with_energy) for bucket in series.buckets[resolution]
+                    if (start is None or bucket.start + width > start)
+                    and (end is None or bucket.start <= end)
+                ],
+            })
+        return result
@@ -0,0 +1,420 @@
+import base64
+import math
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# (value, measurand, unit, multiplier) as received in a SampledValue
+Sample = Tuple[float, str, str, int]
+
+
+def parse_timestamp(value) -> float:
+    """Convert an OCPP timestamp (ISO 8601 string) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        text = str(value)
+        if text.endswith("Z"):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def format_timestamp(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class StringTable:
+    """Interns measurand and unit strings to small integer codes."""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def code(self, text: str) -> int:
+        code = self._codes.get(text)
+        if code is None:
+            code = len(self._strings)
+            self._codes[text] = code
+            self._strings.append(text)
+        return code
+
+    def string(self, code: int) -> str:
+        return self._strings[code]
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class StationBuffer:
+    """
+    Ring buffer of sampled values for one charge point.
+
+    Every row is one SampledValue. Rows that arrived in the same MeterValue
+    share a reading id, which is how readings are rebuilt on the way out.
+    The columns grow on demand up to ``capacity`` and are then overwritten
+    oldest first.
+
+    ``arrived`` holds the server time each row was stored at. Age eviction
+    goes by it rather than by the station's timestamp: a station whose clock
+    is behind, or one forwarding a spooled backlog, sends old timestamps,
+    and those are in no particular order along the buffer.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.reading_id = array("q")
+        self.evse_id = array("H")
+        self.timestamp = array("d")
+        self.value = array("d")
+        self.measurand = array("H")
+        self.unit = array("H")
+        self.multiplier = array("h")
+        self.arrived = array("d")
+
+    def _columns(self):
+        return (self.reading_id, self.evse_id, self.timestamp, self.value,
+                self.measurand, self.unit, self.multiplier, self.arrived)
+
+    def _compact(self):
+        # Rotate the columns so the oldest row sits at index 0 again. Only
+        # needed when age eviction freed rows before the buffer was fully
+        # allocated, so it is rare.
+        end = self.start + self.size
+        for column in self._columns():
+            rotated = column[self.start:end] if end <= len(column) else \
+                column[self.start:] + column[:end - len(column)]
+            del column[:]
+            column.extend(rotated)
+        self.start = 0
+
+    def append(self, row: tuple):
+        allocated = len(self.timestamp)
+        if self.size < allocated:
+            index = (self.start + self.size) % allocated
+            self.size += 1
+        elif allocated < self.capacity:
+            if self.start:
+                self._compact()
+            for column, item in zip(self._columns(), row):
+                column.append(item)
+            self.size += 1
+            return
+        else:
+            # Full: overwrite the oldest row.
+            index = self.start
+            self.start = (self.start + 1) % allocated
+        for column, item in zip(self._columns(), row):
+            column[index] = item
+
+    def evict_older_than(self, cutoff: float):
+        """Drop the rows stored before ``cutoff`` (server time)."""
+        allocated = len(self.timestamp)
+        while self.size and self.arrived[self.start] < cutoff:
+            self.start = (self.start + 1) % allocated
+            self.size -= 1
+        if not self.size:
+            self.start = 0
+
+    def first_row(self, after_reading_id: int = 0) -> int:
+        """
+        Position (0 = oldest) of the first row after ``after_reading_id``.
+        Reading ids only grow, so it is found by bisection instead of a scan.
+        """
+        allocated = len(self.timestamp)
+        lo, hi = 0, self.size
+        while after_reading_id and lo < hi:
+            mid = (lo + hi) // 2
+            if self.reading_id[(self.start + mid) % allocated] <= after_reading_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def rows(self, after_reading_id: int = 0) -> Iterator[int]:
+        """Yield physical row indexes from oldest to newest, starting after ``after_reading_id``."""
+        allocated = len(self.timestamp)
+        for offset in range(self.first_row(after_reading_id), self.size):
+            yield (self.start + offset) % allocated
+
+    def arrays(self, first: int = 0) -> List[np.ndarray]:
+        """
+        The columns from position ``first`` on, oldest first, as NumPy
+        arrays (all but ``arrived``). They are copies, so the buffer can
+        grow again while they are in use.
+        """
+        allocated = len(self.timestamp)
+        begin = self.start + first
+        end = self.start + self.size
+        result = []
+        for column in self._columns()[:-1]:
+            data = np.frombuffer(column, dtype=column.typecode)
+            if end <= allocated:
+                result.append(data[begin:end].copy())
+            else:
+                result.append(np.concatenate((data[begin:] if begin < allocated else data[:0],
+                                              data[max(0, begin - allocated):end - allocated])))
+        return result
+
+
+class MeterStore:
+    """
+    Per-station meter history with retention by sample count and by age.
+
+    Timestamps and values are kept in typed arrays and measurand/unit strings
+    are interned, so one sample costs a few dozen bytes instead of a dict.
+
+    Reading ids count up from 1. When several processes share one database
+    (``id_stride`` > 1) ids are derived from the clock instead and each
+    process only hands out ids congruent to ``id_offset``, so ids never
+    collide and keep growing when a station moves to another process.
+    """
+
+    def __init__(self, max_samples: int = 17280, max_age: Optional[float] = 86400,
+                 id_stride: int = 1, id_offset: int = 0):
+        self.max_samples = max_samples
+        self.max_age = max_age
+        self.id_stride = id_stride
+        self.id_offset = id_offset
+        self.strings = StringTable()
+        self._buffers: Dict[str, StationBuffer] = {}
+        self._next_reading_id = self._align(1)
+
+    def _align(self, reading_id: int) -> int:
+        # Smallest id >= reading_id that belongs to this process
+        return reading_id + (self.id_offset - reading_id) % self.id_stride
+
+    def resume_reading_ids(self, last_reading_id: int):
+        """Continue numbering after ids already handed out, e.g. persisted ones."""
+        self._next_reading_id = max(self._next_reading_id, self._align(last_reading_id + 1))
+
+    def __contains__(self, cp_id):
+        buffer = self._buffers.get(cp_id)
+        return buffer is not None and buffer.size > 0
+
+    def stations(self) -> List[str]:
+        return [cp_id for cp_id, buffer in self._buffers.items() if buffer.size]
+
+    def sample_count(self, cp_id: str) -> int:
+        buffer = self._buffers.get(cp_id)
+        return buffer.size if buffer else 0
+
+    def append(self, cp_id: str, evse_id: int, timestamp: float,
+               samples: List[Sample]) -> int:
+        """Store one MeterValue and return its reading id."""
+        buffer = self._buffers.get(cp_id)
+        if buffer is None:
+            buffer = self._buffers[cp_id] = StationBuffer(self.max_samples)
+
+        reading_id = self._next_reading_id
+        if self.id_stride > 1:
+            reading_id = max(reading_id, self._align(int(time.time() * 1e6) * self.id_stride))
+        self._next_reading_id = reading_id + self.id_stride
+        code = self.strings.code
+        now = time.time()
+        for value, measurand, unit, multiplier in samples:
+            buffer.append((reading_id, evse_id, timestamp, value,
+                           code(measurand), code(unit), multiplier, now))
+
+        if self.max_age:
+            buffer.evict_older_than(now - self.max_age)
+        return reading_id
+
+    def expire(self):
+        """Apply age retention to every station, including idle ones."""
+        if not self.max_age:
+            return
+        cutoff = time.time() - self.max_age
+        for buffer in self._buffers.values():
+            buffer.evict_older_than(cutoff)
+
+    def iter_rows(self, cp_id: str, after: int = 0, start: Optional[float] = None,
+                  end: Optional[float] = None) -> Iterator[tuple]:
+        """
+        Yield (reading_id, evse_id, timestamp, value, measurand, unit,
+        multiplier) rows for a station, oldest first, read straight from the
+        columns. ``after`` skips readings up to and including that id;
+        ``start``/``end`` bound the sample timestamp (inclusive).
+        """
+        buffer = self._buffers.get(cp_id)
+        if buffer is None:
+            return
+        string = self.strings.string
+        for i in buffer.rows(after):
+            ts = buffer.timestamp[i]
+            if (start is not None and ts < start) or (end is not None and ts > end):
+                continue
+            yield (buffer.reading_id[i], buffer.evse_id[i], ts,
+                   buffer.value[i], string(buffer.measurand[i]),
+                   string(buffer.unit[i]), buffer.multiplier[i])
+
+    def page(self, cp_id: str, after: int = 0, start: Optional[float] = None,
+             end: Optional[float] = None, limit: Optional[int] = None):
+        return paginate(self.iter_rows(cp_id, after, start, end), limit)
+
+    def columnar_page(self, cp_id: str, after: int = 0, start: Optional[float] = None,
+                      end: Optional[float] = None, limit: Optional[int] = None):
+        """
+        ``columnar`` for one station, computed with array operations on the
+        stored columns instead of row by row.
+        """
+        buffer = self._buffers.get(cp_id)
+        if buffer is None or not buffer.size:
+            return [], 0, 0, False
+        columns = buffer.arrays(buffer.first_row(after))
+        timestamp = columns[2]
+        if start is not None or end is not None:
+            keep = np.ones(len(timestamp), dtype=bool)
+            if start is not None:
+                keep &= timestamp >= start
+            if end is not None:
+                keep &= timestamp <= end
+            columns = [column[keep] for column in columns]
+        reading_id, evse_id, timestamp, value, measurand, unit, multiplier = columns
+        if not len(reading_id):
+            return [], 0, 0, False
+
+        # Rows of one reading are adjacent: a reading starts where the id changes
+        starts = np.flatnonzero(np.diff(reading_id)) + 1
+        readings = len(starts) + 1
+        has_more = limit is not None and readings > limit
+        if has_more:
+            readings = limit
+            cut = starts[limit - 1]
+            reading_id, evse_id, timestamp, value, measurand, unit, multiplier = (
+                column[:cut] for column in (reading_id, evse_id, timestamp, value,
+                                            measurand, unit, multiplier))
+
+        key = ((evse_id.astype(np.int64) << 48) | (measurand.astype(np.int64) << 32)
+               | (unit.astype(np.int64) << 16) | (multiplier.astype(np.int64) & 0xFFFF))
+        _, first_rows, group = np.unique(key, return_index=True, return_inverse=True)
+        series = []
+        # Series in the order their first sample arrived
+        for index in np.argsort(first_rows):
+            first = first_rows[index]
+            rows = group == index
+            values = value[rows]
+            series.append({
+                "evse_id": int(evse_id[first]),
+                "measurand": self.strings.string(int(measurand[first])),
+                "unit": self.strings.string(int(unit[first])),
+                "multiplier": int(multiplier[first]),
+                "timestamps": timestamp[rows].tolist(),
+                # NaN is not valid JSON
+                "values": [None if v != v else v for v in values.tolist()]
+                if np.isnan(values).any() else values.tolist(),
+            })
+        return series, readings, int(reading_id[-1]), has_more
+
+
+def sample_dict(value, measurand, unit, multiplier) -> dict:
+    return {
+        "value": "N/A" if value is None or math.isnan(value) else value,
+        "measurand": measurand,
+        "unit": unit,
+        "multiplier": multiplier,
+    }
+
+
+def group_rows(rows) -> Iterator[Tuple[int, dict]]:
+    """
+    Rebuild readings in the shape the REST API has always returned from
+    sample rows. Rows sharing a reading id are merged into one reading,
+    which is yielded together with that id.
+    """
+    reading = None
+    current_id = None
+    for reading_id, evse_id, timestamp, value, measurand, unit, multiplier in rows:
+        if reading_id != current_id:
+            if reading is not None:
+                yield current_id, reading
+            current_id = reading_id
+            reading = {
+                "evse_id": evse_id,
+                "timestamp": format_timestamp(timestamp),
+                "sampled_values": [],
+            }
+        reading["sampled_values"].append(sample_dict(value, measurand, unit, multiplier))
+    if reading is not None:
+        yield current_id, reading
+
+
+def paginate(rows, limit: Optional[int] = None) -> Tuple[List[dict], int, bool]:
+    """
+    Group rows into at most ``limit`` readings. Returns the readings, the id
+    of the last one returned (0 if none) and whether more readings follow.
+    Rows are consumed lazily, so a page never reads past ``limit + 1``
+    readings.
+    """
+    readings = []
+    last_id = 0
+    for reading_id, reading in group_rows(rows):
+        if limit is not None and len(readings) >= limit:
+            return readings, last_id, True
+        readings.append(reading)
+        last_id = reading_id
+    return readings, last_id, False
+
+
+def columnar(rows, limit: Optional[int] = None) -> Tuple[List[dict], int, int, bool]:
+    """
+    Like ``paginate``, but as one series per (evse_id, measurand, unit,
+    multiplier) holding parallel lists of timestamps (epoch seconds) and
+    values (None where the value was not a number). Returns the series, the
+    number of readings, the id of the last one and whether more readings
+    follow.
+    """
+    series: Dict[tuple, Tuple[list, list]] = {}
+    readings = 0
+    last_id = 0
+    has_more = False
+    for reading_id, evse_id, timestamp, value, measurand, unit, multiplier in rows:
+        if reading_id != last_id:
+            if limit is not None and readings >= limit:
+                has_more = True
+                break
+            readings += 1
+            last_id = reading_id
+        key = (evse_id, measurand, unit, multiplier)
+        columns = series.get(key)
+        if columns is None:
+            columns = series[key] = ([], [])
+        columns[0].append(timestamp)
+        # NaN is not valid JSON
+        columns[1].append(value if value == value else None)
+    result = [{
+        "evse_id": evse_id,
+        "measurand": measurand,
+        "unit": unit,
+        "multiplier": multiplier,
+        "timestamps": timestamps,
+        "values": values,
+    } for (evse_id, measurand, unit, multiplier), (timestamps, values) in series.items()]
+    return result, readings, last_id, has_more
+
+
+def encode_cursor(reading_id: int) -> str:
+    return base64.urlsafe_b64encode(f"r:{reading_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the reading id in a cursor, raising ValueError if it is malformed."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, reading_id = text.split(":", 1)
+        if prefix != "r":
+            raise ValueError
+        return int(reading_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
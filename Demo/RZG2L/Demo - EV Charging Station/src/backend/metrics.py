@@ -0,0 +1,160 @@
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from sub-millisecond handlers to call timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(Metric):
+    """Incremented directly, or read from ``function`` (like Gauge) at scrape time."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), function: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+        self.function = function
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        values = self._values
+        if self.function is not None:
+            result = self.function()
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in list(values.items()):
+            yield self.name, self.labels(key), value
+
+
+class Gauge(Metric):
+    """A value that is set directly, or read from ``function`` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), function: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+        # Returns a number, or a {label tuple: number} dict for labelled gauges
+        self.function = function
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        values = self._values
+        if self.function is not None:
+            result = self.function()
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in list(values.items()):
+            yield self.name, self.labels(key), value
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram. ``observe`` is a bisection and two additions on
+    plain lists; cumulative counts are only computed when scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        # Per label tuple: [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+        series[0][bisect_left(self.bounds, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        # Copied: the series may be observed from another thread while scraped
+        for key, (counts, total) in list(self._series.items()):
+            labels = self.labels(key)
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                yield self.name + "_bucket", {**labels, "le": format_value(bound)}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None):
+        self.const_labels = const_labels or {}
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), function=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, function))
+
+    def gauge(self, name, help, labelnames=(), function=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, function))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collect(self) -> List[dict]:
+        """JSON-serialisable snapshot, so other processes can be merged in."""
+        return [{
+            "name": metric.name,
+            "type": metric.kind,
+            "help": metric.help,
+            "samples": [[name, {**self.const_labels, **labels}, value]
+                        for name, labels, value in metric.samples()],
+        } for metric in self._metrics]
+
+
+def render(*collections: List[dict]) -> str:
+    """Prometheus text exposition of one or more ``Registry.collect()`` results."""
+    families: Dict[str, dict] = {}
+    for collection in collections:
+        for family in collection:
+            merged = families.setdefault(family["name"], {**family, "samples": []})
+            merged["samples"].extend(family["samples"])
+    lines = []
+    for family in families.values():
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family["samples"]:
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
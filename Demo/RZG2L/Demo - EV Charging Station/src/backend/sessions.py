@@ -0,0 +1,174 @@
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from meter_store import Sample, format_timestamp
+
+ENERGY_MEASURAND = "Energy.Active.Import.Register"
+POWER_MEASURAND = "Power.Active.Import"
+
+
+def to_base_unit(value: float, unit: str, multiplier: int) -> float:
+    """Wh or W, from a sampled value in Wh/kWh or W/kW with a power-of-ten multiplier."""
+    if multiplier:
+        value *= 10 ** multiplier
+    if unit in ("kWh", "kW"):
+        value *= 1000
+    return value
+
+
+class Session:
+    __slots__ = ("station", "evse_id", "transaction_id", "remote_start_id", "started_at",
+                 "ended_at", "start_register", "register", "register_time", "power",
+                 "peak_power", "power_measured", "samples")
+
+    def __init__(self, station: str, evse_id: int, transaction_id: str, started_at: float,
+                 remote_start_id: Optional[int] = None):
+        self.station = station
+        self.evse_id = evse_id
+        self.transaction_id = transaction_id
+        self.remote_start_id = remote_start_id
+        self.started_at = started_at
+        self.ended_at: Optional[float] = None
+        # Energy register (Wh) at the start (the Started TransactionEvent's,
+        # else the first sample's) and at the latest sample, and when the
+        # latest was taken; power in W
+        self.start_register: Optional[float] = None
+        self.register: Optional[float] = None
+        self.register_time: Optional[float] = None
+        self.power: Optional[float] = None
+        self.peak_power: Optional[float] = None
+        # Set once the station reports Power.Active.Import; until then power
+        # is derived from the energy register
+        self.power_measured = False
+        self.samples = 0
+
+    def add(self, timestamp: float, samples: List[Sample], started: bool = False):
+        """``started``: the meter value of the transaction's Started event."""
+        measured_power = None
+        for value, measurand, unit, multiplier in samples:
+            if math.isnan(value):
+                continue
+            if measurand == ENERGY_MEASURAND:
+                self._add_register(timestamp, to_base_unit(value, unit, multiplier), started)
+            elif measurand == POWER_MEASURAND:
+                measured_power = to_base_unit(value, unit, multiplier)
+        if measured_power is not None:
+            self.power_measured = True
+            self._set_power(measured_power)
+        self.samples += 1
+
+    def _add_register(self, timestamp: float, register: float, started: bool = False):
+        if started or self.start_register is None:
+            # Also when meter values of the session arrived before the event
+            self.start_register = register
+        elif not self.power_measured and timestamp > self.register_time:
+            # Average power since the previous sample
+            self._set_power((register - self.register) * 3600 / (timestamp - self.register_time))
+        if self.register_time is None or timestamp >= self.register_time:
+            self.register = register
+            self.register_time = timestamp
+
+    def _set_power(self, power: float):
+        self.power = power
+        if self.peak_power is None or power > self.peak_power:
+            self.peak_power = power
+
+    @property
+    def energy_wh(self) -> float:
+        if self.start_register is None:
+            return 0.0
+        return self.register - self.start_register
+
+    def to_dict(self) -> dict:
+        end = self.ended_at if self.ended_at is not None else time.time()
+        return {
+            "station": self.station,
+            "evse_id": self.evse_id,
+            "transaction_id": self.transaction_id,
+            "remote_start_id": self.remote_start_id,
+            "active": self.ended_at is None,
+            "started_at": format_timestamp(self.started_at),
+            "ended_at": format_timestamp(self.ended_at) if self.ended_at is not None else None,
+            "duration_s": round(end - self.started_at, 3),
+            "start_register_wh": self.start_register,
+            "end_register_wh": self.register,
+            "energy_kwh": self.energy_wh / 1000,
+            "power_w": self.power,
+            "peak_power_w": self.peak_power,
+            "samples": self.samples,
+        }
+
+
+class SessionTracker:
+    """
+    Charging sessions per station, EVSE and transaction, updated as meter
+    values arrive: each sample adjusts the session's totals in place, so
+    listing sessions never walks the meter history. Completed sessions are
+    kept, newest last, up to ``history``.
+    """
+
+    def __init__(self, history: int = 1000):
+        self._active: Dict[Tuple[str, int], Session] = {}
+        self._by_transaction: Dict[Tuple[str, str], Session] = {}
+        self._completed: deque = deque(maxlen=history)
+
+    def start(self, station: str, evse_id: int, transaction_id: str,
+              started_at: Optional[float] = None, remote_start_id: Optional[int] = None) -> Session:
+        """
+        Open a session. An EVSE that already has one for this transaction
+        keeps it; one for another transaction is ended (the station started
+        a new one, so the old one is over).
+        """
+        session = self._active.get((station, evse_id))
+        if session is not None and session.transaction_id != transaction_id:
+            self.end(session, started_at)
+            session = None
+        if session is None:
+            session = Session(station, evse_id, transaction_id,
+                              started_at if started_at is not None else time.time(), remote_start_id)
+            self._active[(station, evse_id)] = session
+            self._by_transaction[(station, transaction_id)] = session
+        return session
+
+    def rename(self, session: Session, transaction_id: str):
+        """Adopt the id the station assigned to a transaction we started."""
+        self._by_transaction.pop((session.station, session.transaction_id), None)
+        session.transaction_id = transaction_id
+        self._by_transaction[(session.station, transaction_id)] = session
+
+    def active(self, station: str, evse_id: Optional[int] = None) -> Optional[Session]:
+        if evse_id is not None:
+            return self._active.get((station, evse_id))
+        return next((s for (cp_id, _), s in self._active.items() if cp_id == station), None)
+
+    def transaction(self, station: str, transaction_id: str) -> Optional[Session]:
+        return self._by_transaction.get((station, transaction_id))
+
+    def add(self, station: str, evse_id: int, timestamp: float, samples: List[Sample]):
+        session = self._active.get((station, evse_id))
+        if session is not None:
+            session.add(timestamp, samples)
+
+    def end(self, session: Session, ended_at: Optional[float] = None) -> Session:
+        if session.ended_at is None:
+            session.ended_at = ended_at if ended_at is not None else time.time()
+            self._active.pop((session.station, session.evse_id), None)
+            self._by_transaction.pop((session.station, session.transaction_id), None)
+            self._completed.append(session)
+        return session
+
+    def active_sessions(self, station: Optional[str] = None) -> List[dict]:
+        return [session.to_dict() for session in self._active.values()
+                if station is None or session.station == station]
+
+    def completed_sessions(self, station: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Newest first."""
+        result = []
+        for session in reversed(self._completed):
+            if len(result) >= limit:
+                break
+            if station is None or session.station == station:
+                result.append(session.to_dict())
+        return result
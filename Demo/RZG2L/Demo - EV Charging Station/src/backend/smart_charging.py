@@ -0,0 +1,98 @@
+"""
+Site-level smart charging: share a site power limit between the EVSEs that
+are charging.
+
+``allocate`` is a weighted water-filling over NumPy arrays: every EVSE gets
+a share of the remaining power in proportion to its priority, EVSEs whose
+share exceeds their maximum are capped, and what they leave is shared
+again between the others. Each round is a handful of array operations over
+all EVSEs and the number of rounds is bounded by the number of distinct
+caps, so a site of thousands of EVSEs is solved in milliseconds.
+
+``SiteAllocator.plan`` turns an allocation into the profile pushes that
+are actually needed, since the last accepted push to the same transaction
+(a profile does not carry over to the next session on the EVSE): every
+decrease, but only increases larger than the deadband. A station keeps a
+lower limit than its share until then, so what the stations enforce never
+adds up to more than the site limit.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+EvseKey = Tuple[str, int]
+
+
+def allocate(site_limit: float, max_power: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Per-EVSE power (same unit as ``site_limit``), at most ``max_power`` each."""
+    allocation = np.zeros(len(max_power))
+    open_ = (max_power > 0) & (weights > 0)
+    remaining = float(site_limit)
+    while remaining > 1e-9 and open_.any():
+        share = np.zeros_like(allocation)
+        share[open_] = remaining * weights[open_] / weights[open_].sum()
+        headroom = max_power - allocation
+        capped = open_ & (share >= headroom)
+        if not capped.any():
+            allocation += share
+            break
+        # Fill the capped EVSEs up to their maximum and share the rest again
+        allocation[capped] = max_power[capped]
+        remaining -= headroom[capped].sum()
+        open_ &= ~capped
+    return allocation
+
+
+class SiteAllocator:
+    def __init__(self, site_limit_kw: float = 0.0, station_max_kw: float = 22.0,
+                 deadband_kw: float = 0.5):
+        # site_limit_kw 0 disables the allocator
+        self.site_limit_kw = site_limit_kw
+        self.station_max_kw = station_max_kw
+        self.deadband_kw = deadband_kw
+        # Limit last accepted by each EVSE and the transaction it was for
+        self.pushed: Dict[EvseKey, Tuple[float, Optional[str]]] = {}
+
+    def plan(self, evses: List[EvseKey], stations: Dict[str, dict],
+             transactions: Optional[Dict[EvseKey, str]] = None):
+        """
+        Allocation ({evse: kW}) for the charging ``evses`` and the pushes
+        it needs ([(station, evse_id, kW)]). ``stations`` holds optional
+        per-station settings: ``max_kw`` (per EVSE) and ``priority``
+        (weight, default 1); ``transactions`` the running transaction of
+        each EVSE.
+        """
+        transactions = transactions or {}
+        charging = set(evses)
+        for key in [key for key in self.pushed
+                    if key not in charging or self.pushed[key][1] != transactions.get(key)]:
+            # Not charging any more, or another session: push again
+            del self.pushed[key]
+        if not evses:
+            return {}, []
+        max_power = np.array([stations.get(cp_id, {}).get("max_kw", self.station_max_kw)
+                              for cp_id, _ in evses], dtype=float)
+        weights = np.array([stations.get(cp_id, {}).get("priority", 1.0)
+                            for cp_id, _ in evses], dtype=float)
+        # Rounded down to watts so the sum never exceeds the site limit
+        limits = np.floor(allocate(self.site_limit_kw, max_power, weights) * 1000) / 1000
+
+        previous = np.array([self.pushed[key][0] if key in self.pushed else np.nan
+                             for key in evses])
+        decreased = limits < previous
+        changed = np.isnan(previous) | decreased | (limits - previous > self.deadband_kw)
+        # Decreases first, to free the power the increases take
+        order = np.flatnonzero(changed)
+        order = order[np.argsort(~decreased[order], kind="stable")]
+        pushes = [(evses[i][0], evses[i][1], float(limits[i])) for i in order]
+        return dict(zip(evses, limits.tolist())), pushes
+
+    def accepted(self, cp_id: str, evse_id: int, limit_kw: float,
+                 transaction_id: Optional[str] = None):
+        self.pushed[(cp_id, evse_id)] = (limit_kw, transaction_id)
+
+    def forget(self, cp_id: str, evse_id: Optional[int] = None):
+        """The EVSE (all of the station's if ``evse_id`` is None) got a profile from elsewhere."""
+        for key in [key for key in self.pushed
+                    if key[0] == cp_id and evse_id in (None, key[1])]:
+            del self.pushed[key]
@@ -0,0 +1,127 @@
+"""
+Registered and connected charge points, indexed for the admin listings.
+
+Besides the registration of each station (as sent in its BootNotification
+plus its availability status) the registry keeps a set of station ids per
+status, model, vendor and connection state. Those sets are updated as
+stations boot, change availability, connect and disconnect, so a filtered
+listing intersects a few sets instead of scanning every station.
+
+``etag`` changes whenever anything a listing shows changes; it starts
+from a random generation so ETags from before a restart never match.
+"""
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+INDEXED_FIELDS = ("status", "model", "vendor", "connected")
+
+
+class StationRegistry:
+    def __init__(self):
+        self._stations: Dict[str, dict] = {}
+        # Connected station ids in connection order, registered or not
+        self._connected: Dict[str, None] = {}
+        self._index: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in INDEXED_FIELDS}
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self.generation = uuid.uuid4().hex[:8]
+        self.version = 0
+
+    def __len__(self):
+        return len(self._stations)
+
+    def __contains__(self, cp_id):
+        return cp_id in self._stations
+
+    @property
+    def etag(self) -> str:
+        return f"{self.generation}.{self.version}"
+
+    @property
+    def connected(self) -> List[str]:
+        return list(self._connected)
+
+    def get(self, cp_id: str) -> Optional[dict]:
+        info = self._stations.get(cp_id)
+        return self._entry(cp_id, info) if info is not None else None
+
+    def status(self, cp_id: str, default: str = "Operative") -> str:
+        return self._stations.get(cp_id, {}).get("status", default)
+
+    def register(self, cp_id: str, charging_station: dict, reason: str, status: str = "Operative"):
+        self._stations[cp_id] = {
+            "id": cp_id,
+            "charging_station": charging_station,
+            "reason": reason,
+            "status": status,
+        }
+        self._reindex(cp_id)
+
+    def remove(self, cp_id: str) -> bool:
+        """Forget a registered station; False if it was not registered."""
+        if self._stations.pop(cp_id, None) is None:
+            return False
+        for field, value in self._keys.pop(cp_id, {}).items():
+            members = self._index[field].get(value)
+            if members is not None:
+                members.discard(cp_id)
+                if not members:
+                    del self._index[field][value]
+        self.version += 1
+        return True
+
+    def set_status(self, cp_id: str, status: str):
+        info = self._stations.get(cp_id)
+        if info is not None and info["status"] != status:
+            info["status"] = status
+            self._reindex(cp_id)
+
+    def connect(self, cp_id: str):
+        if cp_id not in self._connected:
+            self._connected[cp_id] = None
+            self._reindex(cp_id)
+
+    def disconnect(self, cp_id: str):
+        if cp_id in self._connected:
+            del self._connected[cp_id]
+            self._reindex(cp_id)
+
+    def select(self, status: Optional[str] = None, model: Optional[str] = None,
+               vendor: Optional[str] = None, connected: Optional[bool] = None) -> List[dict]:
+        """Registered stations matching every given filter."""
+        filters = {"status": status, "model": model, "vendor": vendor, "connected": connected}
+        sets = [self._index[field].get(value, set())
+                for field, value in filters.items() if value is not None]
+        if not sets:
+            ids = self._stations
+        else:
+            sets.sort(key=len)
+            ids = sets[0].intersection(*sets[1:])
+        return [self._entry(cp_id, self._stations[cp_id]) for cp_id in ids]
+
+    def _entry(self, cp_id, info):
+        return {**info, "connected": cp_id in self._connected}
+
+    def _reindex(self, cp_id):
+        self.version += 1
+        info = self._stations.get(cp_id)
+        if info is None:
+            return
+        charging_station = info.get("charging_station") or {}
+        keys = {
+            "status": info["status"],
+            "model": charging_station.get("model"),
+            "vendor": charging_station.get("vendor_name"),
+            "connected": cp_id in self._connected,
+        }
+        old = self._keys.get(cp_id, {})
+        for field, value in keys.items():
+            if field in old and old[field] == value:
+                continue
+            if field in old:
+                members = self._index[field].get(old[field])
+                if members is not None:
+                    members.discard(cp_id)
+                    if not members:
+                        del self._index[field][old[field]]
+            self._index[field].setdefault(value, set()).add(cp_id)
+        self._keys[cp_id] = keys
@@ -0,0 +1,106 @@
+"""
+Charging profile pushes across transactions:
+
+    python3 -m unittest test_charging_profiles
+"""
+import itertools
+import unittest
+
+from ocpp.v201 import call, call_result
+
+import central_server
+from smart_charging import SiteAllocator
+
+station_ids = itertools.count(1)
+
+
+class FakeChargePoint:
+    """Answers every call like the demo charge point and records them."""
+
+    def __init__(self):
+        self.id = f"TEST_{next(station_ids)}"
+        self.profiles = {}
+        self.calls = []
+        self.transactions = itertools.count(1)
+        self.answer = True
+
+    async def call(self, payload):
+        self.calls.append(payload)
+        if not self.answer:
+            # What ocpp returns for a suppressed CallError
+            return None
+        if isinstance(payload, call.RequestStartTransactionPayload):
+            return call_result.RequestStartTransactionPayload(
+                status="Accepted", transaction_id=f"{self.id}-{next(self.transactions)}")
+        if isinstance(payload, call.RequestStopTransactionPayload):
+            return call_result.RequestStopTransactionPayload(status="Accepted")
+        return call_result.SetChargingProfilePayload(status="Accepted")
+
+    def profiles_sent(self):
+        return [payload for payload in self.calls
+                if isinstance(payload, call.SetChargingProfilePayload)]
+
+
+class ChangeProfileTest(unittest.IsolatedAsyncioTestCase):
+    async def test_same_limit_is_skipped_within_a_transaction(self):
+        cp = FakeChargePoint()
+        await central_server.command_start(cp, {"evse_id": 1})
+        body = {"evse_id": 1, "meter_rate_kw": 11}
+        self.assertEqual(await central_server.command_change_profile(cp, body), {"status": "Accepted"})
+        self.assertTrue((await central_server.command_change_profile(cp, body))["unchanged"])
+        self.assertEqual(len(cp.profiles_sent()), 1)
+
+    async def test_same_limit_is_sent_to_the_next_transaction(self):
+        cp = FakeChargePoint()
+        body = {"evse_id": 1, "meter_rate_kw": 11}
+        await central_server.command_start(cp, {"evse_id": 1})
+        await central_server.command_change_profile(cp, body)
+        await central_server.command_stop(cp, {"evse_id": 1})
+        await central_server.command_start(cp, {"evse_id": 1})
+        self.assertEqual(await central_server.command_change_profile(cp, body), {"status": "Accepted"})
+        self.assertEqual(len(cp.profiles_sent()), 2)
+
+    async def test_expired_profile_is_sent_again(self):
+        cp = FakeChargePoint()
+        body = {"evse_id": 1, "meter_rate_kw": 11}
+        await central_server.command_start(cp, {"evse_id": 1})
+        await central_server.command_change_profile(cp, body)
+        cp.profiles[1] = cp.profiles[1]._replace(expires=0)
+        self.assertEqual(await central_server.command_change_profile(cp, body), {"status": "Accepted"})
+        self.assertEqual(len(cp.profiles_sent()), 2)
+
+    async def test_no_response(self):
+        cp = FakeChargePoint()
+        await central_server.command_start(cp, {"evse_id": 1})
+        cp.answer = False
+        result = await central_server.command_change_profile(cp, {"evse_id": 1, "meter_rate_kw": 11})
+        self.assertEqual(result, {"status": "no response from charge point"})
+        self.assertEqual(cp.profiles, {})
+
+
+class SiteLimitTest(unittest.IsolatedAsyncioTestCase):
+    async def test_new_session_gets_the_same_limit(self):
+        cp = FakeChargePoint()
+        body = {"evse_id": 1, "limit_kw": 7.5}
+        await central_server.command_start(cp, {"evse_id": 1})
+        await central_server.command_set_limit(cp, body)
+        await central_server.command_stop(cp, {"evse_id": 1})
+        await central_server.command_start(cp, {"evse_id": 1})
+        # Filled before the allocator pushes, e.g. by change_profile
+        await central_server.command_change_profile(cp, {"evse_id": 1, "meter_rate_kw": 7.5})
+        self.assertEqual(await central_server.command_set_limit(cp, body), {"status": "Accepted"})
+        self.assertEqual(len(cp.profiles_sent()), 3)
+
+    def test_allocator_pushes_to_a_new_session_between_rebalances(self):
+        allocator = SiteAllocator(site_limit_kw=10, station_max_kw=22)
+        evse = ("CP", 1)
+        allocation, pushes = allocator.plan([evse], {}, {evse: "t1"})
+        self.assertEqual(pushes, [("CP", 1, 10.0)])
+        allocator.accepted("CP", 1, 10.0, "t1")
+        self.assertEqual(allocator.plan([evse], {}, {evse: "t1"})[1], [])
+        # Stopped and started again since the last rebalance
+        self.assertEqual(allocator.plan([evse], {}, {evse: "t2"})[1], [("CP", 1, 10.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Per-station command queue:
+
+    python3 -m unittest test_command_queue
+"""
+import asyncio
+import unittest
+
+from command_queue import CommandQueue
+
+
+class Station:
+    """Runs commands when released, one at a time, recording what it got."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def run(self, action, body):
+        self.calls.append((action, body))
+        await self.release.wait()
+        return {"status": "Accepted", "body": body}
+
+    async def started(self, count=1):
+        while len(self.calls) < count:
+            await asyncio.sleep(0)
+
+
+def by_evse(action, body):
+    return (action, body.get("evse_id")) if action == "change_profile" else None
+
+
+class OrderTest(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_one_at_a_time_in_order(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        first = queue.submit("reset", {}, timeout=5)
+        second = queue.submit("availability", {"status": "Operative"}, timeout=5)
+        await station.started()
+        self.assertEqual(station.calls, [("reset", {})])
+        station.release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual([action for action, _ in station.calls], ["reset", "availability"])
+        self.assertEqual(queue.completed, 2)
+
+
+class CoalesceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_queued_commands_collapse_into_the_newest(self):
+        station = Station()
+        queue = CommandQueue(station.run, coalesce_key=by_evse)
+        running = queue.submit("change_profile", {"evse_id": 1, "meter_rate_kw": 7}, timeout=5)
+        await station.started()
+        older = queue.submit("change_profile", {"evse_id": 1, "meter_rate_kw": 11}, timeout=5)
+        newer = queue.submit("change_profile", {"evse_id": 1, "meter_rate_kw": 22}, timeout=5)
+        other = queue.submit("change_profile", {"evse_id": 2, "meter_rate_kw": 3}, timeout=5)
+        self.assertEqual(len(queue), 2)
+        station.release.set()
+        results = await asyncio.gather(running, older, newer, other)
+        self.assertEqual([body["meter_rate_kw"] for _, body in station.calls], [7, 22, 3])
+        self.assertEqual(results[1], results[2])
+        self.assertEqual(results[1]["body"]["meter_rate_kw"], 22)
+        self.assertEqual(queue.coalesced, 1)
+
+    async def test_uncoalesced_actions_all_run(self):
+        station = Station()
+        station.release.set()
+        queue = CommandQueue(station.run, coalesce_key=by_evse)
+        await asyncio.gather(*(queue.submit("reset", {}, timeout=5) for _ in range(3)))
+        self.assertEqual(len(station.calls), 3)
+        self.assertEqual(queue.coalesced, 0)
+
+
+class DeadlineTest(unittest.IsolatedAsyncioTestCase):
+    async def test_expired_while_queued_is_not_sent(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        running = queue.submit("reset", {}, timeout=5)
+        queued = queue.submit("availability", {}, timeout=0.01)
+        await asyncio.sleep(0.05)
+        station.release.set()
+        await running
+        self.assertEqual(await queued, {"status": "expired"})
+        self.assertEqual(station.calls, [("reset", {})])
+        self.assertEqual(queue.expired, 1)
+
+    async def test_running_past_the_deadline_times_out(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        self.assertEqual(await queue.submit("reset", {}, timeout=0.01), {"status": "timeout"})
+        self.assertIsNone(queue.running)
+
+    async def test_abandoned_command_is_not_sent(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        running = queue.submit("reset", {}, timeout=5)
+        abandoned = queue.submit("availability", {}, timeout=5)
+        await station.started()
+        abandoned.cancel()
+        station.release.set()
+        await running
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(station.calls, [("reset", {})])
+
+
+class SnapshotTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reports_running_and_queued(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        futures = [queue.submit(action, {}, timeout=5) for action in ("reset", "availability", "unlock")]
+        await station.started()
+        snapshot = queue.snapshot()
+        self.assertEqual(snapshot["depth"], 2)
+        self.assertEqual(snapshot["running"], "reset")
+        self.assertEqual(snapshot["queued"], ["availability", "unlock"])
+        self.assertIsNone(snapshot["mean_wait_ms"])
+        station.release.set()
+        await asyncio.gather(*futures)
+        snapshot = queue.snapshot()
+        self.assertEqual((snapshot["depth"], snapshot["running"], snapshot["completed"]), (0, None, 3))
+        self.assertIsNotNone(snapshot["mean_wait_ms"])
+
+    async def test_close_answers_everything(self):
+        station = Station()
+        queue = CommandQueue(station.run)
+        futures = [queue.submit(action, {}, timeout=5) for action in ("reset", "availability")]
+        await station.started()
+        queue.close({"status": "disconnected"})
+        self.assertEqual(await asyncio.gather(*futures), [{"status": "disconnected"}] * 2)
+        self.assertEqual(queue.snapshot()["depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""
+Loading frame journals for replay:
+
+    python3 -m unittest test_journal_replay
+"""
+import os
+import tempfile
+import unittest
+
+from frame_journal import CONNECTED, INBOUND, OUTBOUND, FrameJournal
+from journal_replay import load
+
+
+class LoadTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "ocpp.journal")
+
+    async def record(self, *records):
+        journal = FrameJournal(self.path)
+        journal.open()
+        for record in records:
+            journal.record(*record)
+        await journal.flush()
+        journal._file.close()
+
+    async def test_malformed_frames_are_skipped(self):
+        await self.record(
+            ("CP", CONNECTED),
+            ("CP", INBOUND, "not json"),
+            ("CP", INBOUND, b"\xff\xfe"),
+            ("CP", INBOUND, '{"a": 1}'),
+            ("CP", INBOUND, '[2, "1", "Heartbeat", {}]'),
+            ("CP", OUTBOUND, '[2, "s1", "SetChargingProfile", {}]'),
+            ("CP", INBOUND, '[3, "s1", {"status": "Accepted"}]'),
+        )
+        start, events, answers, malformed = load([self.path])
+        self.assertEqual(malformed, 3)
+        self.assertEqual([record.direction for record in events["CP"]], [CONNECTED, INBOUND])
+        self.assertEqual(list(answers["CP"]["SetChargingProfile"]), [[{"status": "Accepted"}]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Background logging and per-message rate limiting:
+
+    python3 -m unittest test_log_setup
+"""
+import logging
+import queue
+import threading
+import unittest
+
+from log_setup import BackgroundQueueHandler, RateLimitFilter, first_arg_key
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 0, msg, args or None, None)
+
+
+class QueueHandlerTest(unittest.TestCase):
+    def test_message_is_rendered_when_queued(self):
+        log_queue = queue.Queue()
+        handler = BackgroundQueueHandler(log_queue)
+        payload = {"value": 1}
+        handler.handle(make_record("payload %s", payload))
+        payload["value"] = 2
+        self.assertEqual(log_queue.get_nowait().getMessage(), "payload {'value': 1}")
+
+    def test_full_queue_drops(self):
+        handler = BackgroundQueueHandler(queue.Queue(1))
+        for _ in range(3):
+            handler.handle(make_record("x"))
+        self.assertEqual(handler.dropped, 2)
+
+
+class RateLimitTest(unittest.TestCase):
+    def test_reports_suppressed_records(self):
+        limiter = RateLimitFilter(rate=0, burst=1, key=first_arg_key)
+        self.assertTrue(limiter.filter(make_record("from %s", "CP_1")))
+        self.assertFalse(limiter.filter(make_record("from %s", "CP_1")))
+        self.assertTrue(limiter.filter(make_record("from %s", "CP_2")))
+        limiter._state[("from %s", "CP_1")][0] = 1
+        record = make_record("from %s", "CP_1")
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.getMessage(), "from CP_1 (1 similar suppressed)")
+
+    def test_mapping_args(self):
+        limiter = RateLimitFilter(rate=0, burst=1, key=first_arg_key)
+        for _ in range(2):
+            limiter.filter(make_record("%(id)s", {"id": "CP"}))
+        limiter._state[next(iter(limiter._state))][0] = 1
+        record = make_record("%(id)s", {"id": "CP"})
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.getMessage(), "CP (1 similar suppressed)")
+
+    def test_counts_are_exact_across_threads(self):
+        limiter = RateLimitFilter(rate=0, burst=1000)
+        passed = []
+
+        def log():
+            passed.append(sum(limiter.filter(make_record("same")) for _ in range(1000)))
+
+        threads = [threading.Thread(target=log) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(passed), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+SQLite meter history and its batched writer:
+
+    python3 -m unittest test_meter_db
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import meter_db
+from meter_db import MeterDatabase
+from meter_store import MeterStore
+
+ENERGY = "Energy.Active.Import.Register"
+
+
+class MeterDatabaseTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "meter_values.db")
+
+    async def test_rows_are_written_in_batches(self):
+        db = MeterDatabase(self.path, batch_size=3, flush_interval=60)
+        db.open()
+        writes = []
+        write = db._write
+        db._write = lambda rows: (writes.append(len(rows)), write(rows))
+        writer = asyncio.create_task(db.run())
+        for reading_id in range(1, 7):
+            db.enqueue("CP", 1, 1000.0 + reading_id, [(float(reading_id), ENERGY, "Wh", 0)],
+                       reading_id)
+        await asyncio.sleep(0.1)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        self.assertEqual(writes, [3, 3])
+
+    async def test_reads_see_queued_rows(self):
+        db = MeterDatabase(self.path, flush_interval=60)
+        db.open()
+        db.enqueue("CP", 1, 1000.0, [(5.0, ENERGY, "Wh", 0)], 1)
+        readings, last_id, has_more = await db.page("CP")
+        self.assertEqual((len(readings), last_id, has_more), (1, 1, False))
+
+    async def test_reading_ids_resume_after_a_restart(self):
+        db = MeterDatabase(self.path)
+        db.open()
+        store = MeterStore()
+        for value in (1.0, 2.0):
+            reading_id = store.append("CP", 1, 1000.0, [(value, ENERGY, "Wh", 0)])
+            db.enqueue("CP", 1, 1000.0, [(value, ENERGY, "Wh", 0)], reading_id)
+        await db.stations()
+
+        restarted = MeterStore()
+        restarted.resume_reading_ids(MeterDatabase(self.path).open())
+        self.assertEqual(restarted.append("CP", 1, 1001.0, [(3.0, ENERGY, "Wh", 0)]), 3)
+
+    async def test_prune_in_chunks(self):
+        db = MeterDatabase(self.path, retention=3600)
+        db.open()
+        old = time.time() - 7200
+        db._write([(i, "CP", 1, old, 1.0, ENERGY, "Wh", 0) for i in range(1, 6)]
+                  + [(6, "CP", 1, time.time(), 1.0, ENERGY, "Wh", 0)])
+        with mock.patch.object(meter_db, "PRUNE_CHUNK", 2):
+            self.assertEqual([db._prune(time.time() - 3600) for _ in range(4)], [2, 2, 1, 0])
+        readings, _, _ = await db.page("CP")
+        self.assertEqual(len(readings), 1)
+        plan = db._conn.execute("EXPLAIN QUERY PLAN SELECT rowid FROM meter_values "
+                                "WHERE ts < ?", (0,)).fetchall()
+        self.assertIn("idx_meter_values_ts", str(plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Rolling meter aggregates:
+
+    python3 -m unittest test_meter_rollups
+"""
+import unittest
+from unittest import mock
+
+from meter_rollups import IDLE_EXPIRY_S, MeterRollups
+
+ENERGY = "Energy.Active.Import.Register"
+
+
+class RollupTest(unittest.TestCase):
+    def test_energy_deltas_add_up(self):
+        rollups = MeterRollups()
+        for minute, value in enumerate([1000, 1100, 1300, 1600]):
+            rollups.add("CP", 1, 60.0 * minute, [(float(value), ENERGY, "Wh", 0)])
+        buckets = rollups.query("CP", "1m", ENERGY)[0]["buckets"]
+        self.assertEqual(len(buckets), 4)
+        self.assertEqual(sum(bucket["energy_delta"] for bucket in buckets), 600)
+
+    def test_multiplier_is_applied(self):
+        rollups = MeterRollups()
+        rollups.add("CP", 1, 0.0, [(2.0, "Power.Active.Import", "W", 3)])
+        self.assertEqual(rollups.query("CP", "1h")[0]["buckets"][0]["max"], 2000)
+
+
+class ExpiryTest(unittest.TestCase):
+    def test_idle_series_are_dropped(self):
+        rollups = MeterRollups()
+        with mock.patch("meter_rollups.time.time", return_value=0.0):
+            rollups.add("OLD", 1, 0.0, [(1.0, ENERGY, "Wh", 0)])
+        with mock.patch("meter_rollups.time.time", return_value=IDLE_EXPIRY_S):
+            rollups.add("CP", 1, 0.0, [(1.0, ENERGY, "Wh", 0), (230.0, "Voltage", "V", 0)])
+        rollups.expire(now=IDLE_EXPIRY_S + 1)
+        self.assertEqual(rollups.query("OLD", "1m"), [])
+        self.assertEqual(len(rollups), 2)
+
+    def test_remove(self):
+        rollups = MeterRollups()
+        rollups.add("CP", 1, 0.0, [(1.0, ENERGY, "Wh", 0)])
+        rollups.remove("CP")
+        self.assertEqual(len(rollups), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Array-backed meter history:
+
+    python3 -m unittest test_meter_store
+"""
+import unittest
+from unittest import mock
+
+from meter_store import MeterStore, columnar, decode_cursor, encode_cursor
+
+ENERGY = "Energy.Active.Import.Register"
+
+
+def energy(value):
+    return [(float(value), ENERGY, "Wh", 0)]
+
+
+class RingTest(unittest.TestCase):
+    def test_wraps_around_oldest_first(self):
+        store = MeterStore(max_samples=4, max_age=None)
+        for i in range(10):
+            store.append("CP", 1, 1000.0 + i, energy(i))
+        self.assertEqual(store.sample_count("CP"), 4)
+        self.assertEqual([row[3] for row in store.iter_rows("CP")], [6.0, 7.0, 8.0, 9.0])
+
+    def test_readings_keep_their_samples_together(self):
+        store = MeterStore(max_samples=10, max_age=None)
+        store.append("CP", 1, 1000.0, energy(1) + [(230.0, "Voltage", "V", 0)])
+        rows = list(store.iter_rows("CP"))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][0], rows[1][0])
+
+
+class AgeTest(unittest.TestCase):
+    def test_old_station_timestamps_are_kept(self):
+        # A spooled backlog, or a station clock a day behind
+        store = MeterStore(max_samples=10, max_age=3600)
+        with mock.patch("meter_store.time.time", return_value=100000.0):
+            store.append("CP", 1, 100000.0 - 86400, energy(1))
+            store.append("CP", 1, 100000.0, energy(2))
+        self.assertEqual(store.sample_count("CP"), 2)
+
+    def test_evicted_by_arrival_time(self):
+        store = MeterStore(max_samples=10, max_age=3600)
+        with mock.patch("meter_store.time.time", return_value=100000.0):
+            store.append("CP", 1, 100000.0, energy(1))
+        with mock.patch("meter_store.time.time", return_value=101000.0):
+            # Older station timestamp than the row before it
+            store.append("CP", 1, 50000.0, energy(2))
+        with mock.patch("meter_store.time.time", return_value=100000.0 + 3601):
+            store.expire()
+        self.assertEqual([row[3] for row in store.iter_rows("CP")], [2.0])
+
+    def test_grows_again_after_eviction(self):
+        store = MeterStore(max_samples=4, max_age=10)
+        with mock.patch("meter_store.time.time", return_value=0.0):
+            store.append("CP", 1, 0.0, energy(0))
+            store.append("CP", 1, 0.0, energy(1))
+        with mock.patch("meter_store.time.time", return_value=20.0):
+            for i in range(2, 6):
+                store.append("CP", 1, 20.0, energy(i))
+        self.assertEqual([row[3] for row in store.iter_rows("CP")], [2.0, 3.0, 4.0, 5.0])
+
+
+def filled(readings=5, max_samples=100):
+    store = MeterStore(max_samples=max_samples, max_age=None)
+    for i in range(readings):
+        store.append("CP", 1, 1000.0 + i, energy(i) + [(230.0 + i, "Voltage", "V", 0)])
+    return store
+
+
+class PageTest(unittest.TestCase):
+    def test_cursor_pages_cover_every_reading_once(self):
+        store = filled()
+        values, after = [], 0
+        for _ in range(3):
+            readings, after, has_more = store.page("CP", after=after, limit=2)
+            values += [reading["sampled_values"][0]["value"] for reading in readings]
+            self.assertTrue(all(len(reading["sampled_values"]) == 2 for reading in readings))
+        self.assertEqual(values, [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertFalse(has_more)
+
+    def test_time_range_is_inclusive(self):
+        store = filled()
+        readings, _, has_more = store.page("CP", start=1001.0, end=1003.0)
+        self.assertEqual([reading["sampled_values"][0]["value"] for reading in readings], [1.0, 2.0, 3.0])
+        self.assertFalse(has_more)
+
+    def test_cursor_older_than_the_buffer(self):
+        store = filled(readings=10, max_samples=8)
+        readings, last_id, _ = store.page("CP", after=1)
+        self.assertEqual([reading["sampled_values"][0]["value"] for reading in readings], [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(store.page("CP", after=last_id), ([], 0, False))
+
+    def test_unknown_station(self):
+        self.assertEqual(MeterStore().page("nope"), ([], 0, False))
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+        for cursor in ("", "bm9wZQ", encode_cursor(1)[:-1] + "!"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class ColumnarTest(unittest.TestCase):
+    def test_series_per_evse_and_measurand(self):
+        store = filled(readings=3)
+        store.append("CP", 2, 1003.0, energy(float("nan")))
+        series, readings, last_id, has_more = store.columnar_page("CP")
+        self.assertEqual([(s["evse_id"], s["measurand"]) for s in series],
+                         [(1, ENERGY), (1, "Voltage"), (2, ENERGY)])
+        self.assertEqual(series[0]["timestamps"], [1000.0, 1001.0, 1002.0])
+        self.assertEqual(series[1]["values"], [230.0, 231.0, 232.0])
+        self.assertEqual(series[2]["values"], [None])
+        self.assertEqual((readings, has_more), (4, False))
+        self.assertEqual(last_id, store.page("CP")[1])
+
+    def test_array_path_matches_the_row_path(self):
+        store = filled(readings=20, max_samples=16)
+        store.append("CP", 2, 1010.0, energy(float("nan")))
+        for after in (0, store.page("CP", limit=2)[1]):
+            for start, end in ((None, None), (1013.0, None), (None, 1015.0), (1012.0, 1014.0)):
+                for limit in (None, 1, 3, 100):
+                    self.assertEqual(
+                        store.columnar_page("CP", after, start, end, limit),
+                        columnar(store.iter_rows("CP", after, start, end), limit),
+                        (after, start, end, limit))
+
+    def test_empty(self):
+        store = filled()
+        self.assertEqual(store.columnar_page("nope"), ([], 0, 0, False))
+        self.assertEqual(store.columnar_page("CP", start=2000.0), ([], 0, 0, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Per-action OCPP validation policy:
+
+    python3 -m unittest test_ocpp_validation
+"""
+import unittest
+
+from ocpp import messages
+
+from ocpp_validation import ValidationPolicy
+
+CALL, CALL_RESULT = messages.MessageType.Call, messages.MessageType.CallResult
+
+
+class PolicyTest(unittest.TestCase):
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            ValidationPolicy({"MeterValues": "sometimes"})
+
+    def test_default_and_off(self):
+        policy = ValidationPolicy({"Heartbeat": "off"})
+        self.assertTrue(policy.should_validate("BootNotification"))
+        self.assertFalse(policy.should_validate("Heartbeat"))
+        self.assertEqual(policy.skipped, {"Heartbeat": 1})
+
+    def test_requests_and_responses_are_sampled_apart(self):
+        policy = ValidationPolicy({"MeterValues": "sampled"}, sample_every=2)
+        # Request and response alternate, as on a live connection
+        decisions = [policy.should_validate("MeterValues", message_type)
+                     for _ in range(4) for message_type in (CALL, CALL_RESULT)]
+        self.assertEqual(decisions, [True, True, False, False] * 2)
+
+
+class ValidateTest(unittest.TestCase):
+    def test_invalid_payload_raises_the_library_error(self):
+        policy = ValidationPolicy()
+        message = messages.Call(unique_id="1", action="Heartbeat", payload={"unexpected": 1})
+        with self.assertRaises(Exception) as raised:
+            policy.validate(message, "2.0.1")
+        self.assertEqual(type(raised.exception).__module__, "ocpp.exceptions")
+        policy.validate(messages.Call(unique_id="2", action="Heartbeat", payload={}), "2.0.1")
+        self.assertEqual(policy.validated, {"Heartbeat": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
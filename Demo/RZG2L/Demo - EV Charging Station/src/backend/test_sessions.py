@@ -0,0 +1,67 @@
+"""
+Charging sessions tracked from meter values and transaction events:
+
+    python3 -m unittest test_sessions
+"""
+import unittest
+
+from ocpp.v201 import call
+
+import central_server
+from sessions import ENERGY_MEASURAND, SessionTracker
+from test_charging_profiles import FakeChargePoint
+
+
+def energy(wh):
+    return [(float(wh), ENERGY_MEASURAND, "Wh", 0)]
+
+
+class SessionTest(unittest.TestCase):
+    def test_energy_from_the_first_sample(self):
+        tracker = SessionTracker()
+        tracker.start("CP", 1, "t1", started_at=0.0)
+        tracker.add("CP", 1, 60.0, energy(1000))
+        tracker.add("CP", 1, 120.0, energy(1500))
+        session = tracker.active("CP", 1)
+        self.assertEqual(session.energy_wh, 500)
+        self.assertEqual(session.power, 30000)
+
+    def test_started_event_register_counts(self):
+        tracker = SessionTracker()
+        session = tracker.start("CP", 1, "t1", started_at=0.0)
+        # A MeterValues sample that arrived before the Started event
+        tracker.add("CP", 1, 60.0, energy(1200))
+        session.add(0.0, energy(1000), started=True)
+        tracker.add("CP", 1, 120.0, energy(1500))
+        self.assertEqual(session.energy_wh, 500)
+
+    def test_same_transaction_keeps_the_session(self):
+        tracker = SessionTracker()
+        session = tracker.start("CP", 1, "t1")
+        self.assertIs(tracker.start("CP", 1, "t1"), session)
+
+    def test_new_transaction_replaces_the_session(self):
+        tracker = SessionTracker()
+        old = tracker.start("CP", 1, "t1", started_at=0.0)
+        new = tracker.start("CP", 1, "t2", started_at=10.0)
+        self.assertEqual(new.transaction_id, "t2")
+        self.assertIs(tracker.active("CP", 1), new)
+        self.assertEqual(old.ended_at, 10.0)
+        self.assertIsNone(tracker.transaction("CP", "t1"))
+        self.assertEqual([s["transaction_id"] for s in tracker.completed_sessions()], ["t1"])
+
+
+class RemoteStartTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stop_goes_to_the_latest_transaction(self):
+        cp = FakeChargePoint()
+        first = await central_server.command_start(cp, {"evse_id": 1})
+        second = await central_server.command_start(cp, {"evse_id": 1})
+        self.assertNotEqual(first["transaction_id"], second["transaction_id"])
+        await central_server.command_stop(cp, {"evse_id": 1})
+        stop = [payload for payload in cp.calls
+                if isinstance(payload, call.RequestStopTransactionPayload)][0]
+        self.assertEqual(stop.transaction_id, second["transaction_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
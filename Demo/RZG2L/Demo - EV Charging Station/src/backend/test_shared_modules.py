@@ -0,0 +1,36 @@
+"""
+Modules copied into several components must stay identical:
+
+    python3 -m unittest test_shared_modules
+"""
+import os
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.dirname(HERE)
+CLIENT = os.path.join(SRC, "charging_point_greengrass")
+OTA_WORKER = os.path.join(SRC, "..", "..", "Demo - Firmware OTA Update", "src", "lambda",
+                          "lambda_worker")
+
+COPIES = {
+    "log_setup.py": [CLIENT, OTA_WORKER],
+    "fast_json.py": [CLIENT],
+    "ocpp_validation.py": [CLIENT],
+}
+
+
+class CopiesTest(unittest.TestCase):
+    def test_copies_are_identical(self):
+        for name, directories in COPIES.items():
+            with open(os.path.join(HERE, name), "rb") as f:
+                original = f.read()
+            for directory in directories:
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    continue
+                with self.subTest(path=os.path.relpath(path, SRC)), open(path, "rb") as f:
+                    self.assertEqual(f.read(), original, f"{path} differs from backend/{name}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Site allocation and the profile pushes it plans:
+
+    python3 -m unittest test_smart_charging
+"""
+import random
+import unittest
+
+import numpy as np
+
+from smart_charging import SiteAllocator, allocate
+
+
+class AllocateTest(unittest.TestCase):
+    def test_shares_by_priority_and_caps(self):
+        allocation = allocate(30, np.array([22.0, 22.0, 5.0]), np.array([1.0, 3.0, 1.0]))
+        self.assertAlmostEqual(allocation.sum(), 30)
+        self.assertAlmostEqual(allocation[2], 5)
+        self.assertAlmostEqual(allocation[1], 3 * allocation[0])
+
+    def test_site_limit_above_demand(self):
+        allocation = allocate(100, np.array([22.0, 11.0]), np.array([1.0, 1.0]))
+        self.assertEqual(allocation.tolist(), [22.0, 11.0])
+
+
+class PlanTest(unittest.TestCase):
+    def test_decrease_within_the_deadband_is_pushed(self):
+        allocator = SiteAllocator(site_limit_kw=20, deadband_kw=0.5)
+        a, b = ("A", 1), ("B", 1)
+        for cp_id, evse_id, limit in allocator.plan([a, b], {})[1]:
+            allocator.accepted(cp_id, evse_id, limit)
+        # B's share grows by 0.4 kW, A's shrinks by as much
+        stations = {"B": {"priority": 1.04}}
+        pushes = allocator.plan([a, b], stations)[1]
+        self.assertEqual([(cp_id, evse_id) for cp_id, evse_id, _ in pushes], [a])
+
+    def test_decreases_come_first(self):
+        allocator = SiteAllocator(site_limit_kw=20)
+        a, b = ("A", 1), ("B", 1)
+        for cp_id, evse_id, limit in allocator.plan([a, b], {})[1]:
+            allocator.accepted(cp_id, evse_id, limit)
+        pushes = allocator.plan([a, b], {"A": {"priority": 3}})[1]
+        self.assertEqual([cp_id for cp_id, _, _ in pushes], ["B", "A"])
+
+    def test_enforced_limits_stay_under_the_site_limit(self):
+        rng = random.Random(1)
+        allocator = SiteAllocator(site_limit_kw=50, deadband_kw=1.0)
+        evses = [(f"CP_{i}", 1) for i in range(20)]
+        enforced = {}
+        for _ in range(200):
+            charging = sorted(rng.sample(evses, rng.randint(1, len(evses))))
+            stations = {cp_id: {"priority": rng.uniform(0.5, 2)} for cp_id, _ in charging}
+            for key in list(enforced):
+                if key not in charging:
+                    del enforced[key]
+            for cp_id, evse_id, limit in allocator.plan(charging, stations)[1]:
+                allocator.accepted(cp_id, evse_id, limit)
+                enforced[(cp_id, evse_id)] = limit
+            self.assertLessEqual(sum(enforced.values()), 50 + 1e-9)
+
+    def test_forget_pushes_again(self):
+        allocator = SiteAllocator(site_limit_kw=10)
+        evse = ("CP", 1)
+        allocator.accepted("CP", 1, allocator.plan([evse], {})[1][0][2])
+        self.assertEqual(allocator.plan([evse], {})[1], [])
+        # Overwritten by a change_profile from the REST API
+        allocator.forget("CP", 1)
+        self.assertEqual(allocator.plan([evse], {})[1], [("CP", 1, 10.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
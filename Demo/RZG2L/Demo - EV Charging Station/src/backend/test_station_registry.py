@@ -0,0 +1,119 @@
+"""
+Indexed station registry and its ETag:
+
+    python3 -m unittest test_station_registry
+"""
+import random
+import unittest
+
+from station_registry import StationRegistry
+
+
+def boot(model="M1", vendor="Renesas"):
+    return {"model": model, "vendor_name": vendor}
+
+
+def ids(entries):
+    return sorted(entry["id"] for entry in entries)
+
+
+class IndexTest(unittest.TestCase):
+    def test_filters_follow_status_and_connection(self):
+        registry = StationRegistry()
+        for cp_id in ("A", "B", "C"):
+            registry.register(cp_id, boot(), "PowerUp")
+            registry.connect(cp_id)
+        registry.set_status("B", "Inoperative")
+        registry.disconnect("C")
+        self.assertEqual(ids(registry.select(status="Operative")), ["A", "C"])
+        self.assertEqual(ids(registry.select(status="Inoperative", connected=True)), ["B"])
+        self.assertEqual(ids(registry.select(connected=False)), ["C"])
+        registry.connect("C")
+        self.assertEqual(registry.select(connected=False), [])
+
+    def test_reboot_with_another_model_moves_the_station(self):
+        registry = StationRegistry()
+        registry.register("A", boot("M1"), "PowerUp")
+        registry.register("A", boot("M2"), "FirmwareUpdate")
+        self.assertEqual(registry.select(model="M1"), [])
+        self.assertEqual(ids(registry.select(model="M2")), ["A"])
+        self.assertEqual(len(registry), 1)
+
+    def test_connected_before_registering(self):
+        registry = StationRegistry()
+        registry.connect("A")
+        self.assertEqual(registry.connected, ["A"])
+        registry.register("A", boot(), "PowerUp")
+        self.assertEqual(ids(registry.select(connected=True)), ["A"])
+
+    def test_removed_station_leaves_every_index(self):
+        registry = StationRegistry()
+        registry.register("A", boot(), "PowerUp")
+        self.assertTrue(registry.remove("A"))
+        self.assertFalse(registry.remove("A"))
+        self.assertNotIn("A", registry)
+        for filters in ({"model": "M1"}, {"vendor": "Renesas"}, {"status": "Operative"},
+                        {"connected": False}):
+            self.assertEqual(registry.select(**filters), [])
+
+    def test_matches_a_scan_after_random_changes(self):
+        rng = random.Random(1)
+        registry = StationRegistry()
+        stations = [f"CP_{i}" for i in range(30)]
+        for _ in range(1000):
+            cp_id = rng.choice(stations)
+            change = rng.randrange(5)
+            if change == 0:
+                registry.register(cp_id, boot(rng.choice(["M1", "M2"])), "PowerUp")
+            elif change == 1:
+                registry.set_status(cp_id, rng.choice(["Operative", "Inoperative"]))
+            elif change == 2:
+                registry.connect(cp_id)
+            elif change == 3:
+                registry.disconnect(cp_id)
+            else:
+                registry.remove(cp_id)
+        everything = registry.select()
+        for status in ("Operative", "Inoperative"):
+            for model in ("M1", "M2"):
+                for connected in (True, False):
+                    expected = ids(entry for entry in everything
+                                   if entry["status"] == status and entry["connected"] == connected
+                                   and entry["charging_station"]["model"] == model)
+                    self.assertEqual(
+                        ids(registry.select(status=status, model=model, connected=connected)), expected)
+
+
+class EtagTest(unittest.TestCase):
+    def test_changes_with_what_a_listing_shows(self):
+        registry = StationRegistry()
+        etags = [registry.etag]
+        registry.register("A", boot(), "PowerUp")
+        etags.append(registry.etag)
+        registry.connect("A")
+        etags.append(registry.etag)
+        registry.set_status("A", "Inoperative")
+        etags.append(registry.etag)
+        registry.disconnect("A")
+        etags.append(registry.etag)
+        registry.remove("A")
+        etags.append(registry.etag)
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_unchanged_without_a_change(self):
+        registry = StationRegistry()
+        registry.register("A", boot(), "PowerUp")
+        registry.connect("A")
+        etag = registry.etag
+        registry.set_status("A", "Operative")
+        registry.connect("A")
+        registry.disconnect("B")
+        registry.remove("B")
+        self.assertEqual(registry.etag, etag)
+
+    def test_differs_after_a_restart(self):
+        self.assertNotEqual(StationRegistry().etag, StationRegistry().etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Control messages are single JSON lines; listings can be large.
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+class ShardRouter:
+    """
+    Routing between worker processes that each own a shard of charge-point
+    connections.
+
+    The kernel spreads websocket connections over the workers
+    (SO_REUSEPORT). ``registry`` is a multiprocessing.Manager dict shared by
+    all workers that maps each connected station to the worker holding its
+    socket, and ``settings`` holds values every worker must agree on. Each
+    worker serves a unix control socket on which its peers run commands
+    against its stations, collect listings and subscribe to its events.
+
+    Every call on a Manager proxy is a blocking round trip to the manager
+    process, so none is made on the event loop: they run one at a time, in
+    order, on a thread of their own.
+    """
+
+    def __init__(self, index: int, count: int, registry, settings, socket_dir: str):
+        self.index = index
+        self.count = count
+        self.registry = registry
+        self.settings = settings
+        self.socket_dir = socket_dir
+        self._handler: Optional[Callable[[dict], Awaitable[dict]]] = None
+        self._streamer: Optional[Callable[[dict], AsyncIterator]] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{index}")
+
+    @property
+    def peers(self) -> List[int]:
+        return [worker for worker in range(self.count) if worker != self.index]
+
+    def socket_path(self, worker: int) -> str:
+        return os.path.join(self.socket_dir, f"ocpp-worker-{worker}.sock")
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    def _log_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Shared state update failed on worker {self.index}: {future.exception()}")
+
+    def claim(self, cp_id: str):
+        self._submit(self.registry.__setitem__, cp_id, self.index)
+
+    def release(self, cp_id: str):
+        self._submit(self._release, cp_id)
+
+    def _release(self, cp_id: str):
+        # Only drop the entry if the station has not already reconnected to
+        # another worker.
+        if self.registry.get(cp_id) == self.index:
+            self.registry.pop(cp_id, None)
+
+    async def _call(self, fn, *args):
+        # After this worker's own pending claims and releases
+        return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    async def owner(self, cp_id: str) -> Optional[int]:
+        return await self._call(self.registry.get, cp_id)
+
+    async def setting(self, key: str, default: Any = None) -> Any:
+        return await self._call(self.settings.get, key, default)
+
+    async def update_setting(self, key: str, value: Any):
+        await self._call(self.settings.__setitem__, key, value)
+
+    async def serve(self, handler, streamer):
+        """
+        Serve control requests: ``handler(request)`` answers with one dict,
+        ``streamer(request)`` (for ``{"op": "subscribe"}``) yields items until
+        the peer disconnects.
+        """
+        self._handler = handler
+        self._streamer = streamer
+        path = self.socket_path(self.index)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._on_client, path, limit=STREAM_LIMIT)
+        logger.info(f"Worker {self.index} control socket at {path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _on_client(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            if request.get("op") == "subscribe":
+                async for item in self._streamer(request):
+                    writer.write((json.dumps(item) + "\n").encode())
+                    await writer.drain()
+            else:
+                response = await self._handler(request)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Control request failed on worker {self.index}: {e}")
+        finally:
+            writer.close()
+
+    async def request(self, worker: int, message: dict) -> dict:
+        reader, writer = await asyncio.open_unix_connection(
+            self.socket_path(worker), limit=STREAM_LIMIT)
+        try:
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError(f"worker {worker} closed the control connection")
+            return json.loads(line)
+        finally:
+            writer.close()
+
+    async def broadcast(self, message: dict) -> List[dict]:
+        """Send a request to every peer; unreachable peers are skipped."""
+        results = await asyncio.gather(
+            *(self.request(worker, message) for worker in self.peers),
+            return_exceptions=True)
+        responses = []
+        for worker, result in zip(self.peers, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Worker {worker} did not answer {message.get('op')}: {result}")
+            else:
+                responses.append(result)
+        return responses
+
+    async def stream(self, worker: int, message: dict) -> AsyncIterator:
+        reader, writer = await asyncio.open_unix_connection(
+            self.socket_path(worker), limit=STREAM_LIMIT)
+        try:
+            writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                yield json.loads(line)
+        finally:
+            writer.close()
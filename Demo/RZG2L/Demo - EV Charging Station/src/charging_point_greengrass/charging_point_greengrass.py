@@ -1,27 +1,73 @@
 import asyncio
 import logging
 import os
+import random
 import time
 from datetime import datetime, timezone
 import sys
+import uuid
+from typing import List, Optional
 from ocpp.v201 import ChargePoint as cp
 from ocpp.v201 import call, call_result
 from ocpp.v201.enums import Action, BootReasonType, MeasurandType, GetChargingProfileStatusType
 from ocpp.routing import on
+from ocpp.exceptions import GenericError, OCPPError
+from log_setup import RateLimitFilter, first_arg_key, setup_logging
+import fast_json
+import ocpp_validation
+from meter_spool import MeterSpool
 
 try:
     import websockets
-    from websockets.exceptions import ConnectionClosedError
+    from websockets.exceptions import ConnectionClosedError, InvalidStatusCode
 except ModuleNotFoundError:
     print("Please install websockets: pip install websockets")
     exit(1)
 
+# orjson for OCPP frames when installed (FAST_JSON=off disables)
+fast_json.install_ocpp_codec()
+# Per-action schema validation: OCPP_VALIDATION="MeterValues=sampled,..."
+validation = ocpp_validation.install()
+
+# Handlers write from a background thread; per-message logs are rate
+# limited per charge point (see log_setup.py)
+setup_logging(level=logging.INFO, stream=sys.stdout)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+message_logger = logging.getLogger("charging_point.messages")
+for per_message_logger in (message_logger, logging.getLogger("ocpp")):
+    per_message_logger.addFilter(RateLimitFilter(
+        rate=float(os.getenv("LOG_RATE", "0.2")),
+        burst=int(os.getenv("LOG_BURST", "5")),
+        sample=int(os.getenv("LOG_SAMPLE", "1")),
+        key=first_arg_key))
+
+# Seconds between reconnect attempts, randomized by +-50% so a fleet that
+# lost the server together does not come back in lockstep
+RECONNECT_DELAY_S = float(os.getenv("RECONNECT_DELAY_S", "5"))
+# Used when a Pending/Rejected BootNotification response has no interval
+BOOT_RETRY_S = 10
+
+# Simulator mode: SIM_STATIONS virtual charge points ("<CHARGE_POINT_ID>_1",
+# "<CHARGE_POINT_ID>_2", ...) with SIM_EVSES EVSEs each, all in this
+# process. METER_INTERVAL_S is the seconds between meter samples; a comma
+# separated list ("1,5,10") is assigned to the stations round robin.
+SIM_STATIONS = int(os.getenv("SIM_STATIONS", "1"))
+SIM_EVSES = int(os.getenv("SIM_EVSES", "1"))
+METER_INTERVALS_S = [float(interval) for interval in os.getenv("METER_INTERVAL_S", "5").split(",")]
+# Initial connects are spread over this many seconds
+SIM_RAMP_S = float(os.getenv("SIM_RAMP_S", "0"))
+# Meter values the server did not get are spooled to
+# METER_SPOOL_DIR/<station>.spool (empty: off) and forwarded after a
+# reconnect in MeterValues messages of up to METER_BATCH_MAX_BYTES of
+# entries, well below the websocket message limit (see meter_spool.py)
+METER_SPOOL_DIR = os.getenv("METER_SPOOL_DIR", "meter_spool")
+METER_SPOOL_MAX_MB = float(os.getenv("METER_SPOOL_MAX_MB", "64"))
+METER_BATCH_MAX_BYTES = int(os.getenv("METER_BATCH_MAX_BYTES", str(256 * 1024)))
+# Seconds (randomized by +-50%) before forwarding again after the server
+# answered GenericError, e.g. because it throttled our calls
+FORWARD_RETRY_S = 1
+# Power drawn by a charging EVSE (the 100 Wh per 5 s the demo always sent)
+CHARGE_POWER_W = 72000
 
 # # Setup logging
 # logging.basicConfig(level=logging.INFO,
@@ -30,11 +76,221 @@ logger.addHandler(handler)
 # logger = logging.getLogger(__name__)
 
 
+class Evse:
+    __slots__ = ("id", "energy_wh", "transaction_id")
+
+    def __init__(self, id: int):
+        self.id = id
+        self.energy_wh = 1000.0
+        self.transaction_id: Optional[str] = None
+
+
+class Station:
+    """
+    A simulated charge point. Its EVSEs, transactions and meter task outlive
+    the websocket: ``run`` reconnects with a fresh ``ChargePoint`` while the
+    EVSEs keep charging, so many stations can share one event loop.
+    """
+
+    def __init__(self, id: str, evses: int = 1, meter_interval: float = 5.0):
+        self.id = id
+        self.evses = [Evse(evse_id) for evse_id in range(1, evses + 1)]
+        self.meter_interval = meter_interval
+        self.meter_task: Optional[asyncio.Task] = None
+        self.cp: Optional["ChargePoint"] = None
+        # Opened by run(), so ChargePoints of the benchmark do not spool
+        self.spool: Optional[MeterSpool] = None
+        self.forward_task: Optional[asyncio.Task] = None
+
+    @property
+    def charging(self) -> List[Evse]:
+        return [evse for evse in self.evses if evse.transaction_id is not None]
+
+    def start_transaction(self, evse_id: Optional[int] = None) -> Optional[Evse]:
+        """Start charging on ``evse_id`` (or the first idle EVSE); None if it cannot."""
+        if evse_id is None:
+            idle = [evse for evse in self.evses if evse.transaction_id is None]
+            evse = idle[0] if idle else None
+        else:
+            evse = self.evses[evse_id - 1] if 0 < evse_id <= len(self.evses) else None
+        if evse is None or evse.transaction_id is not None:
+            return None
+        evse.transaction_id = str(uuid.uuid4())
+        if not self.meter_task or self.meter_task.done():
+            self.meter_task = asyncio.create_task(self.send_meter_values())
+        return evse
+
+    async def stop_transaction(self, transaction_id: str) -> Optional[List[Evse]]:
+        """
+        Stop the transaction and return the EVSEs stopped, or None for an
+        unknown transaction. A single EVSE station stops whatever it is
+        charging, as the demo charge point always has.
+        """
+        evses = [evse for evse in self.evses if evse.transaction_id == transaction_id]
+        if not evses:
+            if len(self.evses) > 1:
+                return None
+            evses = self.charging
+        for evse in evses:
+            evse.transaction_id = None
+        if not self.charging and self.meter_task:
+            self.meter_task.cancel()
+            try:
+                await self.meter_task
+            except asyncio.CancelledError:
+                logger.info(f"{self.id}: meter task cancelled cleanly.")
+        return evses
+
+    def sample(self, evse: Evse):
+        evse.energy_wh += CHARGE_POWER_W * self.meter_interval / 3600
+        return call.MeterValuesPayload(
+            evse_id=evse.id,
+            meter_value=[{
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "sampled_value": [{
+                    "value": round(evse.energy_wh),
+                    "measurand": MeasurandType.energy_active_import_register.value,
+                    "unit_of_measure": {
+                        "unit": "Wh",
+                        "multiplier": 0
+                    }
+                }]
+            }]
+        )
+
+    async def send_meter_values(self):
+        """Periodically send meter values of every EVSE with an active transaction."""
+        while self.charging:
+            for evse in self.charging:
+                request = self.sample(evse)
+                message_logger.info("Sending MeterValues from %s: EVSE %s Energy=%sWh",
+                                    self.id, evse.id, round(evse.energy_wh))
+                await self.deliver(request)
+            await asyncio.sleep(self.meter_interval)
+
+    async def deliver(self, request):
+        # Behind a backlog a sample is spooled too, so the server gets them in order
+        if self.cp is not None and (self.spool is None or not self.spool.pending):
+            try:
+                await self.cp.call_while_connected(request, suppress=False)
+                return
+            except GenericError as e:
+                # Throttled or busy: worth sending again later
+                logger.warning(f"{self.id}: meter values not taken: {e}")
+            except OCPPError as e:
+                logger.error(f"{self.id}: meter values rejected: {e}")
+                return
+            except Exception as e:
+                logger.error(f"{self.id}: failed to send meter values: {e}")
+        if self.spool is None:
+            if self.cp is None:
+                logger.error(f"{self.id}: failed to send meter values: not connected")
+            return
+        self.spool.append(request.evse_id, request.meter_value)
+        self.forward()
+
+    def forward(self):
+        """Start forwarding the spooled meter values, if connected and not already at it."""
+        if self.cp is None or self.spool is None or not self.spool.pending:
+            return
+        if not self.forward_task or self.forward_task.done():
+            self.forward_task = asyncio.create_task(self.forward_spool())
+
+    async def forward_spool(self):
+        messages = entries = 0
+        # The window read from the spool: its end offset and the per EVSE
+        # batches not delivered yet
+        end, batches = 0, []
+        try:
+            while self.cp is not None and (batches or self.spool.pending):
+                cp = self.cp
+                if not batches:
+                    end, batches = self.spool.read_batch(METER_BATCH_MAX_BYTES)
+                evse_id, meter_value = batches[0]
+                try:
+                    await cp.call_while_connected(
+                        call.MeterValuesPayload(evse_id=evse_id, meter_value=meter_value),
+                        suppress=False)
+                    messages += 1
+                    entries += len(meter_value)
+                except GenericError:
+                    await asyncio.sleep(FORWARD_RETRY_S * random.uniform(0.5, 1.5))
+                    continue
+                except OCPPError as e:
+                    logger.error(f"{self.id}: {len(meter_value)} spooled meter values rejected: {e}")
+                batches.pop(0)
+                if not batches:
+                    self.spool.commit(end)
+        except Exception as e:
+            logger.warning(f"{self.id}: forwarding spooled meter values stopped: {e!r}")
+        if messages:
+            logger.info(f"{self.id}: forwarded {entries} spooled meter values in {messages} messages")
+
+    async def connect(self, server_url: str):
+        """Connects to OCPP Central System via WebSocket."""
+        logger.info(f" Connecting to OCPP server: {server_url}")
+        async with websockets.connect(server_url, subprotocols=["ocpp2.0.1"]) as ws:
+            self.cp = ChargePoint(self.id, ws, self)
+            try:
+                await asyncio.gather(self.cp.start(), self.cp.send_boot_notification())
+            finally:
+                self.cp = None
+
+    async def run(self, host: str, initial_delay: float = 0.0):
+        """Stay connected to ``host``; never returns."""
+        ws_uri = f"ws://{host}:9000/{self.id}"
+        if METER_SPOOL_DIR:
+            self.spool = MeterSpool(os.path.join(METER_SPOOL_DIR, f"{self.id}.spool"),
+                                    int(METER_SPOOL_MAX_MB * 1024 * 1024))
+            self.spool.open()
+        await asyncio.sleep(initial_delay)
+        while True:
+            delay = RECONNECT_DELAY_S * random.uniform(0.5, 1.5)
+            try:
+                logger.info(f" Connecting to OCPP server at {ws_uri} …")
+                # This will run until the socket closes or an exception occurs
+                await self.connect(ws_uri)
+
+                # If we get here, the connection closed cleanly (no exception)
+                logger.warning(f" {self.id}: WebSocket closed cleanly; reconnecting in {delay:.0f}s…")
+
+            except ConnectionClosedError as e:
+                logger.warning(f" {self.id}: ConnectionClosedError: {e}; reconnecting in {delay:.0f}s…")
+
+            except InvalidStatusCode as e:
+                # 503 from the server's admission control carries Retry-After
+                try:
+                    delay = float(e.headers.get("Retry-After", delay))
+                except ValueError:
+                    pass
+                logger.warning(f" {self.id}: {e}; reconnecting in {delay:.0f}s…")
+
+            except Exception as e:
+                logger.error(f" {self.id}: unexpected error in OCPP client: {e}", exc_info=True)
+                logger.info(f"Reconnecting in {delay:.0f}s…")
+
+            # back‑off before retrying
+            await asyncio.sleep(delay)
+
+
 class ChargePoint(cp):
-    def __init__(self, id, connection):
+    def __init__(self, id, connection, station: Optional[Station] = None):
         super().__init__(id, connection)
-        self.meter_task = None
-        self.energy_counter = 1000
+        self.station = station or Station(id)
+
+    async def call_while_connected(self, payload, suppress=True):
+        """call() that fails once the websocket closes instead of waiting out the response timeout."""
+        response = asyncio.ensure_future(self.call(payload, suppress))
+        closed = asyncio.ensure_future(self._connection.wait_closed())
+        try:
+            await asyncio.wait({response, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not response.done():
+                response.cancel()
+        if not response.done():
+            raise ConnectionError("connection lost")
+        return response.result()
 
     async def send_heartbeat(self, interval: int):
         request = call.HeartbeatPayload()
@@ -47,54 +303,34 @@ class ChargePoint(cp):
             charging_station={"model": "RZG2L", "vendor_name": "Renesas Electronics"},
             reason=BootReasonType.power_up,
         )
-        response = await self.call(request)
-        if response.status == "Accepted":
-            logger.info("BootNotification accepted.")
-            await self.send_heartbeat(response.interval)
-        else:
-            logger.warning(f"BootNotification rejected with status: {response.status}")
-
-    async def send_meter_values(self):
-        """Periodically send meter values during active transaction."""
         while True:
-            self.energy_counter += 100
-            request = call.MeterValuesPayload(
-                evse_id=1,
-                meter_value=[{
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "sampled_value": [{
-                        "value": self.energy_counter,
-                        "measurand": MeasurandType.energy_active_import_register.value,
-                        "unit_of_measure": {
-                            "unit": "Wh",
-                            "multiplier": 0
-                        }
-                    }]
-                }]
-            )
-            logger.info(f"Sending MeterValues: Energy={self.energy_counter}Wh")
-            try:
-                await self.call(request)
-            except Exception as e:
-                logger.error(f"Failed to send meter values: {e}")
-            await asyncio.sleep(5)
+            response = await self.call(request)
+            if response is not None and response.status == "Accepted":
+                break
+            # Pending or Rejected: the server is busy (e.g. everyone is
+            # reconnecting) and tells us when to try again.
+            status = response.status if response is not None else "no response"
+            retry = (response.interval if response is not None else 0) or BOOT_RETRY_S
+            logger.warning(f"{self.id}: BootNotification {status}; retrying in {retry}s")
+            await asyncio.sleep(retry)
+        logger.info(f"{self.id}: BootNotification accepted.")
+        self.station.forward()
+        await self.send_heartbeat(response.interval)
 
     @on(Action.RequestStartTransaction)
-    async def on_remote_start_transaction(self, id_token, evse_id, **kwargs):
-        logger.info(f"RemoteStartTransaction received: id_token={id_token}, EVSE={evse_id}")
-        if not self.meter_task or self.meter_task.done():
-            self.meter_task = asyncio.create_task(self.send_meter_values())
-        return call_result.RequestStartTransactionPayload(status="Accepted")
+    async def on_remote_start_transaction(self, id_token, evse_id=None, **kwargs):
+        logger.info(f"{self.id}: RemoteStartTransaction received: id_token={id_token}, EVSE={evse_id}")
+        evse = self.station.start_transaction(evse_id)
+        if evse is None:
+            return call_result.RequestStartTransactionPayload(status="Rejected")
+        return call_result.RequestStartTransactionPayload(status="Accepted",
+                                                          transaction_id=evse.transaction_id)
 
     @on(Action.RequestStopTransaction)
     async def on_remote_stop_transaction(self, transaction_id, **kwargs):
-        logger.info(f"RemoteStopTransaction received: transaction_id={transaction_id}")
-        if self.meter_task:
-            self.meter_task.cancel()
-            try:
-                await self.meter_task
-            except asyncio.CancelledError:
-                logger.info("Meter task cancelled cleanly.")
+        logger.info(f"{self.id}: RemoteStopTransaction received: transaction_id={transaction_id}")
+        if await self.station.stop_transaction(transaction_id) is None:
+            return call_result.RequestStopTransactionPayload(status="Rejected")
         return call_result.RequestStopTransactionPayload(status="Accepted")
     
     @on("ChangeAvailability")
@@ -107,14 +343,17 @@ class ChargePoint(cp):
         return call_result.SetChargingProfilePayload(status=GetChargingProfileStatusType.accepted)
 
 
-async def start_ocpp_client(server_url: str, charge_point_id: str = "CP_1"):
-    """Connects to OCPP Central System via WebSocket."""
-    logger.info(f" Connecting to OCPP server: {server_url}")
-    async with websockets.connect(server_url, subprotocols=["ocpp2.0.1"]) as ws:
-        cp = ChargePoint(charge_point_id, ws)
-        await asyncio.gather(cp.start(), cp.send_boot_notification())
+def simulated_stations(charge_point_id: str) -> List[Station]:
+    if SIM_STATIONS == 1:
+        return [Station(charge_point_id, SIM_EVSES, METER_INTERVALS_S[0])]
+    return [Station(f"{charge_point_id}_{index}", SIM_EVSES,
+                    METER_INTERVALS_S[(index - 1) % len(METER_INTERVALS_S)])
+            for index in range(1, SIM_STATIONS + 1)]
 
 
+async def run_stations(host: str, stations: List[Station]):
+    await asyncio.gather(*(station.run(host, random.uniform(0, SIM_RAMP_S))
+                           for station in stations))
 
 
 def greengrass_handler():
@@ -123,27 +362,12 @@ def greengrass_handler():
     if not server_url:
         raise ValueError("Missing OCPP server URL")
 
-    ws_uri = f"ws://{server_url}:9000/{charge_point_id}"
+    stations = simulated_stations(charge_point_id)
+    if len(stations) > 1 or SIM_EVSES > 1:
+        logger.info(f" Simulating {len(stations)} charge points with {SIM_EVSES} EVSEs each")
 
     # **Main loop**: never returns, so Greengrass keeps the Lambda container alive
-    while True:
-        try:
-            logger.info(f" Connecting to OCPP server at {ws_uri} …")
-            # This will run until the socket closes or an exception occurs
-            asyncio.run(start_ocpp_client(ws_uri, charge_point_id))
-
-            # If we get here, the connection closed cleanly (no exception)
-            logger.warning(" WebSocket closed cleanly; reconnecting in 5s…")
-
-        except ConnectionClosedError as e:
-            logger.warning(f" ConnectionClosedError: {e}; reconnecting in 5s…")
-
-        except Exception as e:
-            logger.error(f" Unexpected error in OCPP client: {e}", exc_info=True)
-            logger.info("Reconnecting in 5s…")
-
-        # back‑off before retrying
-        time.sleep(5)
+    asyncio.run(run_stations(server_url, stations))
 
 if __name__ == "__main__":
     greengrass_handler()
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Optional orjson fast path for JSON encoding and decoding.
+
+If orjson is installed (``pip install orjson``) and FAST_JSON is not set to
+"off", ``dumps``/``loads`` use it; otherwise they are the stdlib functions.
+``install_ocpp_codec`` switches the ocpp library's frame codec (message
+parsing and ``to_json`` of Call, CallResult and CallError) to the same
+functions. Anything orjson refuses (e.g. integers beyond 64 bits) is
+handed to the stdlib, so behaviour only differs in speed.
+
+This file is shared by the central server and the charging point client;
+keep the copies identical.
+"""
+import decimal
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENABLED = orjson is not None and os.getenv("FAST_JSON", "auto").lower() not in ("off", "0", "false")
+
+
+def _default(obj):
+    # Same conversion as ocpp's _DecimalEncoder
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> str:
+    """Compact JSON text (no spaces after separators)."""
+    if ENABLED:
+        try:
+            return orjson.dumps(obj, default=_default).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), default=_default)
+
+
+def loads(text):
+    if ENABLED:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def install_ocpp_codec() -> bool:
+    """Route ocpp frame (de)serialization through dumps/loads."""
+    if not ENABLED:
+        return False
+    from ocpp import charge_point, messages
+    from ocpp.exceptions import FormatViolationError
+
+    stdlib_unpack = messages.unpack
+
+    def unpack(msg):
+        try:
+            parsed = orjson.loads(msg)
+        except orjson.JSONDecodeError:
+            # Let the stdlib produce the library's usual error (or parse
+            # what orjson does not support).
+            return stdlib_unpack(msg)
+        if not isinstance(parsed, list):
+            return stdlib_unpack(msg)
+        for cls in (messages.Call, messages.CallResult, messages.CallError):
+            try:
+                if parsed[0] == cls.message_type_id:
+                    return cls(*parsed[1:])
+            except IndexError:
+                return stdlib_unpack(msg)
+        return stdlib_unpack(msg)
+
+    def call_to_json(self):
+        return dumps([self.message_type_id, self.unique_id, self.action, self.payload])
+
+    def call_result_to_json(self):
+        return dumps([self.message_type_id, self.unique_id, self.payload])
+
+    def call_error_to_json(self):
+        return dumps([self.message_type_id, self.unique_id, self.error_code,
+                      self.error_description, self.error_details])
+
+    messages.unpack = unpack
+    charge_point.unpack = unpack
+    messages.Call.to_json = call_to_json
+    messages.CallResult.to_json = call_result_to_json
+    messages.CallError.to_json = call_error_to_json
+    return True
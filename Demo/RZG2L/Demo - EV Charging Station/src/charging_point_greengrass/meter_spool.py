@@ -0,0 +1,115 @@
+"""
+Store-and-forward spool of meter values the central server has not received.
+
+Samples that cannot be sent (no connection, or the call failed) are
+appended to ``<station>.spool``, one JSON line ``[evse_id, meter_value]``
+each, and survive reconnects and restarts. Once the station is connected
+again the backlog is read back in windows of at most ``max_bytes`` and
+sent as a few MeterValues messages carrying many ``meter_value`` entries,
+one per EVSE in the window. Delivery is at least once: a window is only
+committed after every message in it was answered, so a connection lost
+halfway sends part of it again.
+
+``<station>.spool.offset`` holds how far the spool has been forwarded
+(replaced atomically); once everything is forwarded the spool is
+truncated. A line torn by a crash while it was written is cut off when
+the spool is opened.
+"""
+import logging
+import os
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import fast_json
+
+logger = logging.getLogger(__name__)
+
+
+class MeterSpool:
+    def __init__(self, path: str, max_bytes: int = 64 << 20):
+        self.path = path
+        self.offset_path = path + ".offset"
+        # Samples are dropped once the spool reaches max_bytes (0: no limit)
+        self.max_bytes = max_bytes
+        self.offset = 0
+        self.size = 0
+        self.dropped = 0
+        self._file: Optional[BinaryIO] = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a+b")
+        self.size = self._file.seek(0, os.SEEK_END)
+        if self.size:
+            # Cut off a line torn by a crash
+            self._file.seek(max(0, self.size - 1))
+            if self._file.read(1) != b"\n":
+                self._file.seek(0)
+                complete = self._file.read().rfind(b"\n") + 1
+                self._file.truncate(complete)
+                self.size = complete
+        try:
+            with open(self.offset_path) as f:
+                self.offset = min(int(f.read() or 0), self.size)
+        except (OSError, ValueError):
+            self.offset = 0
+        if self.pending:
+            logger.info(f"{self.path}: {self.size - self.offset} bytes of meter values to forward")
+
+    @property
+    def pending(self) -> bool:
+        return self.offset < self.size
+
+    @property
+    def full(self) -> bool:
+        return bool(self.max_bytes) and self.size >= self.max_bytes
+
+    def append(self, evse_id: int, meter_value: List[dict]) -> bool:
+        """Spool the entries of one MeterValues message; False if the spool is full."""
+        if self.full:
+            if not self.dropped:
+                logger.warning(f"{self.path} reached {self.size} bytes; dropping meter values")
+            self.dropped += len(meter_value)
+            return False
+        data = "".join(fast_json.dumps([evse_id, entry]) + "\n" for entry in meter_value).encode()
+        self._file.write(data)
+        self._file.flush()
+        self.size += len(data)
+        return True
+
+    def read_batch(self, max_bytes: int) -> Tuple[int, List[Tuple[int, List[dict]]]]:
+        """
+        Spooled entries from the forwarded offset on, up to ``max_bytes``
+        of them (at least one), grouped per EVSE in spool order, and the
+        offset to ``commit`` once they are delivered.
+        """
+        self._file.seek(self.offset)
+        data = self._file.read(min(max_bytes, self.size - self.offset))
+        end = data.rfind(b"\n") + 1
+        if not end:
+            # A single entry larger than max_bytes still has to go
+            self._file.seek(self.offset)
+            data = self._file.readline()
+            end = len(data)
+        batches: Dict[int, List[dict]] = {}
+        for line in data[:end].splitlines():
+            evse_id, entry = fast_json.loads(line)
+            batches.setdefault(evse_id, []).append(entry)
+        return self.offset + end, list(batches.items())
+
+    def commit(self, offset: int):
+        self.offset = offset
+        if self.offset >= self.size:
+            self._file.truncate(0)
+            self.offset = self.size = 0
+            if self.dropped:
+                logger.warning(f"{self.path}: {self.dropped} meter values were dropped while it was full")
+                self.dropped = 0
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp, self.offset_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,347 @@
+"""
+Load generator and latency benchmark for the OCPP central server.
+
+Opens many simulated charge points (the ChargePoint client from
+charging_point_greengrass.py) against a server, ramping the connection
+rate, and drives BootNotification, Heartbeat and MeterValues at fixed
+rates. Stations whose BootNotification is not accepted (e.g. Pending under
+admission control) are counted apart and send nothing else. The server's
+event-loop lag is taken from its /metrics before and after the run. At
+the end a JSON report is printed (and optionally written to a file) so
+runs can be compared:
+
+    python3 ocpp_benchmark.py --url ws://127.0.0.1:9000 --stations 2000 \\
+        --ramp 200 --duration 120 --server-pid $(pgrep -f central_server.py) \\
+        --output run.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import resource
+import time
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import websockets
+from ocpp.v201 import call
+from ocpp.v201.enums import BootReasonType, MeasurandType
+
+from charging_point_greengrass import ChargePoint, validation
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_ms(values):
+    return {
+        "count": len(values),
+        "p50_ms": None if not values else round(percentile(values, 50) * 1000, 3),
+        "p99_ms": None if not values else round(percentile(values, 99) * 1000, 3),
+        "max_ms": None if not values else round(max(values) * 1000, 3),
+    }
+
+
+def read_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.connect_times = []
+        self.connect_failures = 0
+        # BootNotification status (or "no response") of stations not accepted
+        self.boots_not_accepted = {}
+        self.server_rss = []
+
+    def record(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+    def record_error(self, action):
+        self.errors[action] = self.errors.get(action, 0) + 1
+
+    def record_boot(self, status):
+        self.boots_not_accepted[status] = self.boots_not_accepted.get(status, 0) + 1
+
+
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def scrape_loop_lag(metrics_url):
+    """
+    The server's event_loop_lag_seconds histogram per loop (and worker):
+    {"loop=ocpp": {"count": n, "sum": s, "buckets": {le: n}}}.
+    """
+    with urllib.request.urlopen(metrics_url, timeout=10) as response:
+        text = response.read().decode()
+    histograms = {}
+    for line in text.splitlines():
+        if not line.startswith("event_loop_lag_seconds"):
+            continue
+        name, _, value = line.rpartition(" ")
+        labels = dict(LABEL.findall(name))
+        le = labels.pop("le", None)
+        key = ",".join(f"{label}={labels[label]}" for label in sorted(labels))
+        histogram = histograms.setdefault(key, {"count": 0, "sum": 0.0, "buckets": {}})
+        if name.startswith("event_loop_lag_seconds_bucket"):
+            histogram["buckets"][le] = float(value)
+        elif name.startswith("event_loop_lag_seconds_sum"):
+            histogram["sum"] = float(value)
+        elif name.startswith("event_loop_lag_seconds_count"):
+            histogram["count"] = float(value)
+    return histograms
+
+
+def summarize_loop_lag(before, after):
+    """Timers observed during the run, their mean lag and the bucket holding the p99."""
+    summary = {}
+    for key, histogram in after.items():
+        previous = before.get(key, {"count": 0, "sum": 0.0, "buckets": {}})
+        count = histogram["count"] - previous["count"]
+        if count <= 0:
+            continue
+        p99 = None
+        for le, cumulative in sorted(histogram["buckets"].items(), key=lambda item: float(item[0])):
+            if cumulative - previous["buckets"].get(le, 0) >= 0.99 * count:
+                p99 = le
+                break
+        summary[key] = {
+            "timers": int(count),
+            "mean_ms": round((histogram["sum"] - previous["sum"]) / count * 1000, 3),
+            "p99_below_ms": None if p99 in (None, "+Inf") else round(float(p99) * 1000, 3),
+        }
+    return summary
+
+
+class BenchmarkChargePoint(ChargePoint):
+    """ChargePoint that times every call it makes."""
+
+    def __init__(self, id, connection, results):
+        super().__init__(id, connection)
+        self.results = results
+        self.energy_counter = 1000
+
+    async def call(self, payload, suppress=True):
+        action = payload.__class__.__name__[:-7]
+        started = time.perf_counter()
+        try:
+            response = await super().call(payload, suppress)
+        except Exception:
+            self.results.record_error(action)
+            raise
+        self.results.record(action, time.perf_counter() - started)
+        return response
+
+    def meter_values_payload(self, samples):
+        self.energy_counter += 100
+        return call.MeterValuesPayload(
+            evse_id=1,
+            meter_value=[{
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "sampled_value": [{
+                    "value": self.energy_counter,
+                    "measurand": MeasurandType.energy_active_import_register.value,
+                    "unit_of_measure": {"unit": "Wh", "multiplier": 0}
+                }] * samples
+            }]
+        )
+
+
+async def periodic(interval, send, stop):
+    # Random phase so stations do not fire in lockstep
+    delay = random.uniform(0, interval)
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await send()
+        except Exception:
+            pass
+        delay = interval
+
+
+async def run_station(args, index, results, stop):
+    cp_id = f"{args.prefix}{index}"
+    started = time.perf_counter()
+    try:
+        ws = await websockets.connect(f"{args.url}/{cp_id}", subprotocols=["ocpp2.0.1"],
+                                      open_timeout=args.timeout)
+    except Exception:
+        results.connect_failures += 1
+        return
+    results.connect_times.append(time.perf_counter() - started)
+
+    cp = BenchmarkChargePoint(cp_id, ws, results)
+    cp._response_timeout = args.timeout
+    reader = asyncio.create_task(cp.start())
+    try:
+        try:
+            response = await cp.call(call.BootNotificationPayload(
+                charging_station={"model": "RZG2L", "vendor_name": "Renesas Electronics"},
+                reason=BootReasonType.power_up,
+            ))
+        except Exception:
+            response = None
+        if response is None or response.status != "Accepted":
+            # Not allowed to send anything else until accepted
+            results.record_boot(response.status if response is not None else "no response")
+            return
+        tasks = []
+        if args.heartbeat_interval > 0:
+            tasks.append(periodic(args.heartbeat_interval,
+                                  lambda: cp.call(call.HeartbeatPayload()), stop))
+        if args.meter_interval > 0:
+            tasks.append(periodic(args.meter_interval,
+                                  lambda: cp.call(cp.meter_values_payload(args.samples)), stop))
+        await asyncio.gather(*tasks, stop.wait())
+    finally:
+        reader.cancel()
+        await ws.close()
+
+
+async def monitor(args, results, stop, interval=0.5):
+    # RSS of the server under test
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        if args.server_pid:
+            rss = read_rss_mb(args.server_pid)
+            if rss is not None:
+                results.server_rss.append(rss)
+
+
+async def run(args):
+    results = Results()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    lag_before = None
+    if args.metrics_url:
+        try:
+            lag_before = await loop.run_in_executor(None, scrape_loop_lag, args.metrics_url)
+        except OSError as e:
+            logger.warning(f"Cannot read {args.metrics_url}: {e}; no server loop lag in the report")
+    monitor_task = asyncio.create_task(monitor(args, results, stop))
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    stations = []
+    for index in range(args.stations):
+        stations.append(asyncio.create_task(run_station(args, index, results, stop)))
+        if args.ramp > 0:
+            await asyncio.sleep(1 / args.ramp)
+    ramp_seconds = time.perf_counter() - started
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*stations, return_exceptions=True)
+    await monitor_task
+    elapsed = time.perf_counter() - started
+    server_loop_lag = None
+    if lag_before is not None:
+        try:
+            server_loop_lag = summarize_loop_lag(
+                lag_before, await loop.run_in_executor(None, scrape_loop_lag, args.metrics_url))
+        except OSError as e:
+            logger.warning(f"Cannot read {args.metrics_url}: {e}; no server loop lag in the report")
+
+    calls = {action: summarize_ms(values) for action, values in results.latencies.items()}
+    for action, count in results.errors.items():
+        calls.setdefault(action, summarize_ms([]))["errors"] = count
+    total_calls = sum(len(values) for values in results.latencies.values())
+
+    return {
+        "label": args.label,
+        "started_at": started_at,
+        "config": {
+            "url": args.url,
+            "stations": args.stations,
+            "ramp_per_s": args.ramp,
+            "duration_s": args.duration,
+            "heartbeat_interval_s": args.heartbeat_interval,
+            "meter_interval_s": args.meter_interval,
+            "samples_per_meter_value": args.samples,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "ramp_s": round(ramp_seconds, 3),
+        "connections": {
+            "established": len(results.connect_times),
+            "failed": results.connect_failures,
+            "booted": len(results.connect_times) - sum(results.boots_not_accepted.values()),
+            "boot_not_accepted": results.boots_not_accepted,
+            **summarize_ms(results.connect_times),
+        },
+        "calls": calls,
+        "messages_per_s": round(total_calls / elapsed, 1) if elapsed else 0,
+        "server_rss_mb": {
+            "start": results.server_rss[0] if results.server_rss else None,
+            "end": results.server_rss[-1] if results.server_rss else None,
+            "peak": max(results.server_rss) if results.server_rss else None,
+        },
+        "server_loop_lag": server_loop_lag,
+        "client_validation": {"validated": validation.validated, "skipped": validation.skipped},
+    }
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCPP central server load generator")
+    parser.add_argument("--url", default="ws://127.0.0.1:9000")
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=100, help="new connections per second (0 = all at once)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run after the ramp")
+    parser.add_argument("--heartbeat-interval", type=float, default=10)
+    parser.add_argument("--meter-interval", type=float, default=5)
+    parser.add_argument("--samples", type=int, default=1, help="sampled values per MeterValues")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--prefix", default="BENCH_")
+    parser.add_argument("--server-pid", type=int, help="sample RSS of this process")
+    parser.add_argument("--metrics-url",
+                        help="server /metrics to read the event-loop lag from "
+                             "(default: port 8001 of the --url host; empty: skip)")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    if args.metrics_url is None:
+        args.metrics_url = f"http://{urlparse(args.url).hostname}:8001/metrics"
+
+    # The client module logs every message at INFO; keep the benchmark quiet.
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("ocpp").setLevel(logging.WARNING)
+    raise_fd_limit()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
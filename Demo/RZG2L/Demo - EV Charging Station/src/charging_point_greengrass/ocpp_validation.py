@@ -0,0 +1,125 @@
+"""
+Per-action JSON-schema validation policy for OCPP payloads.
+
+The ocpp library validates every payload it sends or receives. With
+``install`` each action gets a policy instead:
+
+    always   validate every payload (the library's behaviour)
+    sampled  validate one payload in ``sample_every``
+    off      never validate (trusted peers)
+
+The policy applies to both the request and the response of an action;
+each direction is sampled on its own.
+Configured from the environment, e.g.
+
+    OCPP_VALIDATION="MeterValues=sampled,Heartbeat=off"  OCPP_VALIDATION_SAMPLE=100
+
+Actions that are not listed use the ``*`` entry, which defaults to
+"always", so BootNotification and the command responses stay validated.
+
+If fastjsonschema is installed, each schema is compiled to Python code
+once per (message type, action) and payloads are checked with that, which
+is several times faster than the library's jsonschema validator. Payloads
+the compiled check rejects, and all payloads without fastjsonschema, go
+through the library's ``validate_payload``, so the OCPP errors raised are
+unchanged. fastjsonschema is in requirements.txt; ``install`` logs when it
+is missing.
+
+This file is shared by the central server and the charging point client;
+keep the copies identical.
+"""
+import logging
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+from ocpp import charge_point, messages
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("always", "sampled", "off")
+
+stdlib_validate = messages.validate_payload
+
+
+class ValidationPolicy:
+    def __init__(self, policies: Optional[Dict[str, str]] = None, default: str = "always",
+                 sample_every: int = 100):
+        policies = dict(policies or {})
+        default = policies.pop("*", default)
+        for action, policy in list(policies.items()) + [("*", default)]:
+            if policy not in POLICIES:
+                raise ValueError(f"Invalid validation policy {policy!r} for {action}; "
+                                 f"use one of {', '.join(POLICIES)}")
+        self.policies = policies
+        self.default = default
+        self.sample_every = max(1, sample_every)
+        self.validated: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+        # Per (action, message type): requests and responses are sampled apart
+        self._seen: Dict[Tuple[str, int], int] = {}
+        self._compiled: Dict[Tuple[int, str, str], Optional[Callable]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ValidationPolicy":
+        spec = os.getenv("OCPP_VALIDATION", "")
+        policies = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            action, _, policy = item.partition("=")
+            policies[action.strip()] = policy.strip().lower()
+        return cls(policies, sample_every=int(os.getenv("OCPP_VALIDATION_SAMPLE", "100")))
+
+    def should_validate(self, action: str, message_type_id: int = messages.MessageType.Call) -> bool:
+        policy = self.policies.get(action, self.default)
+        if policy == "always":
+            return True
+        if policy == "sampled":
+            key = (action, message_type_id)
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            if seen % self.sample_every == 0:
+                return True
+        self.skipped[action] = self.skipped.get(action, 0) + 1
+        return False
+
+    def compiled(self, message, ocpp_version) -> Optional[Callable]:
+        key = (message.message_type_id, message.action, ocpp_version)
+        if key not in self._compiled:
+            self._compiled[key] = None
+            # OCPP 1.6 needs Decimal parsing for some actions; leave it to the library.
+            if fastjsonschema is not None and ocpp_version != "1.6" and \
+                    type(message) in (messages.Call, messages.CallResult):
+                try:
+                    schema = messages.get_validator(
+                        message.message_type_id, message.action, ocpp_version).schema
+                    self._compiled[key] = fastjsonschema.compile(schema, use_default=False)
+                except (OSError, ValueError, fastjsonschema.JsonSchemaDefinitionException):
+                    pass
+        return self._compiled[key]
+
+    def validate(self, message, ocpp_version):
+        if not self.should_validate(message.action, message.message_type_id):
+            return
+        self.validated[message.action] = self.validated.get(message.action, 0) + 1
+        compiled = self.compiled(message, ocpp_version)
+        if compiled is not None:
+            try:
+                compiled(message.payload)
+                return
+            except fastjsonschema.JsonSchemaException:
+                pass
+        stdlib_validate(message, ocpp_version)
+
+
+def install(policy: Optional[ValidationPolicy] = None) -> ValidationPolicy:
+    """Make ChargePoint validation follow ``policy`` (default: from the environment)."""
+    policy = policy or ValidationPolicy.from_env()
+    if fastjsonschema is None:
+        logger.warning("fastjsonschema is not installed: OCPP payloads are validated "
+                       "with the slower jsonschema validator")
+    charge_point.validate_payload = policy.validate
+    return policy
@@ -10,6 +10,7 @@ export const BaseURLProvider = ({ children }) => {
 
   const [health, setHealth] = useState('unknown')
   const [statusData, setStatusData] = useState(null);
+  const [stationId, setStationId] = useState(null);
 
   useEffect(() => {
     const fetchAllData = async () => {
@@ -27,33 +28,7 @@ export const BaseURLProvider = ({ children }) => {
             console.error("Station fetch error:", stationError);
             return;
           }
-
-
-          // Step 3: Fetch status for a specific CP
-          const fetchStatus = async () => {
-            try {
-              const res = await fetch(`${baseURL}/status/${stationData[0].id}`);
-
-              if (!res.ok) {
-                setStatusData(null)
-                return;
-              }
-              const data = await res.json();
-              // setChargerStatus(statusData.status);
-              setStatusData(data.status)
-              // setButtonActvie(statusData.status)
-              // console.log(`${selectedStation.id} is ${statusData.status}`);
-            } catch (error) {
-              setStatusData(null)
-              return
-            }
-          };
-          await fetchStatus();
-
-
-          const interval = setInterval(fetchStatus, 10000)
-
-          return () => clearInterval(interval);
+          setStationId(stationData[0].id);
         }
 
       } catch (err) {
@@ -64,6 +39,43 @@ export const BaseURLProvider = ({ children }) => {
     fetchAllData();
   }, []);
 
+  useEffect(() => {
+    if (!baseURL || !stationId) return;
+
+    // Step 3: Fetch status for a specific CP
+    const fetchStatus = async () => {
+      try {
+        const res = await fetch(`${baseURL}/status/${stationId}`);
+
+        if (!res.ok) {
+          setStatusData(null)
+          return;
+        }
+        const data = await res.json();
+        setStatusData(data.status)
+      } catch (error) {
+        setStatusData(null)
+        return
+      }
+    };
+    fetchStatus();
+
+    if (window.EventSource) {
+      // Status changes are pushed by the server instead of polled
+      const source = new EventSource(
+        `${baseURL}/events?topic=status&station=${encodeURIComponent(stationId)}`);
+      source.addEventListener("status", (event) => {
+        setStatusData(JSON.parse(event.data).status)
+      });
+      source.onopen = fetchStatus;
+
+      return () => source.close();
+    }
+
+    const interval = setInterval(fetchStatus, 10000)
+
+    return () => clearInterval(interval);
+  }, [baseURL, stationId]);
 
   return (
     <BaseURLContext.Provider value={{ baseURL, statusData }}>
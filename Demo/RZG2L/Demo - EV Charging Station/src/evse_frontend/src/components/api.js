@@ -147,10 +147,14 @@ export const StopCharging = async (BASE_URL, station_id) => {
 
 
 
-export const showMeterReading = async (BASE_URL, station_id) => {
+// Pass the `latest_cursor` of the previous response as `since` to fetch only
+// the readings that arrived after it.
+export const showMeterReading = async (BASE_URL, station_id, since = null) => {
   try {
     // const response = await axios.get(`http://localhost:8001/stations/${station_id}/meter-history`)
-    const response = await axios.get(`${BASE_URL}/stations/${station_id}/meter-history`)
+    const response = await axios.get(`${BASE_URL}/stations/${station_id}/meter-history`, {
+      params: since ? { since } : {}
+    })
     return response
   }
   catch (error) {
@@ -159,6 +163,36 @@ export const showMeterReading = async (BASE_URL, station_id) => {
 }
 
 
+// Same as showMeterReading, as one series per EVSE and measurand with
+// parallel `timestamps` (epoch seconds) and `values` arrays.
+export const showMeterHistoryColumnar = async (BASE_URL, station_id, since = null) => {
+  try {
+    const response = await axios.get(`${BASE_URL}/stations/${station_id}/meter-history`, {
+      params: since ? { format: "columnar", since } : { format: "columnar" }
+    })
+    return response
+  }
+  catch (error) {
+    console.log("Error", error)
+  }
+}
+
+
+// Server-side aggregates (resolution: "1m", "15m" or "1h"). Long-range charts
+// should plot these buckets instead of raw readings.
+export const showMeterRollups = async (BASE_URL, station_id, resolution = "15m", measurand = null) => {
+  try {
+    const response = await axios.get(`${BASE_URL}/stations/${station_id}/meter-rollups`, {
+      params: measurand ? { resolution, measurand } : { resolution }
+    })
+    return response
+  }
+  catch (error) {
+    console.log("Error", error)
+  }
+}
+
+
 export const fetchChargeUtilization = () => {
   return Promise.resolve({
     x: ["Charger A", "Charger B", "Charger C"],
@@ -0,0 +1,67 @@
+import React, { useState, useEffect } from "react";
+import Plot from "react-plotly.js";
+import {
+  Box,
+  Typography
+} from "@mui/material";
+import { showMeterRollups } from "../api";
+
+// Long-range energy chart: one bar per server-side bucket instead of one
+// point per raw reading, so its cost does not grow with the sample rate.
+export default function EnergyHistoryPlot({ baseURL, stationId, resolution = "15m", refreshKey }) {
+  const [starts, setStarts] = useState([])
+  const [energyKWh, setEnergyKWh] = useState([])
+
+  useEffect(() => {
+    if (!baseURL || !stationId) return;
+    let cancelled = false
+    const fetchRollups = async () => {
+      const response = await showMeterRollups(baseURL, stationId, resolution, "Energy.Active.Import.Register")
+      if (cancelled) return
+      // Summed over the station's EVSEs
+      const totals = new Map()
+      for (const series of response?.data?.series || []) {
+        for (const bucket of series.buckets) {
+          totals.set(bucket.start, (totals.get(bucket.start) || 0) + (bucket.energy_delta || 0))
+        }
+      }
+      const sorted = [...totals.keys()].sort((a, b) => new Date(a) - new Date(b))
+      setStarts(sorted)
+      setEnergyKWh(sorted.map(start => totals.get(start) / 1000))
+    }
+    fetchRollups()
+    return () => { cancelled = true }
+  }, [baseURL, stationId, resolution, refreshKey])
+
+  if (starts.length === 0) {
+    return null
+  }
+
+  return (
+    <Box mt={4}>
+      <Typography variant="h6">Energy per {resolution}</Typography>
+      <Plot
+        data={[
+          {
+            x: starts,
+            y: energyKWh,
+            type: 'bar',
+            marker: { color: 'green' },
+            name: '(kWh)',
+          },
+        ]}
+        layout={{
+          xaxis: { title: 'Time', type: 'date', showgrid: false },
+          yaxis: { title: 'Energy (kWh)', showgrid: true },
+          margin: { t: 20, b: 40 },
+          autosize: true,
+          dragmode: false
+        }}
+        config={{
+          responsive: true,
+        }}
+        style={{ width: '100%', height: '100%' }}
+      />
+    </Box>
+  )
+}
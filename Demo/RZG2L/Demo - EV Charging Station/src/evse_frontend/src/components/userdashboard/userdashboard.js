@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import {
   Box,
   Card,
@@ -15,10 +15,15 @@ import {
 } from "@mui/material";
 import Snackbar from '@mui/material/Snackbar';
 import MetricPlot from "./metricdataplot";
+import EnergyHistoryPlot from "./energyhistoryplot";
 
-import { StartCharging, StopCharging, mockStationsData, getStationList, showMeterReading, getStationListforAdmin, getMeterRate } from "../api";
+import { StartCharging, StopCharging, mockStationsData, getStationList, showMeterHistoryColumnar, getStationListforAdmin, getMeterRate } from "../api";
 import { useBaseURL } from "../../BaseURLContext";
 
+// The chart plots the energy register, whether a reading arrives pushed or
+// through a delta fetch; readings without one are skipped.
+const ENERGY_MEASURAND = "Energy.Active.Import.Register"
+
 export default function UserDashboard() {
   const { baseURL, statusData } = useBaseURL();
 
@@ -37,6 +42,97 @@ export default function UserDashboard() {
 
   const [mockStations, setmockStations] = useState(null);
 
+  // Meter history is fetched incrementally: the cursor remembers the newest
+  // reading already plotted so each poll only downloads what is new.
+  const meterCursor = useRef(null)
+  const lastEnergy = useRef(0)
+  const meterFetch = useRef(Promise.resolve())
+
+  const lastTimestamp = useRef(0)
+
+  // points: [time (ms), energy (Wh)] in time order
+  const appendPoints = (points, cursor) => {
+    const newEnergy = [];
+    const newTimestamps = [];
+
+    points.forEach(([time, energyWh]) => {
+      // A pushed reading may already have arrived through a delta fetch
+      if (time <= lastTimestamp.current) return;
+      lastTimestamp.current = time
+      meterCursor.current = cursor
+
+      const value = energyWh / 1000 || 0;
+      if (value >= lastEnergy.current) {
+        newEnergy.push(value);
+        newTimestamps.push(new Date(time).toISOString());
+        lastEnergy.current = value;
+      }
+    });
+
+    if (newTimestamps.length > 0) {
+      setTimeStamps(prev => [...prev, ...newTimestamps]);
+      setEnergyKWh(prev => [...prev, ...newEnergy]);
+    }
+  }
+
+  const appendReadings = (readings, cursor) => {
+    const points = readings
+      .map(r => [r.timestamp, r.sampled_values?.find(v => v.measurand === ENERGY_MEASURAND)])
+      .filter(([, sample]) => sample)
+      .map(([timestamp, sample]) => [new Date(timestamp).getTime(), sample.value])
+      .sort((a, b) => a[0] - b[0])
+    appendPoints(points, cursor)
+  }
+
+  // The columnar history avoids an object per reading
+  const loadMeterDelta = async () => {
+    const meterHistory = await showMeterHistoryColumnar(baseURL, selectedStationId, meterCursor.current)
+    const series = meterHistory?.data?.series
+    if (!series) return
+    const energy = series.find(s => s.measurand === ENERGY_MEASURAND)
+    if (!energy) return
+    appendPoints(energy.timestamps.map((t, i) => [t * 1000, energy.values[i]]),
+      meterHistory.data.latest_cursor)
+  }
+
+  // Serialise fetches and pushed readings so a poll, a push and the final
+  // fetch on stop never race on the cursor.
+  const enqueueMeterUpdate = (update) => {
+    meterFetch.current = meterFetch.current
+      .then(update)
+      .catch(error => console.log("Error", error))
+    return meterFetch.current
+  }
+
+  const fetchMeterDelta = () => enqueueMeterUpdate(loadMeterDelta)
+
+  useEffect(() => {
+    meterCursor.current = null
+    lastEnergy.current = 0
+    lastTimestamp.current = 0
+    setTimeStamps([])
+    setEnergyKWh([])
+  }, [selectedStationId])
+
+  useEffect(() => {
+    if (!chargeStatus || !selectedStationId) return;
+    fetchMeterDelta()
+    if (window.EventSource) {
+      // The server pushes each new reading; after a (re)connect a delta
+      // fetch fills whatever was missed while the stream was down.
+      const source = new EventSource(
+        `${baseURL}/events?topic=meter&station=${encodeURIComponent(selectedStationId)}`)
+      source.onopen = fetchMeterDelta
+      source.addEventListener("meter", (event) => {
+        const { cursor, ...reading } = JSON.parse(event.data)
+        enqueueMeterUpdate(() => appendReadings([reading], cursor))
+      })
+      return () => source.close()
+    }
+    const interval = setInterval(fetchMeterDelta, 5000)
+    return () => clearInterval(interval)
+  }, [chargeStatus, selectedStationId])
+
 
   useEffect(() => {
     const fetchData = async () => {
@@ -91,26 +187,7 @@ export default function UserDashboard() {
     setLoading(false)
     try {
       const data = await StopCharging(baseURL, selectedStationId)
-      const meterReading = await showMeterReading(baseURL, selectedStationId)
-      const sortedReadings = [...meterReading.data.readings].sort(
-        (a, b) => new Date(a.timestamp) - new Date(b.timestamp)
-      );
-
-      let previous = 0;
-      const energyKWh = [];
-      const timestamps = [];
-
-      sortedReadings.forEach(r => {
-        const value = r.sampled_values?.[0]?.value / 1000 || 0;
-        if (value >= previous) {
-          energyKWh.push(value);
-          timestamps.push(r.timestamp);
-          previous = value;
-        }
-      });
-
-      setTimeStamps(timestamps);
-      setEnergyKWh(energyKWh);
+      await fetchMeterDelta()
     }
     catch (error) {
       console.log("Error", error)
@@ -242,6 +319,13 @@ export default function UserDashboard() {
             loading={loading}
           />
           )}
+          {selectedStationId && (
+          <EnergyHistoryPlot
+            baseURL={baseURL}
+            stationId={selectedStationId}
+            refreshKey={chargeStatus}
+          />
+          )}
         </>
       )) : (<Typography><h1>No stations available</h1></Typography>)}
 
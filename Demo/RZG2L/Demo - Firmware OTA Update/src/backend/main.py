@@ -3,7 +3,7 @@ from pydantic import BaseModel
 import boto3
 import os
 import json
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 import uvicorn
 from fastapi import FastAPI
 from fastapi.responses import  JSONResponse
@@ -18,8 +18,14 @@ from fastapi.middleware.cors import CORSMiddleware
 # from cryptography.hazmat.primitives.asymmetric import rsa
 # from cryptography.hazmat.primitives import serialization 
 
+# orjson renders responses faster when installed; FAST_JSON=off disables it
+try:
+    import orjson  # noqa: F401
+    FAST_JSON = os.getenv("FAST_JSON", "auto").lower() not in ("off", "0", "false")
+except ImportError:
+    FAST_JSON = False
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse if FAST_JSON else JSONResponse)
 
 app.add_middleware(
   CORSMiddleware,
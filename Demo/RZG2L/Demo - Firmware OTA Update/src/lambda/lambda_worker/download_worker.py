@@ -14,9 +14,12 @@ import uuid
 import socket
 import subprocess
 import sys
+from log_setup import setup_logging
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging: a background thread writes (and flushes) each record to
+# stdout, where Greengrass captures it
+setup_logging(level=logging.INFO, fmt="[%(asctime)s] [%(levelname)s] %(message)s",
+              stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
 
@@ -138,31 +141,15 @@ mqtt_connection = mqtt_connection_builder.mtls_from_path(
 
 
 def install_bundle(path):
-    def log_message(level, message):
-        """Force immediate logging that Greengrass will capture"""
-        timestamp = __import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{timestamp}] [{level}] {message}", flush=True)
-        
-        try:
-            if level.upper() == 'INFO':
-                logger.info(message)
-            elif level.upper() == 'ERROR':
-                logger.error(message)
-            elif level.upper() == 'EXCEPTION':
-                logger.exception(message)
-            
-            # Force flush logger handlers
-            for handler in logger.handlers:
-                try:
-                    handler.flush()
-                except:
-                    pass
-        except:
-            pass
-        
-        # Force system flush
-        sys.stdout.flush()
-        sys.stderr.flush()
+    def log_message(level, message, *args):
+        """
+        Queue a record for the logging thread, which writes and flushes it,
+        so reading RAUC output never waits for console or journal I/O.
+        """
+        if level.upper() == 'EXCEPTION':
+            logger.exception(message, *args)
+        else:
+            logger.log(logging.getLevelName(level.upper()), message, *args)
     
     try:
         log_message('INFO', f"Looking for .raucb bundle in: {path}")
@@ -200,7 +187,7 @@ def install_bundle(path):
                 break
             if line:
                 line = line.strip()
-                log_message('INFO', f"RAUC: {line}")
+                log_message('INFO', "RAUC: %s", line)
                 output_lines.append(line)
         
         return_code = process.wait()
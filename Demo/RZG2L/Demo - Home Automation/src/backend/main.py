@@ -9,6 +9,7 @@ from datetime import datetime
 import uvicorn
 import json
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 THING_NAME = os.getenv("THING_NAME", "home_automation_thing")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
@@ -23,8 +24,15 @@ iot_data = boto3.client("iot-data",
                          )
 timestream = boto3.client("timestream-query", region_name=AWS_REGION)
 
+# orjson renders responses faster when installed; FAST_JSON=off disables it
+try:
+    import orjson  # noqa: F401
+    FAST_JSON = os.getenv("FAST_JSON", "auto").lower() not in ("off", "0", "false")
+except ImportError:
+    FAST_JSON = False
 
-app = FastAPI(title="Home Automation API", version="1.0")
+app = FastAPI(title="Home Automation API", version="1.0",
+              default_response_class=ORJSONResponse if FAST_JSON else JSONResponse)
 
 app.add_middleware(
     CORSMiddleware,